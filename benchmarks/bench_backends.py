@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time tagging files with each xattr backend.
+
+Usage: bench_backends.py [FILES]
+
+FILES (default 2000) files in a temporary directory get tags added, are
+read back, and then get all their tags replaced, with each backend.  The
+memory backend shows the cost of the tag logic alone.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import xatag.backends as backends
+import xatag.operations as op
+from xatag.attributes import read_tag_dict
+from xatag.tag import Tag
+
+ADD = [Tag('genre', 'indie'), Tag('', 'draft'), Tag('artist', 'someone')]
+SET = [Tag('genre', 'pop'), Tag('', 'final')]
+
+
+def run(name, paths):
+    previous = backends.set_backend(backends.BACKENDS[name]())
+    try:
+        times = []
+        for step in [lambda p: op.add_tags(p, ADD),
+                     read_tag_dict,
+                     lambda p: op.set_all_tags(p, SET)]:
+            start = time.time()
+            for path in paths:
+                step(path)
+            times.append(1e6 * (time.time() - start) / len(paths))
+    finally:
+        backends.set_backend(previous)
+    print("%-8s add %7.1f us   read %7.1f us   set %7.1f us  (per file)"
+          % ((name,) + tuple(times)))
+
+
+def main(nfiles):
+    tmpdir = tempfile.mkdtemp(prefix='xatag-bench-')
+    try:
+        paths = []
+        for i in range(nfiles):
+            path = os.path.join(tmpdir, 'file%d' % i)
+            open(path, 'w').close()
+            paths.append(path)
+        for name in ['xattr', 'memory']:
+            run(name, paths)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
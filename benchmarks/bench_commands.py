@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time the xatag commands on a generated tree, and compare to a baseline.
+
+Usage: bench_commands.py [TREE OPTIONS] [--runs=R] [--calls=N]
+                         [--baseline=FILE] [--save-baseline]
+                         [--tolerance=PERCENT]
+
+A tree is made with tagged_tree.py (which see for the TREE OPTIONS) on
+tmpfs if possible, and add, set, delete, list and copy are each run over
+all of its files, as cmd_add() and so on, with the options parsed as for
+the command line.  check_new_tags() and update_recoll_fields() are called
+N times (default 50) with the tags of the tree.  All of that is done R
+times (default 3), with a new tree each time.  For each, the best
+throughput (files or calls per second) and the median and 99th percentile
+time per file or call are printed.
+
+The results are compared to the baseline in FILE (default baseline.json
+next to this script), if it was made with the same tree options.  With
+--save-baseline, the results are then saved as the new baseline.  Timings
+only compare on the machine that made them, so the baseline isn't kept in
+git; make one with --save-baseline before changing anything.  If the
+throughput of anything is more than PERCENT (default 25) below the
+baseline, exit with status 1.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tagged_tree
+
+import xatag.cli as cli
+import xatag.config as config
+import xatag.constants as constants
+import xatag.operations as op
+from xatag.tag import Tag
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+# The commands that are run over the whole tree, in this order.  Each is
+# parsed with one file, and then given all of the files of the tree.
+COMMANDS = [
+    ('add', ['-a', '-w', 'bench:added', 'tag:also']),
+    ('set', ['-s', '-w', 'bench:set', 'key0:value1']),
+    ('delete', ['-d', '-w', 'bench:', 'tag:also']),
+    ('list', ['-l']),
+    ('copy', ['-c']),
+    ]
+
+
+class Timer(object):
+    """Collect how long each call of a function takes."""
+    def __init__(self, fun):
+        self.fun = fun
+        self.times = []
+
+    def __call__(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return self.fun(*args, **kwargs)
+        finally:
+            self.times.append(time.time() - start)
+
+
+def percentile(times, p):
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+class Result(object):
+    """The times of the runs of one command."""
+    def __init__(self):
+        self.throughput = 0
+        self.times = []
+
+    def add(self, count, total, times):
+        self.throughput = max(self.throughput, count / total)
+        self.times.extend(times)
+
+    def as_dict(self):
+        return {'throughput': round(self.throughput, 1),
+                'p50_ms': round(1000 * percentile(self.times, 50), 4),
+                'p99_ms': round(1000 * percentile(self.times, 99), 4)}
+
+
+def run_command(result, argv, files, config_dir):
+    """Run the command line argv over files, timing apply_to_file()."""
+    argv = ['--no-index', '--config-dir=' + config_dir] + argv
+    if argv[-1] == '-c':
+        argv += [files[0], files[1]]
+    elif argv[-1] == '-l':
+        argv += [files[0]]
+    else:
+        argv += ['-f', files[0]]
+    command, options = cli.parse_cli(constants.XATAG_USAGE, argv)
+    if options['source']:
+        options['destinations'] = files[1:]
+    else:
+        options['files'] = files
+    options['longest_filename'] = max(len(f) for f in files)
+    timer = Timer(cli.apply_to_file)
+    cli.apply_to_file = timer
+    try:
+        start = time.time()
+        command(options)
+        total = time.time() - start
+    finally:
+        cli.apply_to_file = timer.fun
+    result.add(len(timer.times), total, timer.times)
+
+
+def run_calls(result, fun, calls):
+    """Call fun() calls times."""
+    timer = Timer(fun)
+    start = time.time()
+    for _ in range(calls):
+        timer()
+    result.add(calls, time.time() - start, timer.times)
+
+
+def run_all(spec, runs, calls):
+    """Return a list of (name, Result)."""
+    tmpdir = tagged_tree.scratch_dir()
+    saved_stdout = sys.stdout
+    try:
+        config_dir = os.path.join(tmpdir, 'config')
+        os.environ[constants.CONFIG_DIR_VAR] = config_dir
+        sys.stdout = open(os.devnull, 'w')
+        config.create_config_dir(config_dir)
+        values = tagged_tree.tag_values(spec)
+        # Half of the tags are known, so that some are reported as new.
+        known = dict((k, v[::2]) for k, v in values.items())
+        config.add_known_tags(known, config_dir=config_dir)
+        tags = [Tag(k, v) for k, vlist in values.items() for v in vlist]
+        names = [name for name, argv in COMMANDS] + ['check_new_tags',
+                                                     'update_recoll_fields']
+        results = dict((name, Result()) for name in names)
+        for run in range(runs):
+            files = tagged_tree.make_tree(
+                os.path.join(tmpdir, 'tree%d' % run), spec)
+            for name, argv in COMMANDS:
+                run_command(results[name], argv, files, config_dir)
+            run_calls(results['check_new_tags'],
+                      lambda: op.check_new_tags(tags, quiet=True,
+                                                config_dir=config_dir),
+                      calls)
+            run_calls(results['update_recoll_fields'],
+                      lambda: config.update_recoll_fields(
+                          values.keys(), [], config_dir=config_dir),
+                      calls)
+        return [(name, results[name]) for name in names]
+    finally:
+        sys.stdout.close()
+        sys.stdout = saved_stdout
+        shutil.rmtree(tmpdir)
+
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline; return the regressions."""
+    base_results = baseline.get('results', {}) if baseline else {}
+    regressions = []
+    print("%-22s %12s %10s %10s %9s" % ('', 'per second', 'p50 ms',
+                                         'p99 ms', 'baseline'))
+    for name, r in results:
+        r = r.as_dict()
+        line = "%-22s %12.1f %10.3f %10.3f" % (name, r['throughput'],
+                                               r['p50_ms'], r['p99_ms'])
+        base = base_results.get(name)
+        if base:
+            change = r['throughput'] / base['throughput'] - 1
+            line += " %+8.1f%%" % (100 * change)
+            if change < -tolerance / 100.0:
+                line += "  SLOWER"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(args):
+    spec, rest = tagged_tree.parse_spec(args)
+    runs = 3
+    calls = 50
+    baseline_file = DEFAULT_BASELINE
+    save = False
+    tolerance = 25.0
+    for arg in rest:
+        name, _, value = arg.partition('=')
+        if name == '--runs':
+            runs = int(value)
+        elif name == '--calls':
+            calls = int(value)
+        elif name == '--baseline':
+            baseline_file = value
+        elif arg == '--save-baseline':
+            save = True
+        elif name == '--tolerance':
+            tolerance = float(value)
+        else:
+            sys.exit(__doc__)
+
+    baseline = None
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get('tree') != spec.as_dict():
+            print("not comparing to %s: it was made with another tree: %s" %
+                  (baseline_file, baseline.get('tree')))
+            baseline = None
+
+    results = run_all(spec, runs, calls)
+    regressions = compare(results, baseline, tolerance)
+    if save:
+        saved = {'tree': spec.as_dict(),
+                 'results': dict((name, r.as_dict()) for name, r in results)}
+        with open(baseline_file, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure how long bin/xatag takes to start up and run a small command.
+
+Usage: bench_startup.py [--runs=N] [--budget=MS]
+
+Each command is run N times (default 20) on a single tagged file, and the
+fastest run is reported, along with the time beyond what the bare
+interpreter takes ('python -c pass').  If the overhead of the hot commands
+(--recoll-tags and -l) is over MS milliseconds (default 40), exit with
+status 1.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import xattr
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+XATAG = os.path.join(ROOT, 'bin', 'xatag')
+HOT_COMMANDS = ['--recoll-tags', '-l']
+
+
+def best_time(argv, runs, env):
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(argv, stdout=devnull, stderr=devnull, env=env)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return 1000 * best
+
+
+def main(runs, budget):
+    tmpdir = tempfile.mkdtemp()
+    fname = os.path.join(tmpdir, 'tagged')
+    open(fname, 'w').close()
+    x = xattr.xattr(fname)
+    x['user.org.xatag.tags.tag'] = 'one;two;three'
+    x['user.org.xatag.tags.genre'] = 'indie;pop'
+
+    env = dict(os.environ, PYTHONPATH=ROOT, XATAG_DIR=tmpdir)
+    base = best_time([sys.executable, '-c', 'pass'], runs, env)
+    print("%-28s %9.1f ms" % ('python -c pass', base))
+    over_budget = False
+    for args in [['--recoll-tags', fname], ['-l', fname],
+                 ['-k', '-l', fname], ['-a', '--no-index', 'x', fname]]:
+        ms = best_time([sys.executable, XATAG] + args, runs, env)
+        hot = args[0] in HOT_COMMANDS and len(args) == 2
+        mark = ''
+        if hot and ms - base > budget:
+            over_budget = True
+            mark = '  OVER BUDGET'
+        print("%-28s %9.1f ms  (+%.1f ms)%s" %
+              ('xatag ' + ' '.join(args[:-1]), ms, ms - base, mark))
+    os.remove(fname)
+    os.rmdir(tmpdir)
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    runs = 20
+    budget = 40.0
+    for arg in sys.argv[1:]:
+        if arg.startswith('--runs='):
+            runs = int(arg.split('=', 1)[1])
+        elif arg.startswith('--budget='):
+            budget = float(arg.split('=', 1)[1])
+        else:
+            sys.exit(__doc__)
+    sys.exit(main(runs, budget))
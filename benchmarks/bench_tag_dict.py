@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of the tag dict algebra for keys with many values.
+
+Usage: bench_tag_dict.py [N...]
+
+The list based implementations that xatag used to have are kept here, so
+the two can be compared on the same input.  N is the number of values in
+each key (default: 100 1000 5000).
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import xatag.tag_dict as xtd
+import xatag.attributes as attr
+
+
+def old_merge_tags(tags1, tags2):
+    combined = {}
+    for k in tags1.keys():
+        if k in tags2.keys():
+            combined[k] = tags2[k] + [v for v in tags1[k]
+                                      if v not in set(tags2[k])]
+        else:
+            combined[k] = tags1[k]
+    for key in [k for k in tags2.keys() if k not in tags1.keys()]:
+        combined[key] = tags2[key]
+    return combined
+
+
+def old_subtract_tags(minuend, subtrahend):
+    difference = {}
+    for k, vlist in minuend.items():
+        if k in subtrahend.keys():
+            new_vlist = [v for v in vlist if v not in subtrahend[k]]
+            if len(new_vlist) > 0:
+                difference[k] = new_vlist
+        else:
+            difference[k] = vlist
+    return difference
+
+
+def old_select_tags(original, selection):
+    subset = {}
+    for k, vlist in selection.items():
+        if k in original:
+            new_vlist = [v for v in vlist if v in original[k]]
+            if len(new_vlist) > 0:
+                subset[k] = new_vlist
+    return subset
+
+
+def old_add_tag_values(xattr_value, values_to_add):
+    current_values = attr.xattr_value_to_list(xattr_value)
+    values = current_values + [value for value in values_to_add
+                               if value not in set(current_values)]
+    return attr.list_to_xattr_value(values)
+
+
+def best_time(fun, *args):
+    """Return the best time of a few runs of fun(*args), in milliseconds."""
+    timer = timeit.Timer(lambda: fun(*args))
+    runs = max(1, int(0.2 / max(timer.timeit(1), 1e-6)))
+    return 1000 * min(timer.repeat(3, runs)) / runs
+
+
+def main(sizes):
+    print("%-22s %8s %12s %12s %9s" %
+          ('operation', 'values', 'old (ms)', 'new (ms)', 'speedup'))
+    for n in sizes:
+        tags1 = {'key': ['value %d' % i for i in range(n)]}
+        tags2 = {'key': ['value %d' % i for i in range(n // 2, n + n // 2)]}
+        xattr_value = attr.list_to_xattr_value(tags1['key'])
+        cases = [
+            ('merge_tags', old_merge_tags, xtd.merge_tags, tags1, tags2),
+            ('subtract_tags', old_subtract_tags, xtd.subtract_tags,
+             tags1, tags2),
+            ('select_tags', old_select_tags, xtd.select_tags, tags1, tags2),
+            ('add_tag_values', old_add_tag_values,
+             attr.add_tag_values_to_xattr_value, xattr_value, tags2['key']),
+            ]
+        for name, old, new, arg1, arg2 in cases:
+            assert sorted(old(arg1, arg2)) == sorted(new(arg1, arg2))
+            old_ms = best_time(old, arg1, arg2)
+            new_ms = best_time(new, arg1, arg2)
+            print("%-22s %8d %12.3f %12.3f %8.1fx" %
+                  (name, n, old_ms, new_ms, old_ms / new_ms))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time browsing the tag filesystem over a large synthetic index.
+
+Usage: bench_tagfs.py [FILES]
+
+FILES (default 500000) files get a random genre, one to three tags, and
+sometimes an artist.  Then the directories along a typical path are listed,
+first with an empty cache and then again with the listings cached.
+"""
+
+import random
+import sys
+import time
+
+from xatag.tagfs import InvertedIndex, TagTree
+
+PATH = '/genre/indie/+/pop/!/tag/draft/$'
+
+
+class SyntheticSource(object):
+    def __init__(self, nfiles):
+        self.nfiles = nfiles
+
+    def signature(self):
+        return self.nfiles
+
+    def load(self):
+        rand = random.Random(0)
+        genres = ['indie', 'pop', 'rock', 'jazz', 'classical', 'folk']
+        tags = ['draft', 'final', 'todo', 'keep'] + ['t%d' % i
+                                                     for i in range(200)]
+        index = InvertedIndex()
+        for i in xrange(self.nfiles):
+            path = '/data/%03d/file%d' % (i % 1000, i)
+            index.add(path, 'genre', rand.choice(genres))
+            for tag in rand.sample(tags, rand.randint(1, 3)):
+                index.add(path, 'tag', tag)
+            if rand.random() < 0.1:
+                index.add(path, 'artist', 'artist%d' % rand.randint(1, 5000))
+        return index
+
+
+def browse(tree):
+    """List each directory along PATH, as a file manager would."""
+    parts = PATH.strip('/').split('/')
+    for i in range(len(parts) + 1):
+        tree.list_dir(tree.resolve('/' + '/'.join(parts[:i])))
+
+
+def main(nfiles):
+    tree = TagTree(SyntheticSource(nfiles))
+    start = time.time()
+    tree.refresh()
+    print("load %d files: %8.1f ms" % (nfiles, 1000 * (time.time() - start)))
+    start = time.time()
+    browse(tree)
+    print("browse, cold:   %8.1f ms" % (1000 * (time.time() - start)))
+    start = time.time()
+    browse(tree)
+    print("browse, cached: %8.3f ms" % (1000 * (time.time() - start)))
+    print("%d files in %s" % (len(tree.list_dir(tree.resolve(PATH))), PATH))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the time and memory of a scan that makes many Tags.
+
+Usage: bench_tags.py [TAGS]
+
+Files with TAGS tags in all (default 1000000), ten to a file, are made with
+the memory backend, and all of their Tags are read and kept, as in a bulk
+export, and then grouped with tag_list_to_dict().  That's done with the
+Tag class that xatag used to have (kept here) and with the current one,
+each in a process of its own, and the time, the growth of the peak
+resident memory, and the bytes of each Tag object (with its __dict__, if
+it has one) are printed for each.
+"""
+
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tagged_tree
+
+from xatag.attributes import (read_xatag_xattrs, read_tags,
+                              xatag_to_xattr_key, xattr_to_xatag_key,
+                              list_to_xattr_value)
+from xatag.backends import MemoryBackend, set_backend
+import xatag.constants as constants
+import xatag.tag_dict as xtd
+
+TAGS_PER_FILE = 10
+
+
+class OldTag:
+    """The Tag class as it was, with a __dict__."""
+    def __init__(self, key, value=''):
+        if key == '':
+            key = constants.DEFAULT_TAG_KEY
+        self.key = " ".join(key.strip().split())
+        self.value = " ".join(value.strip().split())
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.__dict__ == other.__dict__
+        return False
+
+    def __hash__(self):
+        return hash((self.key, self.value))
+
+
+def old_xattr_value_to_list(tag_string):
+    return [" ".join(x.strip().split())
+            for x in tag_string.split(constants.XATTR_FIELD_SEPARATOR)
+            if " ".join(x.strip().split()) != '']
+
+
+def old_read_tags(fname):
+    return [OldTag(xattr_to_xatag_key(k), val)
+            for k, v in read_xatag_xattrs(fname).items()
+            for val in old_xattr_value_to_list(v)]
+
+
+def make_files(count):
+    """Tag count files in a memory backend, and return their names."""
+    backend = MemoryBackend()
+    set_backend(backend)
+    spec = tagged_tree.TreeSpec(values=1000)
+    values = tagged_tree.tag_values(spec)
+    keys = sorted(values)
+    names = []
+    for i in range(count):
+        name = '/tree/file%07d' % i
+        fields = {}
+        for j in range(TAGS_PER_FILE):
+            key = keys[(i + j) % len(keys)]
+            value = values[key][(i * 7 + j * 13) % len(values[key])]
+            fields.setdefault(xatag_to_xattr_key(key), []).append(value)
+        backend.update(name, dict((k, list_to_xattr_value(v))
+                                  for k, v in fields.items()))
+        names.append(name)
+    return names
+
+
+def measure(impl, tag_count):
+    names = make_files(tag_count // TAGS_PER_FILE)
+    read = old_read_tags if impl == 'old' else read_tags
+    gc.collect()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    tags = []
+    for name in names:
+        tags.extend(read(name))
+    scan = time.time() - start
+    start = time.time()
+    xtd.tag_list_to_dict(tags)
+    group = time.time() - start
+    size = sys.getsizeof(tags[0])
+    if hasattr(tags[0], '__dict__'):
+        size += sys.getsizeof(tags[0].__dict__)
+    print("%-6s %10d %10.2f %10.2f %10d %10d" % (
+        impl, len(tags), scan, group,
+        (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) // 1024,
+        size))
+    sys.stdout.flush()
+
+
+def main(args):
+    if args and args[0] in ('old', 'new'):
+        measure(args[0], int(args[1]))
+        return
+    tag_count = int(args[0]) if args else 1000000
+    print("%-6s %10s %10s %10s %10s %10s" % ('Tag', 'tags', 'scan s',
+                                              'group s', 'peak MB',
+                                              'bytes/Tag'))
+    sys.stdout.flush()
+    for impl in ['old', 'new']:
+        subprocess.check_call([sys.executable, __file__, impl,
+                               str(tag_count)])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
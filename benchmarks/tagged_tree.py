@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Build a reproducible tree of tagged files for benchmarks.
+
+Usage: tagged_tree.py [--files=N] [--keys=K] [--values=V]
+                      [--distribution=zipf|uniform] [--long=FRACTION]
+                      [--unicode=FRACTION] [--seed=S] DIR
+
+N files (default 1000) are made in subdirectories of DIR, 100 to a
+directory.  Each file gets one to four of K tag keys (default 8), plus
+simple tags, with one to three of V values (default 50) for each.  Values
+are picked uniformly or by a Zipf-like distribution, where a few values are
+very common, as with real tags.  FRACTION of the values are long (120 to
+250 characters; default 0.05) or have non-ASCII characters (default 0.1).
+The same arguments always make the same tree.
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import xattr
+
+from xatag.attributes import xatag_to_xattr_key, list_to_xattr_value
+import xatag.constants as constants
+
+FILES_PER_DIR = 100
+UNICODE_WORDS = [u'caf\xe9', u'na\xefve', u'stra\xdfe', u'\u65e5\u672c',
+                 u'\u043c\u0438\u0440', u'\u03b1\u03b2\u03b3']
+
+
+class TreeSpec(object):
+    """The parameters of a generated tree."""
+    def __init__(self, files=1000, keys=8, values=50, distribution='zipf',
+                 long_values=0.05, unicode_values=0.1, seed=0):
+        if distribution not in ('zipf', 'uniform'):
+            raise ValueError("unknown distribution: " + distribution)
+        self.files = files
+        self.keys = keys
+        self.values = values
+        self.distribution = distribution
+        self.long_values = long_values
+        self.unicode_values = unicode_values
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def make_value(i, spec):
+    """Return the i'th value, as it is stored (UTF-8)."""
+    # Each value is decided by its number alone, so that the same value is
+    # the same string in every file.
+    vrand = random.Random((spec.seed, i))
+    value = u'value%d' % i
+    if vrand.random() < spec.unicode_values:
+        value += u' ' + vrand.choice(UNICODE_WORDS)
+    if vrand.random() < spec.long_values:
+        value += u' ' + u'x' * vrand.randint(120, 250)
+    return value.encode('utf-8')
+
+
+def pick_index(rand, n, distribution):
+    if distribution == 'uniform':
+        return rand.randrange(n)
+    # Zipf-like: value i is picked with probability proportional to 1/(i+1).
+    while True:
+        i = int(rand.paretovariate(1.0)) - 1
+        if i < n:
+            return i
+
+
+def tag_values(spec):
+    """Return the value strings, by key, that files can be given."""
+    keys = [constants.DEFAULT_TAG_KEY] + ['key%d' % k
+                                          for k in range(spec.keys)]
+    return dict((key, [make_value(i, spec)
+                       for i in range(spec.values)])
+                for key in keys)
+
+
+def file_tags(rand, values, spec):
+    """Return a random tag dict for one file."""
+    keys = sorted(values)
+    chosen = [constants.DEFAULT_TAG_KEY]
+    chosen += rand.sample(keys[1:], min(len(keys) - 1, rand.randint(1, 4)))
+    tag_dict = {}
+    for key in chosen:
+        picked = set(values[key][pick_index(rand, spec.values,
+                                            spec.distribution)]
+                     for _ in range(rand.randint(1, 3)))
+        tag_dict[key] = sorted(picked)
+    return tag_dict
+
+
+def make_tree(root, spec):
+    """Make the files of spec beneath root, and return their paths."""
+    rand = random.Random(spec.seed)
+    values = tag_values(spec)
+    paths = []
+    for i in range(spec.files):
+        dirname = os.path.join(root, 'd%04d' % (i // FILES_PER_DIR))
+        if i % FILES_PER_DIR == 0 and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        path = os.path.join(dirname, 'file%06d' % i)
+        open(path, 'w').close()
+        x = xattr.xattr(path)
+        for key, vlist in file_tags(rand, values, spec).items():
+            x[xatag_to_xattr_key(key)] = list_to_xattr_value(vlist)
+        paths.append(path)
+    return paths
+
+
+def scratch_dir(prefix='xatag-bench-'):
+    """Make a temporary directory, on tmpfs if it supports user xattrs."""
+    shm = '/dev/shm'
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        tmpdir = tempfile.mkdtemp(prefix=prefix, dir=shm)
+        try:
+            xattr.xattr(tmpdir)['user.xatag-bench'] = '1'
+            return tmpdir
+        except IOError:
+            os.rmdir(tmpdir)
+    return tempfile.mkdtemp(prefix=prefix)
+
+
+def parse_spec(args):
+    """Return a TreeSpec and the other arguments, from --name=value args."""
+    names = {'--files': ('files', int),
+             '--keys': ('keys', int),
+             '--values': ('values', int),
+             '--distribution': ('distribution', str),
+             '--long': ('long_values', float),
+             '--unicode': ('unicode_values', float),
+             '--seed': ('seed', int)}
+    kwargs = {}
+    rest = []
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name in names:
+            key, convert = names[name]
+            kwargs[key] = convert(value)
+        else:
+            rest.append(arg)
+    return TreeSpec(**kwargs), rest
+
+
+if __name__ == '__main__':
+    spec, rest = parse_spec(sys.argv[1:])
+    if len(rest) != 1 or rest[0].startswith('-'):
+        sys.exit(__doc__)
+    paths = make_tree(rest[0], spec)
+    print("%d files made in %s" % (len(paths), rest[0]))
@@ -9,7 +9,8 @@ setup(name='xatag',
       author_email='don@ohspite.net',
       url='http://xatag.org',
       packages=['xatag'],
-      scripts=['bin/xatag'],
+      scripts=['bin/xatag', 'bin/xatagd', 'bin/xatagfs'],
       install_requires=['docopt', 'xattr'],
+      extras_require={'fuse': ['fusepy', 'PyYAML']},
       tests_require=['pytest']
       )
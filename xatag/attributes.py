@@ -14,33 +14,289 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import xattr
+# Most file systems limit the size of an xattr value, and ext4 limits the
+# size of all of the xattrs of a file together to about one block.  So a tag
+# field that is longer than half a block of the file's file system is
+# stored differently: its value is compressed, if that makes it smaller, and
+# split into chunks of half a block.  The first chunk stays in the field's
+# own xattr, after a header, and the rest go in numbered chunk xattrs:
+#
+#     user.org.xatag.tags.genre      \0z:3\0<first chunk>
+#     user.org.xatag.chunks.1.genre  <second chunk>
+#     user.org.xatag.chunks.2.genre  <third chunk>
+#
+# The header is a NUL, 'z' if the value is compressed with zlib, ':', the
+# number of chunks, and another NUL.  Tag values never start with a NUL.
+# The fields are put back together when they are read, so nothing else
+# needs to know about this.
+
+import os
+import zlib
+
+from xatag.backends import get_backend, is_fd
 from xatag.helpers import listify
 import xatag.tag as tag
+from xatag.tag_dict import TagSet
 from xatag.constants import XATTR_PREFIX, XATTR_FIELD_SEPARATOR
+import xatag.constants as constants
+
+# No file system has a smaller chunk size than this, so shorter values are
+# written as they are without checking the file system.
+MIN_CHUNK_SIZE = 512
+
+
+def read_xatag_xattrs(fname, follow_symlinks=True, backend=None):
+    """Return the xatag xattrs of fname, as a dict of xattr key to value.
+
+    fname may also be a file descriptor from backend.open().
+    """
+    return _read_fields(fname, follow_symlinks, backend)[0]
+
+
+def _read_fields(f, follow_symlinks=True, backend=None):
+    """Return the xatag fields of f, and the number of chunks of each."""
+    backend = backend or get_backend()
+    # no sense in reading the value if the key isn't going to be chosen
+    fields = backend.get_many(f, [k for k in backend.list(f, follow_symlinks)
+                                  if is_xatag_xattr_key(k)],
+                              follow_symlinks)
+    fields = dict((utf8(k), v) for k, v in fields.items())
+    chunks = {}
+    for key, value in fields.items():
+        if value.startswith('\0'):
+            fields[key], chunks[key] = _join_chunks(f, key, value,
+                                                    follow_symlinks, backend)
+    return fields, chunks
+
+
+def _join_chunks(f, xattr_key, head, follow_symlinks, backend):
+    """Return the value of a field stored in chunks, and their number."""
+    end = head.find('\0', 1)
+    flags, _, count = head[1:end].partition(':')
+    if end < 0 or not count.isdigit():
+        raise KeyError(xattr_key)
+    names = [chunk_xattr_key(xattr_key, i) for i in range(1, int(count))]
+    rest = backend.get_many(f, names, follow_symlinks)
+    data = head[end + 1:] + ''.join(rest[name] for name in names)
+    if 'z' in flags:
+        try:
+            data = zlib.decompress(data)
+        except zlib.error:
+            raise KeyError(xattr_key)
+    return data, int(count)
 
 
-def read_tag_keys(fname):
+def chunk_xattr_key(xattr_key, i):
+    """Return the name of the i'th chunk xattr of the field xattr_key."""
+    start = xattr_key.index(XATTR_PREFIX)
+    return (xattr_key[:start] + constants.XATTR_CHUNK_PREFIX + '.%d' % i +
+            xattr_key[start + len(XATTR_PREFIX):])
+
+
+def chunk_size(f):
+    """Return the size of the chunks of long fields on f's file system."""
+    try:
+        if is_fd(f):
+            block_size = os.fstatvfs(f).f_bsize
+        else:
+            block_size = os.statvfs(f).f_bsize
+    except OSError:
+        block_size = constants.DEFAULT_XATTR_BLOCK_SIZE
+    return max(MIN_CHUNK_SIZE,
+               min(block_size, constants.XATTR_SIZE_MAX) // 2)
+
+
+def split_chunks(xattr_key, value, size):
+    """Return the (xattr key, value) pairs to store a field in.
+
+    If value is no longer than size, it is stored as it is.
+    """
+    if len(value) <= size:
+        return [(xattr_key, value)]
+    flags = ''
+    compressed = zlib.compress(value)
+    if len(compressed) < len(value):
+        value = compressed
+        flags = 'z'
+    chunks = [value[i:i + size] for i in range(0, len(value), size)]
+    header = '\0%s:%d\0' % (flags, len(chunks))
+    return ([(xattr_key, header + chunks[0])] +
+            [(chunk_xattr_key(xattr_key, i), chunk)
+             for i, chunk in enumerate(chunks[1:], 1)])
+
+
+def _read_opened(fname, follow_symlinks):
+    backend = get_backend()
+    with backend.opened(fname, follow_symlinks) as f:
+        return read_xatag_xattrs(f, follow_symlinks, backend)
+
+
+def xattr_usage(fname, follow_symlinks=True):
+    """Return a dict describing how much xattr space fname uses.
+
+    'bytes' is the total length of the names and values of all of its
+    xattrs, xatag's or not, and 'largest' the longest value.  'limit' is
+    the block size of its file system, which is about the limit on ext4 for
+    all of the xattrs of a file (other file systems limit each value to
+    about that, or to 64 KiB).  'keys' is the number of tag fields, and
+    'chunked' the number of those that are stored in chunks.
+    """
+    backend = get_backend()
+    usage = {'bytes': 0, 'largest': 0, 'xattrs': 0, 'keys': 0, 'chunked': 0}
+    with backend.opened(fname, follow_symlinks) as f:
+        for name in backend.list(f, follow_symlinks):
+            try:
+                value = backend.get(f, name, follow_symlinks)
+            except (KeyError, IOError, OSError):
+                # Some xattrs can't be read without privileges.
+                continue
+            usage['bytes'] += len(name) + len(value)
+            usage['largest'] = max(usage['largest'], len(value))
+            usage['xattrs'] += 1
+            if is_xatag_xattr_key(name):
+                usage['keys'] += 1
+                if value.startswith('\0'):
+                    usage['chunked'] += 1
+        usage['limit'] = 2 * chunk_size(f)
+    return usage
+
+
+def read_tag_keys(fname, follow_symlinks=True):
     """Return a list of the xatag keys of the xattr fields in fname."""
-    attributes = xattr.xattr(fname)
-    return [xattr_to_xatag_key(k) for k in attributes if is_xatag_xattr_key(k)]
+    return [xattr_to_xatag_key(k)
+            for k in get_backend().list(fname, follow_symlinks)
+            if is_xatag_xattr_key(k)]
 
 
-def read_tag_dict(fname):
+def read_tag_dict(fname, follow_symlinks=True):
     """Return a dict of the xattr fields in fname in the xatag namespace."""
-    attributes = xattr.xattr(fname)
-    # no sense in reading the value if the key isn't going to be chosen
-    return {xattr_to_xatag_key(k): xattr_value_to_list(attributes[k])
-            for k in attributes if is_xatag_xattr_key(k)}
+    return {xattr_to_xatag_key(k): xattr_value_to_list(v)
+            for k, v in _read_opened(fname, follow_symlinks).items()}
 
 
-def read_tags(fname):
+def read_tags(fname, follow_symlinks=True):
     """Return a list of Tags of the xatag xattr fields in fname."""
-    attributes = xattr.xattr(fname)
-    # no sense in reading the value if the key isn't going to be chosen
     return [tag.Tag(xattr_to_xatag_key(k), val)
-            for k in attributes if is_xatag_xattr_key(k)
-            for val in xattr_value_to_list(attributes[k])]
+            for k, v in _read_opened(fname, follow_symlinks).items()
+            for val in xattr_value_to_list(v)]
+
+
+class FileTagSession(object):
+    """Read the xatag fields of a file once, and write back only the changes.
+
+    The file is opened once, and the xattr keys of fname are listed and every
+    xatag field is read when the session is created.  After that the session
+    acts like a dict of the xatag fields, keyed by xattr key, and all changes
+    are made in memory.  commit() writes the fields whose values changed and
+    removes the fields that were deleted; it is called automatically when the
+    session is used as a context manager and no exception was raised, and
+    then the file is closed.  After that, modified is True if commit()
+    changed anything in the file.
+
+    If follow_symlinks is False and fname is a symlink, the fields of the
+    symlink itself are used.
+    """
+    def __init__(self, fname, follow_symlinks=True):
+        self.fname = fname
+        self.follow_symlinks = follow_symlinks
+        self.backend = get_backend()
+        self.f = self.backend.open(fname, follow_symlinks)
+        try:
+            self.original, self.chunks = _read_fields(self.f, follow_symlinks,
+                                                      self.backend)
+        except:
+            self.close()
+            raise
+        self.fields = dict(self.original)
+        self.modified = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the file.  Later commits use its name instead."""
+        self.backend.close(self.f)
+        self.f = self.fname
+
+    def __contains__(self, xattr_key):
+        return xattr_key in self.fields
+
+    def __getitem__(self, xattr_key):
+        return self.fields[xattr_key]
+
+    def __setitem__(self, xattr_key, value):
+        self.fields[xattr_key] = value
+
+    def get(self, xattr_key, default=None):
+        return self.fields.get(xattr_key, default)
+
+    def keys(self):
+        return list(self.fields.keys())
+
+    def remove(self, xattr_key):
+        del self.fields[xattr_key]
+
+    def clear(self):
+        self.fields.clear()
+
+    def changed(self):
+        """Return True if commit() would change the file."""
+        return (any(not same_xattr_value(self.original.get(k), v)
+                    for k, v in self.fields.items()) or
+                any(k not in self.fields for k in self.original))
+
+    def commit(self):
+        """Write the changed fields and remove the deleted ones.
+
+        A field is only written if it has different tag values than before,
+        not just the same values in a different order.  Long fields are
+        stored in chunks, and chunks that are no longer needed are removed.
+        """
+        self.modified = self.changed()
+        if self.modified:
+            changed = dict((k, v) for k, v in self.fields.items()
+                           if not same_xattr_value(self.original.get(k), v))
+            size = None
+            if any(len(v) > MIN_CHUNK_SIZE for v in changed.values()):
+                size = chunk_size(self.f)
+            values = {}
+            removed = []
+            chunks = {}
+            for key, value in changed.items():
+                if size is None:
+                    values[key] = value
+                    count = 1
+                else:
+                    pairs = split_chunks(key, value, size)
+                    values.update(pairs)
+                    count = len(pairs)
+                if count > 1:
+                    chunks[key] = count
+                removed += [chunk_xattr_key(key, i)
+                            for i in range(count, self.chunks.get(key, 1))]
+            for key in self.original:
+                if key not in self.fields:
+                    removed.append(key)
+                    removed += [chunk_xattr_key(key, i)
+                                for i in range(1, self.chunks.get(key, 1))]
+            self.backend.update(self.f, values, removed, self.follow_symlinks)
+            for key in self.chunks:
+                if key in self.fields and key not in changed:
+                    chunks[key] = self.chunks[key]
+            self.chunks = chunks
+        self.original = dict(self.fields)
+
+    def tag_dict(self):
+        """Return the fields as a tag dict, like read_tag_dict() would."""
+        return dict((xattr_to_xatag_key(k), xattr_value_to_list(v))
+                    for k, v in self.fields.items())
 
 
 def is_xatag_xattr_key(name):
@@ -62,9 +318,21 @@ def xatag_to_xattr_key(tag_or_key):
         return 'user.' + XATTR_PREFIX + '.' + key
 
 
+def utf8(name):
+    """Return name as a UTF-8 str.
+
+    The xattr package lists xattr names as unicode, but the values, and the
+    keys and values of tags everywhere else, are UTF-8 strs.  Mixing the two
+    fails as soon as either has a non-ASCII character.
+    """
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
 def xattr_to_xatag_key(key):
     """Remove XATTR_PREFIX from the given string."""
-    key = tag.format_tag_key(key)
+    key = tag.format_tag_key(utf8(key))
     key = key.replace('user.' + XATTR_PREFIX + '.', '')
     key = key.replace(XATTR_PREFIX + '.', '')
     return key
@@ -72,9 +340,22 @@ def xattr_to_xatag_key(key):
 
 def xattr_value_to_list(tag_string):
     """Split the value of a tag xattr and return a list of tag values."""
-    return [tag.format_tag_value(x)
-            for x in tag_string.split(XATTR_FIELD_SEPARATOR)
-            if tag.format_tag_value(x) != '']
+    values = [tag.format_tag_value(x)
+              for x in tag_string.split(XATTR_FIELD_SEPARATOR)]
+    return [x for x in values if x != '']
+
+
+def same_xattr_value(value1, value2):
+    """Return True if the xattr values hold the same tag values.
+
+    Either value may be None, for a field that doesn't exist.
+    """
+    if value1 == value2:
+        return True
+    if value1 is None or value2 is None:
+        return False
+    return sorted(xattr_value_to_list(value1)) == sorted(
+        xattr_value_to_list(value2))
 
 
 def list_to_xattr_value(tag_list):
@@ -103,8 +384,6 @@ def remove_tag_values_from_xattr_value(xattr_value, tag_values,
 
 def add_tag_values_to_xattr_value(xattr_value, values_to_add):
     """Add the values in values_to_add from the xattr formatted value."""
-    values_to_add = listify(values_to_add)
-    current_values = xattr_value_to_list(xattr_value)
-    values = current_values + [value for value in values_to_add
-                               if value not in set(current_values)]
+    values = TagSet(xattr_value_to_list(xattr_value))
+    values.update(listify(values_to_add))
     return list_to_xattr_value(values)
@@ -0,0 +1,255 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Extended attributes are read and written through a backend, so that the
+# same tag logic can run on different implementations:
+#
+# * 'xattr' uses the xattr package.  It's the default.
+# * 'memory' keeps the attributes in a dict.  It's for tests and benchmarks
+#   of the tag logic without the filesystem.
+#
+# The backend can be chosen with the environment variable XATAG_BACKEND.
+#
+# Every backend raises the same errors as the xattr package: KeyError when
+# an attribute doesn't exist, and IOError (or OSError) when the file can't
+# be read or written.
+#
+# The methods take a path or an open file descriptor.  Each call with a path
+# resolves the path again, which is slow on deep trees or stacked (FUSE, NFS)
+# filesystems, so a file whose attributes are read and then written is
+# opened once with open(), and the descriptor is used for all of the calls.
+# It has to be a read-only descriptor: fgetxattr() and friends don't work
+# with O_PATH ones.  When the file can't be opened (say it isn't readable,
+# or it's a symlink that isn't followed), open() returns the path instead,
+# and the calls fall back to using it.
+#
+# With follow_symlinks=False, the attributes of a symlink itself are used
+# instead of those of the file it points to.
+
+import contextlib
+import errno
+import os
+import threading
+
+import xatag.constants as constants
+from xatag.warn import warn
+
+
+class Backend(object):
+    """Read and write the extended attributes of files."""
+    name = None
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def open(self, path, follow_symlinks=True):
+        """Return what the other methods should be given to work on path.
+
+        By default that's path itself.  Whatever is returned must be passed
+        to close() when it's done with.
+        """
+        return path
+
+    def close(self, f):
+        pass
+
+    @contextlib.contextmanager
+    def opened(self, path, follow_symlinks=True):
+        """Use open() and close() on path as a context manager."""
+        f = self.open(path, follow_symlinks)
+        try:
+            yield f
+        finally:
+            self.close(f)
+
+    def list(self, f, follow_symlinks=True):
+        """Return the names of the attributes of f."""
+        raise NotImplementedError
+
+    def get(self, f, name, follow_symlinks=True):
+        """Return the value of the attribute name of f."""
+        raise NotImplementedError
+
+    def set(self, f, name, value, follow_symlinks=True):
+        raise NotImplementedError
+
+    def remove(self, f, name, follow_symlinks=True):
+        raise NotImplementedError
+
+    def get_many(self, f, names, follow_symlinks=True):
+        """Return a dict of the values of the attributes names of f."""
+        return dict((name, self.get(f, name, follow_symlinks))
+                    for name in names)
+
+    def update(self, f, values, removed=(), follow_symlinks=True):
+        """Set the attributes in the dict values; remove those in removed."""
+        for name, value in values.items():
+            self.set(f, name, value, follow_symlinks)
+        for name in removed:
+            self.remove(f, name, follow_symlinks)
+
+
+def is_fd(f):
+    return isinstance(f, (int, long))
+
+
+class FdBackend(Backend):
+    """A backend that can use file descriptors."""
+    def open(self, path, follow_symlinks=True):
+        # O_NONBLOCK, so that opening a FIFO doesn't wait for a writer.
+        flags = os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY
+        if not follow_symlinks:
+            flags |= os.O_NOFOLLOW
+        try:
+            return os.open(path, flags)
+        except OSError:
+            return path
+
+    def close(self, f):
+        if is_fd(f):
+            os.close(f)
+
+
+class XattrBackend(FdBackend):
+    """The xattr package."""
+    name = 'xattr'
+
+    def __init__(self):
+        import xattr
+        self.xattr = xattr.xattr
+        self.nofollow = xattr.XATTR_NOFOLLOW
+
+    @classmethod
+    def available(cls):
+        try:
+            import xattr
+        except ImportError:
+            return False
+        return True
+
+    def attributes(self, f, follow_symlinks=True):
+        if follow_symlinks:
+            return self.xattr(f)
+        return self.xattr(f, options=self.nofollow)
+
+    def list(self, f, follow_symlinks=True):
+        return self.attributes(f, follow_symlinks).list()
+
+    def get(self, f, name, follow_symlinks=True):
+        return self.attributes(f, follow_symlinks)[name]
+
+    def set(self, f, name, value, follow_symlinks=True):
+        self.attributes(f, follow_symlinks)[name] = value
+
+    def remove(self, f, name, follow_symlinks=True):
+        self.update(f, {}, [name], follow_symlinks)
+
+    def get_many(self, f, names, follow_symlinks=True):
+        attributes = self.attributes(f, follow_symlinks)
+        return dict((name, attributes[name]) for name in names)
+
+    def update(self, f, values, removed=(), follow_symlinks=True):
+        attributes = self.attributes(f, follow_symlinks)
+        for name, value in values.items():
+            attributes[name] = value
+        for name in removed:
+            try:
+                attributes.remove(name)
+            except IOError as e:
+                if e.errno == errno.ENODATA:
+                    raise KeyError(name)
+                raise
+
+
+class MemoryBackend(Backend):
+    """Attributes kept in a dict of dicts, keyed by absolute path.
+
+    Paths don't need to exist, and have no attributes until some are set.
+    Symlinks aren't treated specially.
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def list(self, path, follow_symlinks=True):
+        with self.lock:
+            return list(self.files.get(os.path.abspath(path), ()))
+
+    def get(self, path, name, follow_symlinks=True):
+        with self.lock:
+            return self.files.get(os.path.abspath(path), {})[name]
+
+    def set(self, path, name, value, follow_symlinks=True):
+        with self.lock:
+            self.files.setdefault(os.path.abspath(path), {})[name] = value
+
+    def remove(self, path, name, follow_symlinks=True):
+        with self.lock:
+            del self.files.get(os.path.abspath(path), {})[name]
+
+    def get_many(self, path, names, follow_symlinks=True):
+        with self.lock:
+            attributes = self.files.get(os.path.abspath(path), {})
+            return dict((name, attributes[name]) for name in names)
+
+    def update(self, path, values, removed=(), follow_symlinks=True):
+        with self.lock:
+            attributes = self.files.setdefault(os.path.abspath(path), {})
+            attributes.update(values)
+            for name in removed:
+                del attributes[name]
+
+
+BACKENDS = dict((cls.name, cls)
+                for cls in [XattrBackend, MemoryBackend])
+
+_backend = None
+
+
+def make_backend(name=None):
+    """Return a new backend called name, or the default one."""
+    if name:
+        cls = BACKENDS.get(name)
+        if cls is not None and cls.available():
+            return cls()
+        warn("xattr backend is not available: " + name)
+    if XattrBackend.available():
+        return XattrBackend()
+    raise ImportError("no way to read extended attributes; "
+                      "install the xattr package")
+
+
+def get_backend():
+    """Return the backend that xatag uses.
+
+    The first time this is called, the backend is chosen by the environment
+    variable XATAG_BACKEND, if it's set.
+    """
+    global _backend
+    if _backend is None:
+        _backend = make_backend(os.environ.get(constants.BACKEND_VAR))
+    return _backend
+
+
+def set_backend(backend):
+    """Make xatag use backend, and return the one it used before."""
+    global _backend
+    previous = _backend
+    _backend = backend
+    return previous
@@ -0,0 +1,84 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The input of 'xatag --batch' is a list of records, each one a tagging
+# command.  A record is a list of fields: the name of the command, its tags,
+# a '--' field, and its files:
+#
+#     add<TAB>genre:indie<TAB>tag:new<TAB>--<TAB>a.mp3<TAB>b.mp3
+#     copy<TAB>--<TAB>a.mp3<TAB>c.mp3
+#
+# Normally each record is a line, with the fields separated by tabs.  With
+# -0, every field ends with a NUL character instead, and a record ends with
+# an empty field (so two NULs in a row), which allows any file name.
+
+COMMANDS = ['add', 'set', 'set-all', 'delete', 'delete-all', 'copy',
+            'copy-over', 'list']
+
+READ_SIZE = 64 * 1024
+
+
+def split_records(stream, null=False):
+    """Yield (number, fields) for each record in stream.
+
+    Records are numbered from 1.  Blank lines are skipped.
+    """
+    if not null:
+        for number, line in enumerate(stream, 1):
+            line = line.rstrip('\n')
+            if line.strip():
+                yield number, line.split('\t')
+        return
+    number = 0
+    fields = []
+    rest = ''
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            break
+        parts = (rest + data).split('\0')
+        rest = parts.pop()
+        for field in parts:
+            if field:
+                fields.append(field)
+            elif fields:
+                number += 1
+                yield number, fields
+                fields = []
+    if rest:
+        fields.append(rest)
+    if fields:
+        yield number + 1, fields
+
+
+def parse_record(fields):
+    """Return the (command, tags, files) in fields, or raise ValueError."""
+    command = fields[0]
+    if command not in COMMANDS:
+        raise ValueError("unknown command: " + command)
+    try:
+        separator = fields.index('--')
+    except ValueError:
+        raise ValueError("no '--' field before the files")
+    tags = fields[1:separator]
+    files = fields[separator + 1:]
+    if not files:
+        raise ValueError("no files")
+    if command.startswith('copy') and len(files) < 2:
+        raise ValueError("no files to copy to")
+    if command in ('add', 'set', 'set-all', 'delete') and not tags:
+        raise ValueError("no tags")
+    return command, tags, files
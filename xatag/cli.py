@@ -14,15 +14,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from docopt import docopt
+import itertools
 import os.path
 import sys
+from contextlib import contextmanager
+from StringIO import StringIO
 
-from xatag.warn import warn
+from xatag.warn import warn, collect_warnings
+from xatag.helpers import ordered_thread_map
+import xatag.walk as walk
 from xatag.tag import Tag
 import xatag.operations as op
-from xatag.attributes import read_tag_dict
+from xatag.attributes import read_tag_dict, xattr_usage
 import xatag.config as config
+import xatag.constants as constants
+import xatag.tag_index as tag_index
+import xatag.recoll_spool as recoll_spool
+import xatag.trace as trace
 
 COMMAND_LIST = [
     "--add",
@@ -40,9 +48,24 @@ COMMAND_LIST = [
     "--used-tags",
     "--new-config",
     "--recoll-tags",
+    "--recoll-execm",
     "--regenerate",
+    "--index-tags",
+    "--flush-index",
+    "--watch",
+    "--export",
+    "--import",
+    "--batch",
+    "--stats",
     ]
 
+# The commands that --format applies to.  A JSON array needs an end, so
+# json can't be used for the ones that print as they go, or several times.
+FORMAT_COMMANDS = ['--add', '--list', '--set', '--set-all', '--delete',
+                   '--copy', '--copy-over', '--used-tags', '--recoll-tags',
+                   '--watch', '--batch']
+NO_JSON_COMMANDS = ['--watch', '--batch']
+
 
 def parse_tags(cli_tags):
     """Return a list of Tags representing the array of tag arguments."""
@@ -60,14 +83,20 @@ def fix_arguments(arguments):
     arguments['tags']  = parse_tags(tags)
     arguments['source']       = arguments['SRC']
     arguments['destinations'] = arguments['DEST']
-    arguments['config_dir'] = arguments['CONFIG_DIR']
+    # Both of these end up as options['config_dir'].
+    arguments['--config-dir'] = (arguments['--config-dir'] or
+                                 arguments['CONFIG_DIR'])
     arguments['fsep'] = arguments['--file-separator']
     arguments['ksep'] = arguments['--key-separator']
     arguments['vsep'] = arguments['--val-separator']
+    arguments['follow_symlinks'] = not arguments['--no-follow-symlinks']
 
     # convert padding args to ints
     arguments['--max-padding'] = arg_to_int(arguments['--max-padding'])
     arguments['--min-padding'] = arg_to_int(arguments['--min-padding'])
+    arguments['--jobs'] = arg_to_int(arguments['--jobs']) or 1
+    arguments['--include'] = walk.split_globs(arguments['--include'])
+    arguments['--exclude'] = walk.split_globs(arguments['--exclude'])
 
 
 # silently ignore non-int arguments?
@@ -97,6 +126,22 @@ def extract_options(arguments):
     if options['quiet']:
         options['no_warn'] = True
 
+    if options.get('format', 'text') not in constants.OUTPUT_FORMATS:
+        sys.exit("unknown --format: " + options['format'])
+
+    # With --name-width, file names are padded without looking at all of
+    # them first, so that output can start right away.  The names from
+    # --files-from can't be looked at first.
+    if options.get('files_from') and options.get('name_width') is None:
+        options['name_width'] = 'auto'
+    width = options.get('name_width')
+    if width == 'auto':
+        options['longest_filename'] = 0
+    elif width is not None:
+        if not width.isdigit():
+            sys.exit("--name-width must be a number or 'auto': " + width)
+        options['longest_filename'] = int(width)
+
     files_to_print = options['files'] + options['destinations']
     if files_to_print and not ('longest_filename' in options):
         options['longest_filename'] = max(len(f) for f in files_to_print)
@@ -105,6 +150,10 @@ def extract_options(arguments):
 
 def parse_cli(usage, argv=None):
     """Parse ARGV using the usage docstring."""
+    # docopt is imported here, and other modules only needed by some commands
+    # are imported in those commands, so that fast_parse_cli() can start up
+    # quickly.
+    from docopt import docopt
     arguments = docopt(usage, argv=argv, version='xatag version 0.1.0-dev')
     fix_arguments(arguments)
     # The command to run is the key in arguments dict with a true value, where
@@ -125,6 +174,7 @@ def parse_cli(usage, argv=None):
         command = ('--list')
     else:
         command = commands[0]
+    check_format(command, arguments['--format'])
     # This works because of convention.  '--some-name' is sent to
     # 'cmd_some_name', which is called with the arguments array.
     command = globals()["cmd_" + command[2:].replace('-', '_')]
@@ -132,71 +182,307 @@ def parse_cli(usage, argv=None):
     return (command, options)
 
 
-def run_cli(usage, argv=None):
-    """Parse ARGV and run what was specified."""
-    command, options = parse_cli(usage, argv=argv)
-    command(options)
+def check_format(command, fmt):
+    """Exit if --format=fmt can't be used with command."""
+    if fmt == 'text':
+        return
+    if command not in FORMAT_COMMANDS:
+        sys.exit("--format can't be used with " + command)
+    if fmt == 'json' and command in NO_JSON_COMMANDS:
+        sys.exit("--format=json can't be used with %s; use ndjson" % command)
+
+
+# What docopt returns for XATAG_USAGE when no options are given.
+# fast_parse_cli() fills in the command and files.  This has to be kept in
+# sync with the usage string; test_fast_parse_cli checks that it is.
+DEFAULT_ARGUMENTS = {
+    '--add': False, '--batch': False, '--complement': False,
+    '--config-dir': None,
+    '--copy': False, '--copy-over': False, '--delete': False,
+    '--delete-all': False, '--exclude': None, '--execute': False,
+    '--export': False, '--file': [], '--file-separator': ':',
+    '--files-from': None, '--format': 'text',
+    '--flush-index': False, '--help': False, '--import': False,
+    '--include': None, '--index-tags': False,
+    '--indexed': False, '--jobs': '1', '--key-separator': ':',
+    '--key-val-pairs': False, '--list': False, '--max-padding': None,
+    '--min-padding': None, '--name-width': None, '--new-config': False,
+    '--no-index': False,
+    '--no-follow-symlinks': False, '--no-print-filename': False,
+    '--no-warn': False, '--null': False,
+    '--one-file-system': False, '--one-line': False, '--profile': False,
+    '--quiet': False,
+    '--recoll-execm': False, '--recoll-tags': False, '--recursive': False,
+    '--regenerate': False,
+    '--set': False, '--set-all': False, '--stats': False, '--tag': [],
+    '--terse': False,
+    '--use': False, '--used-tags': False, '--val-separator': ' ',
+    '--version': False, '--warn-once': False, '--watch': False,
+    'CONFIG_DIR': None, 'DEST': [], 'DIR': [], 'FILE': [], 'PATH': [],
+    'QUERY': None, 'SRC': None, 'TAG': [],
+    }
+
+
+def fast_parse_cli(argv):
+    """Parse the simplest command lines without docopt.
+
+    Parsing the usage string with docopt takes longer than listing the tags
+    of a file, which matters when Recoll runs 'xatag --recoll-tags FILE' for
+    every file it indexes.  So that and plain listing ('[-l] FILE...') are
+    recognized here, producing the same (command, options) as parse_cli().
+    Return None for anything else.
+    """
+    if len(argv) == 2 and argv[0] == '--recoll-tags':
+        flag = '--recoll-tags'
+        files = argv[1:]
+    elif argv[:1] == ['-l']:
+        flag = '--list'
+        files = argv[1:]
+    else:
+        flag = None
+        files = argv
+    if not files or any(f.startswith('-') for f in files):
+        return None
+    arguments = dict(DEFAULT_ARGUMENTS)
+    if flag:
+        arguments[flag] = True
+    arguments['FILE'] = list(files)
+    fix_arguments(arguments)
+    if flag == '--recoll-tags':
+        command = cmd_recoll_tags
+    else:
+        command = cmd_list
+    return (command, extract_options(arguments))
 
 
-def apply_to_files(fun, options, files=False):
-    """Call fun on files or options['files'], with error checking."""
+def run_cli(usage, argv=None):
+    """Parse ARGV and run what was specified.
+
+    With --profile, a table of the time spent in each phase is printed to
+    stderr at the end.  If the XATAG_TRACE environment variable is set, a
+    trace of the phases is written to the file it names.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    # Tracing has to start before the command line is parsed, to time that.
+    profile = '--profile' in argv
+    trace_file = os.environ.get(constants.TRACE_VAR)
+    if profile or trace_file:
+        trace.start(events=bool(trace_file))
+    try:
+        with trace.span('parse'):
+            parsed = None
+            if usage == constants.XATAG_USAGE:
+                parsed = fast_parse_cli(argv)
+            command, options = parsed or parse_cli(usage, argv=argv)
+        with trace.span('command'):
+            command(options)
+    finally:
+        if profile or trace_file:
+            finish_trace(profile, trace_file)
+
+
+def finish_trace(profile, trace_file):
+    """Stop tracing, and print the profile or write the trace file."""
+    # The tag index is otherwise committed at exit, after the report.
+    with trace.span('tag_index'):
+        tag_index.commit_tag_indexes()
+    tracer = trace.stop()
+    if profile:
+        sys.stdout.flush()
+        trace.report(tracer, sys.stderr)
+    if trace_file:
+        try:
+            trace.write_chrome_trace(tracer, trace_file)
+        except IOError:
+            warn("cannot write the trace file: " + trace_file)
+
+
+def apply_to_files(fun, options, files=False, record=None):
+    """Call fun on files or options['files'], with error checking.
+
+    fun is called as fun(fname, out=out, width=width), where out is the
+    stream that any output for fname should be written to, or None for
+    stdout, and width is what to pad fname to when it's printed, or None to
+    pad it as options say.  If
+    options['jobs'] is greater than one, the files are processed by that
+    many threads; the output and warnings for each file are held until the
+    file is finished, and then printed in the same order as files.
+
+    If options['recursive'] is true, directories in files are replaced by
+    the files beneath them, which are generated as they are needed.  If
+    options['files'] is used, it's followed by the names read from
+    options['files_from'], also as they are needed.
+
+    If record is given, it is called, in order, with each file that fun
+    returned a true value for.  The commands that change files return
+    whether they did, so that files that were left as they were aren't
+    reindexed.
+
+    With --format=json, what is written for each file is made an item of a
+    JSON array, so fun has to write a whole record (or nothing) each time.
+    """
     if not files:
         files = options['files']
+        if options.get('files_from'):
+            files = itertools.chain(files, files_from(options))
+    files = walk.walk_paths(files, recursive=options.get('recursive'),
+                            include=options.get('include', ()),
+                            exclude=options.get('exclude', ()),
+                            one_file_system=options.get('one_file_system'))
+    # The width to pad each file name to is taken as the file is pulled, so
+    # that it doesn't depend on how far ahead the threads have got.
+    if options.get('name_width') == 'auto':
+        items = widening(files, options['longest_filename'])
+    else:
+        items = ((fname, None) for fname in files)
+    out = None
+    if options.get('format') == 'json' and not options.get('quiet'):
+        import xatag.formats as formats
+        out = formats.JsonArrayWriter(sys.stdout)
+    jobs = options.get('jobs') or 1
+    if jobs == 1:
+        for fname, width in items:
+            if apply_to_file(fun, fname, out=out, width=width) and record:
+                record(fname)
+    else:
+        def buffered(item):
+            fname, width = item
+            out = StringIO()
+            with collect_warnings() as messages:
+                result = apply_to_file(fun, fname, out=out, width=width)
+            return fname, result, out.getvalue(), messages
+        for fname, result, output, messages in ordered_thread_map(buffered,
+                                                                  items, jobs):
+            for message in messages:
+                warn(message)
+            (out or sys.stdout).write(output)
+            if result and record:
+                record(fname)
+    if out is not None:
+        out.close()
+
+
+def files_from(options):
+    """Yield the names in the --files-from file, or stdin for '-'."""
+    fname = options['files_from']
+    if fname == '-':
+        stream = sys.stdin
+    else:
+        try:
+            stream = open(fname)
+        except IOError:
+            sys.exit("cannot read file: " + fname)
+    try:
+        for path in walk.read_paths(stream, null=options.get('null')):
+            yield path
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def widening(files, longest=0):
+    """Yield (fname, width) for files, width being the longest name so far."""
     for fname in files:
-        if os.path.exists(fname):
-            try:
-                fun(fname)
-            except IOError:
-                warn("could not write extended attributes: " + fname)
-            # xattr throws this when trying to reference an attribute that
-            # exists if the file isn't readable
-            except KeyError:
-                warn("could not read extended attributes: " + fname)
-        else:
-            warn("path does not exist: " + fname)
+        longest = max(longest, len(fname))
+        yield fname, longest
+
+
+def padded(options, width):
+    """Return the options to print a file with, padding its name to width.
+
+    If width is None, the name is padded as options say.
+    """
+    if width is None:
+        return options
+    return dict(options, longest_filename=width)
+
+
+def apply_to_file(fun, fname, out=None, width=None):
+    """Call fun on fname, turning xattr errors into warnings.
+
+    Return what fun returned, or None if there was an error.
+    """
+    if os.path.exists(fname):
+        try:
+            return fun(fname, out=out, width=width)
+        except IOError:
+            warn("could not write extended attributes: " + fname)
+        # xattr throws this when trying to reference an attribute that
+        # exists if the file isn't readable
+        except KeyError:
+            warn("could not read extended attributes: " + fname)
+    else:
+        warn("path does not exist: " + fname)
 
 
 def _maybe_check_new_tags(options):
-    if not options['no_warn'] or options['warn_once']:
+    batch = options.get('batch')
+    if batch is not None:
+        # Checked once, when the batch is done.
+        batch.tags.extend(options['tags'])
+    elif not options['no_warn'] or options['warn_once']:
         op.check_new_tags(**options)
 
 
+@contextmanager
+def recoll_update(options):
+    """Return the RecollUpdate that a command records changed files in.
+
+    The commands of a --batch share one, which is closed when the batch is
+    done.
+    """
+    batch = options.get('batch')
+    if batch is not None:
+        yield batch.update
+    else:
+        with recoll_spool.RecollUpdate(**options) as update:
+            yield update
+
+
 def cmd_add(options):
     """Perform the actions corresponding to --add."""
-    def per_file(fname):
-        op.add_tags(fname, **options)
-        op.print_file_tags(fname, **options)
+    def per_file(fname, out=None, width=None):
+        tag_dict, changed = op.add_tags(fname, **options)
+        op.print_file_tags(fname, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
     _maybe_check_new_tags(options)
-    apply_to_files(per_file, options)
-    op.update_recoll_index(**options)
+    with recoll_update(options) as update:
+        apply_to_files(per_file, options, record=update.add)
 
 
 def cmd_list(options):
     """Perform the actions corresponding to --list."""
-    def per_file(fname):
-        op.print_file_tags(fname, subset=True, **options)
+    def per_file(fname, out=None, width=None):
+        op.print_file_tags(fname, subset=True, out=out,
+                           **padded(options, width))
     options['quiet'] = False
     apply_to_files(per_file, options)
 
 
 def cmd_set(options):
     """Perform the actions corresponding to --set."""
-    def per_file(fname):
-        op.set_tags(fname, **options)
-        op.print_file_tags(fname, **options)
+    def per_file(fname, out=None, width=None):
+        tag_dict, changed = op.set_tags(fname, **options)
+        op.print_file_tags(fname, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
     _maybe_check_new_tags(options)
-    apply_to_files(per_file, options)
-    op.update_recoll_index(**options)
+    with recoll_update(options) as update:
+        apply_to_files(per_file, options, record=update.add)
 
 
 def cmd_set_all(options):
     """Perform the actions corresponding to --set-all."""
-    def per_file(fname):
-        op.set_all_tags(fname, **options)
-        op.print_file_tags(fname, **options)
+    def per_file(fname, out=None, width=None):
+        tag_dict, changed = op.set_all_tags(fname, **options)
+        op.print_file_tags(fname, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
     _maybe_check_new_tags(options)
-    apply_to_files(per_file, options)
-    op.update_recoll_index(**options)
+    with recoll_update(options) as update:
+        apply_to_files(per_file, options, record=update.add)
 
 
 def validate_source_and_destinations(options):
@@ -219,10 +505,10 @@ def validate_source_and_destinations(options):
     options['destinations'] = destinations
 
 
-def try_read_tag_dict(source):
+def try_read_tag_dict(source, follow_symlinks=True):
     """Call read_tag_dict, exiting on an exception."""
     try:
-        source_tags = read_tag_dict(source)
+        source_tags = read_tag_dict(source, follow_symlinks)
     except:
         sys.exit("could not read extended attributes: " + source)
     return source_tags
@@ -230,66 +516,237 @@ def try_read_tag_dict(source):
 
 def cmd_copy(options):
     """Perform the actions corresponding to --copy."""
-    def per_file(dest):
-        op.copy_tags(source_tags, dest, **options)
-        op.print_file_tags(dest, **options)
+    def per_file(dest, out=None, width=None):
+        tag_dict, changed = op.copy_tags(source_tags, dest, **options)
+        op.print_file_tags(dest, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
     validate_source_and_destinations(options)
     source = options['source']
     destinations = options['destinations']
     if source:
-        source_tags = try_read_tag_dict(source)
+        source_tags = try_read_tag_dict(source,
+                                            options['follow_symlinks'])
         source_tags = op.subsetted_tags(source_tags, **options)
         # remove 'tag' from the options dict so that copy_tags() doesn't try
         # to repeat the subsetting on source_tags
         options['tags'] = []
-        apply_to_files(per_file, options, files=destinations)
-    op.update_recoll_index(**options)
+        with recoll_update(options) as update:
+            apply_to_files(per_file, options, files=destinations,
+                           record=update.add)
 
 
 def cmd_copy_over(options):
     """Perform the actions corresponding to --copy-over."""
-    def per_file(dest):
-        op.copy_tags_over(source_tags, dest, **options)
-        op.print_file_tags(dest, **options)
+    def per_file(dest, out=None, width=None):
+        tag_dict, changed = op.copy_tags_over(source_tags, dest, **options)
+        op.print_file_tags(dest, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
     validate_source_and_destinations(options)
     source = options['source']
     destinations = options['destinations']
     if source:
-        source_tags = try_read_tag_dict(source)
+        source_tags = try_read_tag_dict(source,
+                                            options['follow_symlinks'])
         source_tags = op.subsetted_tags(source_tags, **options)
         # remove 'tag' from the options dict so that copy_tags() doesn't try
         # to repeat the subsetting on source_tags
         options['tags'] = []
-        apply_to_files(per_file, options, files=destinations)
-    op.update_recoll_index(**options)
+        with recoll_update(options) as update:
+            apply_to_files(per_file, options, files=destinations,
+                           record=update.add)
 
 
 def cmd_delete(options):
     """Perform the actions corresponding to --delete."""
-    def per_file(fname):
-        op.delete_tags(fname, **options)
-        op.print_file_tags(fname, **options)
-    apply_to_files(per_file, options)
-    op.update_recoll_index(**options)
+    def per_file(fname, out=None, width=None):
+        tag_dict, changed = op.delete_tags(fname, **options)
+        op.print_file_tags(fname, tag_dict=tag_dict, out=out,
+                           **padded(options, width))
+        return changed
+    with recoll_update(options) as update:
+        apply_to_files(per_file, options, record=update.add)
 
 
 def cmd_delete_all(options):
     """Perform the actions corresponding to --delete-all."""
-    def per_file(fname):
-        op.delete_all_tags(fname)
-    apply_to_files(per_file, options)
-    op.update_recoll_index(**options)
+    def per_file(fname, out=None, **unused):
+        tag_dict, changed = op.delete_all_tags(fname, **options)
+        return changed
+    with recoll_update(options) as update:
+        apply_to_files(per_file, options, record=update.add)
 
 
 def cmd_execute(options):
     """Perform the actions corresponding to --execute."""
-    # When parsing an '--execute' call, everything is put in the array for
-    # TAG no matter what.  A single tag is a valid query string, so let's
-    # just call any list of arguments with one element a query.
-    if len(options['TAG']) == 1:
-        options['QUERY_STRING'] = options['TAG']
-        options['TAG'] = []
-    warn('the execute command is not implemented yet')
+    import xatag.query as xq
+    try:
+        query = xq.Query(options['QUERY'])
+    except xq.QuerySyntaxError as e:
+        sys.exit("invalid query: " + str(e))
+    paths = options['PATH'] or ['.']
+    stats = xq.SearchStats()
+    search_options = dict((name, options[name])
+                          for name in ['include', 'exclude', 'one_file_system',
+                                       'follow_symlinks'])
+    if options['indexed']:
+        index = tag_index.open_tag_index(options['config_dir'])
+        if index is None:
+            sys.exit("the tag index does not exist; "
+                     "create it with 'xatag --index-tags FILE...'")
+        matches = xq.search_index(query, paths, stats, index,
+                                  **search_options)
+    else:
+        matches = xq.search_files(query, paths, stats, **search_options)
+    for fname in matches:
+        if not options['quiet']:
+            sys.stdout.write(fname + "\n")
+    sys.stderr.write(stats.summary() + "\n")
+
+
+def cmd_export(options):
+    """Print the tags of the files under PATH(s), one JSON object per line."""
+    import xatag.dump as dump
+    def per_file(fname, out=None, **unused):
+        tag_dict = read_tag_dict(fname, options['follow_symlinks'])
+        if tag_dict:
+            try:
+                line = dump.format_record(fname, tag_dict, os.stat(fname))
+            except UnicodeDecodeError:
+                warn("cannot export a path or tag that isn't UTF-8: " + fname)
+                return
+            (out or sys.stdout).write(line)
+    options['recursive'] = True
+    apply_to_files(per_file, options, files=options['PATH'] or ['.'])
+
+
+def cmd_import(options):
+    """Set the tags of files to those in the --export format file FILE."""
+    import xatag.dump as dump
+    fname = options['files'][0]
+    if fname == '-':
+        lines = sys.stdin
+    else:
+        try:
+            lines = open(fname)
+        except IOError:
+            sys.exit("cannot read file: " + fname)
+    invalid = []
+    records = dump.read_records(lines, fname, invalid=invalid.append)
+    counts = {'changed': 0, 'unchanged': 0, 'failed': 0}
+
+    def restore(record):
+        path, tag_dict = record
+        with collect_warnings() as messages:
+            if not os.path.exists(path):
+                warn("path does not exist: " + path)
+                return path, None, messages
+            try:
+                tag_dict, changed = op.restore_tags(path, tag_dict, **options)
+            except (IOError, KeyError):
+                warn("could not write extended attributes: " + path)
+                return path, None, messages
+        return path, changed, messages
+
+    if options['jobs'] == 1:
+        results = (restore(record) for record in records)
+    else:
+        results = ordered_thread_map(restore, records, options['jobs'])
+    with recoll_update(options) as update:
+        for path, changed, messages in results:
+            for message in messages:
+                warn(message)
+            if changed is None:
+                counts['failed'] += 1
+            elif changed:
+                counts['changed'] += 1
+                update.add(path)
+            else:
+                counts['unchanged'] += 1
+    if lines is not sys.stdin:
+        lines.close()
+    counts['invalid'] = len(invalid)
+    if not options['quiet']:
+        sys.stderr.write("%(changed)d files changed, %(unchanged)d unchanged, "
+                         "%(failed)d failed, %(invalid)d invalid records\n"
+                         % counts)
+    if counts['failed'] or counts['invalid']:
+        sys.exit(1)
+
+
+class Batch(object):
+    """What the commands of a --batch share."""
+    def __init__(self, options):
+        self.update = recoll_spool.RecollUpdate(hold=True, **options)
+        self.tags = []
+
+
+def cmd_batch(options):
+    """Run the tagging commands read from stdin, sharing one Recoll update."""
+    import xatag.batch as xbatch
+    batch = Batch(options)
+    failed = 0
+    with collect_warnings() as messages:
+        for number, fields in xbatch.split_records(sys.stdin,
+                                                   null=options['null']):
+            try:
+                name, tags, files = xbatch.parse_record(fields)
+            except ValueError as e:
+                warn("-:%d: invalid batch record: %s" % (number, e))
+                failed += 1
+                continue
+            record_options = dict(options, batch=batch, tags=parse_tags(tags),
+                                  files=files, source=None, destinations=[],
+                                  files_from=None)
+            if options['name_width'] is None:
+                record_options['longest_filename'] = max(len(f)
+                                                         for f in files)
+            if name.startswith('copy'):
+                record_options['source'] = files[0]
+                record_options['destinations'] = files[1:]
+            try:
+                globals()['cmd_' + name.replace('-', '_')](record_options)
+            except SystemExit as e:
+                warn("-:%d: %s" % (number, e.code))
+                failed += 1
+        batch.update.close()
+    # Many commands may give the same warning, so each is printed once.
+    seen = set()
+    for message in messages:
+        if message not in seen:
+            seen.add(message)
+            warn(message)
+    if batch.tags and (not options['no_warn'] or options['warn_once']):
+        op.check_new_tags(**dict(options, tags=batch.tags))
+    if failed:
+        sys.exit(1)
+
+
+# Files using more than this fraction of the limit are counted as near it.
+NEAR_LIMIT = 0.75
+
+
+def cmd_stats(options):
+    """Print how close the xattrs of each file are to the limit."""
+    usages = []
+    def per_file(fname, out=None, **unused):
+        usage = xattr_usage(fname, options['follow_symlinks'])
+        usages.append(usage)
+        if not options['quiet']:
+            (out or sys.stdout).write(
+                "%s: %d of %d bytes (%d%%) in %d xattrs, largest %d, "
+                "%d tag keys, %d chunked\n" %
+                (fname, usage['bytes'], usage['limit'],
+                 100 * usage['bytes'] // usage['limit'], usage['xattrs'],
+                 usage['largest'], usage['keys'], usage['chunked']))
+    apply_to_files(per_file, options)
+    fractions = [float(u['bytes']) / u['limit'] for u in usages]
+    sys.stdout.flush()
+    sys.stderr.write("%d files, %d near the limit (over %d%%), fullest %d%%\n"
+                     % (len(usages), sum(1 for f in fractions
+                                         if f > NEAR_LIMIT),
+                        100 * NEAR_LIMIT, 100 * max(fractions or [0])))
 
 
 def cmd_use(options):
@@ -313,6 +770,82 @@ def cmd_regenerate(options):
     config.update_recoll_fields(config_dir=options['config_dir'])
 
 
+def cmd_index_tags(options):
+    """Record the tags of the files in the tag index, creating it if needed."""
+    index = tag_index.open_tag_index(options['config_dir'], create=True)
+    if index is None:
+        return
+    def per_file(fname, out=None, **unused):
+        index.update(fname, read_tag_dict(fname, options['follow_symlinks']))
+    apply_to_files(per_file, options)
+    index.commit()
+
+
+def cmd_flush_index(options):
+    """Run recollindex on the paths waiting in the Recoll spool."""
+    config_dir = config.find_config_dir(options['config_dir'])
+    if config_dir:
+        recoll_spool.flush_spool(config_dir)
+
+
+def cmd_watch(options):
+    """Keep the tag index and Recoll up to date with changes under DIR(s)."""
+    import xatag.watch as watch
+    dirs = []
+    for path in options['DIR']:
+        if os.path.isdir(path):
+            dirs.append(path)
+        else:
+            warn("not a directory: " + path)
+    if not dirs:
+        return
+    try:
+        watcher = watch.Watcher(dirs, include=options['include'],
+                                exclude=options['exclude'],
+                                one_file_system=options['one_file_system'])
+    except (OSError, AttributeError):
+        sys.exit("cannot watch for changes; inotify is not available")
+    index = tag_index.open_tag_index(options['config_dir'])
+    def report(fname, tag_dict):
+        if not options['quiet']:
+            op.print_file_tags(fname, tag_dict=tag_dict, **options)
+            sys.stdout.flush()
+    try:
+        while True:
+            # Wake up now and then even with nothing to do, so that the
+            # Recoll spool is flushed once it's due.
+            changes = watcher.wait(constants.RECOLL_SPOOL_MAX_AGE)
+            with recoll_update(options) as update:
+                watch.sync_changes(changes, index=index, record=update.add,
+                                   report=report,
+                                   follow_symlinks=options['follow_symlinks'])
+            if index is not None:
+                index.commit()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
 def cmd_recoll_tags(options):
-    """Create a new config directory at path, or a default location."""
-    op.print_file_tags(options['files'][0], for_recoll=True, **options)
+    """Print the tags of FILE as Recoll's fields, or in --format."""
+    out = None
+    if options['format'] == 'json':
+        import xatag.formats as formats
+        out = formats.JsonArrayWriter(sys.stdout)
+    op.print_file_tags(options['files'][0], for_recoll=True, out=out,
+                       **options)
+    if out is not None:
+        out.close()
+
+
+def cmd_recoll_execm(options):
+    """Answer Recoll's requests for tags on stdin until it ends."""
+    import xatag.recoll_execm as execm
+    try:
+        execm.serve(sys.stdin, sys.stdout,
+                    follow_symlinks=options['follow_symlinks'])
+    except execm.ProtocolError as e:
+        sys.exit("recoll execm: " + str(e))
+    except KeyboardInterrupt:
+        pass
@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import marshal
 import os
 import StringIO
 import sys
@@ -22,6 +23,7 @@ import string
 
 from xatag.warn import warn
 import xatag.constants as constants
+import xatag.trace as trace
 import xatag.tag_dict as xtd
 import xatag.localrecoll as lrcl
 
@@ -156,20 +158,107 @@ def find_ignored_keys_file(config_dir=None):
     return find_config_file(constants.IGNORED_KEYS_FILE, config_dir=config_dir)
 
 
-def load_known_tags(config_dir=None):
-    fname = find_known_tags_file(config_dir)
+def find_fuse_conf_file(config_dir=None):
+    return find_config_file(constants.FUSE_CONF_FILE, config_dir=config_dir)
+
+
+def load_fuse_conf(config_dir=None):
+    """Return the settings in fuse_conf.yaml, with defaults for missing ones.
+
+    Reading the file needs PyYAML; without it, the defaults are used.
+    """
+    conf = dict(constants.DEFAULT_FUSE_CONF)
+    fname = find_fuse_conf_file(config_dir)
     if not fname:
-        return None
+        return conf
+    try:
+        import yaml
+    except ImportError:
+        warn("PyYAML is not installed; ignoring " + fname)
+        return conf
     try:
         with open(fname) as f:
-            lines = f.readlines()
-    except:
-        warn("xatag known_tags file cannot be read: " + fname)
-        return None
+            loaded = yaml.safe_load(f)
+    except (IOError, yaml.YAMLError):
+        warn("xatag fuse_conf file cannot be read: " + fname)
+        return conf
+    if isinstance(loaded, dict):
+        conf.update(loaded)
+    return conf
+
+
+def guess_tag_index_file(config_dir=None):
+    config_dir = guess_config_dir(config_dir=config_dir)
+    return os.path.join(config_dir, constants.TAG_INDEX_FILE)
+
+
+# Parsing a big known_tags file takes a while, and it's needed every time
+# tags are added or set.  So the parsed contents of the config files are
+# kept in memory for the rest of the process, and also saved next to the
+# file (as 'known_tags.cache', for instance) with marshal, which is fast to
+# load.  Both are tagged with the device, inode, size and mtime of the file,
+# and are thrown away if any of those change.  The parsed values that are
+# returned are shared, so don't modify them.
+
+CACHE_SUFFIX = '.cache'
+_parsed_files = {}
+
+
+def file_signature(fname):
+    st = os.stat(fname)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime,
+            sys.version_info[:2])
+
+
+def load_parsed_file(fname, parse):
+    """Return parse(lines of fname), using cached results if possible."""
+    signature = file_signature(fname)
+    memo = _parsed_files.get(fname)
+    if memo and memo[0] == signature:
+        return memo[1]
+
+    cache_file = fname + CACHE_SUFFIX
+    parsed = None
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_signature, cached = marshal.load(f)
+        if cached_signature == signature:
+            parsed = cached
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if parsed is None:
+        with open(fname) as f:
+            parsed = parse(f.readlines())
+        try:
+            tmp_file = cache_file + '.%d' % os.getpid()
+            with open(tmp_file, 'wb') as f:
+                marshal.dump((signature, parsed), f)
+            os.rename(tmp_file, cache_file)
+        except (IOError, OSError, ValueError):
+            pass
+
+    _parsed_files[fname] = (signature, parsed)
+    return parsed
+
+
+def load_known_tags(config_dir=None):
+    with trace.span('known_tags'):
+        fname = find_known_tags_file(config_dir)
+        if not fname:
+            return None
+        try:
+            return load_parsed_file(fname, parse_known_tags)
+        except (IOError, OSError):
+            warn("xatag known_tags file cannot be read: " + fname)
+            return None
+
+
+def parse_known_tags(lines):
     known_tags = {constants.DEFAULT_TAG_KEY:[]}
     for line in lines:
         line = line.strip()
-        if line[0] == '#' or line == '':
+        if line == '' or line[0] == '#':
             continue
         kv = line.split(':')
         if kv == ['']:
@@ -193,15 +282,17 @@ def load_ignored_keys(config_dir=None):
     if not fname:
         return None
     try:
-        with open(fname) as f:
-            lines = f.readlines()
-    except:
+        return load_parsed_file(fname, parse_ignored_keys)
+    except (IOError, OSError):
         warn("xatag ignored_keys file cannot be read: " + fname)
         return None
+
+
+def parse_ignored_keys(lines):
     ignored_keys = set([])
     for line in lines:
         line = line.strip()
-        if line[0] == '#' or line == '':
+        if line == '' or line[0] == '#':
             continue
         ignored_keys.add(line)
     return ignored_keys
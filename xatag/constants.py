@@ -15,6 +15,14 @@
 
 
 XATTR_PREFIX = 'org.xatag.tags'
+# The rest of a long tag field is kept in xattrs with this prefix.
+XATTR_CHUNK_PREFIX = 'org.xatag.chunks'
+# The largest xattr value Linux allows, and the block size assumed when the
+# file system's can't be found.
+XATTR_SIZE_MAX = 64 * 1024
+DEFAULT_XATTR_BLOCK_SIZE = 4096
+# The values of --format; see formats.py for the others.
+OUTPUT_FORMATS = ['text', 'json', 'ndjson', 'tsv', 'null']
 DEFAULT_TAG_KEY = 'tag'
 XATTR_FIELD_SEPARATOR = ';'
 DEFAULT_CONFIG_DIR = "~/.xatag/"
@@ -22,6 +30,20 @@ CONFIG_DIR_VAR='XATAG_DIR'
 KNOWN_TAGS_FILE='known_tags'
 IGNORED_KEYS_FILE='ignored_keys'
 FUSE_CONF_FILE='fuse_conf.yaml'
+TAG_INDEX_FILE='index.db'
+RECOLL_SPOOL_FILE='recoll_spool'
+# Flush the Recoll spool when it reaches this many bytes, or when this many
+# seconds have passed since the last flush.
+RECOLL_SPOOL_MAX_SIZE=64 * 1024
+RECOLL_SPOOL_MAX_AGE=60
+# The xattr backend to use ('xattr' or 'memory'); see backends.py.
+BACKEND_VAR='XATAG_BACKEND'
+DAEMON_SOCKET_FILE='xatagd.sock'
+# If this environment variable is set, a trace of each xatag command, in the
+# Chrome trace event format, is written to the file it names; see trace.py.
+TRACE_VAR='XATAG_TRACE'
+# If this environment variable is set, bin/xatag doesn't use xatagd.
+DAEMON_DISABLE_VAR='XATAG_NO_DAEMON'
 RECOLL_CONFIG_DIR='recoll' # relative to xatag config dir
 
 RECOLL_BASE_CONFIG_DIR_VAR='XATAG_DIR'
@@ -106,6 +128,11 @@ DEFAULT_RECOLL_CONF="""# xatag-specific recoll config
 #
 # [~/docs]
 metadatacmds = ; rclmultixatag = xatag --recoll-tags %f
+#
+# Recoll starts the command above once for each file.  Start xatagd to make
+# that quick.  'xatag --recoll-execm' answers for many files in one process,
+# using the protocol of Recoll's persistent "execm" handlers, for setups that
+# can run a handler that way.
 """
 
 RECOLL_FIELDS_UPDATE_RE = ".*XATAG WILL REGENERATE THIS FILE"
@@ -171,21 +198,18 @@ boolean_not_dirs:
   - .NOT
 all_values_dirs:
   - 'ALL'
-tag_dirs:
-  -
-    not_keys: [tag]
-    list: keys
-    prefix: '_'
-  -
-    keys: [tag]
-    list: values
-  -
-    keys: yes
-    list: tags
-    prefix: '.'
-    separator: ':'
 """
 
+# The settings in DEFAULT_FUSE_CONF_FILE, used for any that are missing from
+# the user's file.
+DEFAULT_FUSE_CONF = {
+    'mount_dirs': ['~/tagging', '~/docs'],
+    'terminate_dirs': ['$', '.x'],
+    'boolean_or_dirs': ['+', '.or', '.OR'],
+    'boolean_not_dirs': ['!', '.not', '.NOT'],
+    'all_values_dirs': ['ALL'],
+    }
+
 
 # This is the string that is actually used, both for parsing the command line
 # and for testing.
@@ -193,18 +217,29 @@ tag_dirs:
 XATAG_USAGE="""xatag - file tagging using extended attributes (xattr).
 
 Usage:
+  xatag [options] (-a | -s | -S | -d) --files-from=PATH TAG...
+  xatag [options] [-l] --files-from=PATH [TAG]...
+  xatag [options] -D --files-from=PATH
   xatag [options] (-a | -s | -S | -d)           TAG       FILE...
   xatag [options] (-a | -s | -S | -d | [-l]) -t TAG...    FILE...
   xatag [options] (-a | -s | -S | -d | [-l])    TAG... -f FILE...
   xatag [options] [-l] FILE...
   xatag [options] (-c | -C) SRC DEST... [-t TAG]...
   xatag [options] -D FILE...
-  xatag [options] -x TAG... | QUERY
+  xatag [options] -x QUERY [PATH]...
   xatag [options] -u TAG...
   xatag [options] -U [TAG]...
   xatag [options] --new-config [CONFIG_DIR]
   xatag [options] --recoll-tags FILE
+  xatag [options] --recoll-execm
   xatag [options] --regenerate
+  xatag [options] --index-tags FILE...
+  xatag [options] --flush-index
+  xatag [options] --watch DIR...
+  xatag [options] --export [PATH]...
+  xatag [options] --import FILE
+  xatag [options] --batch
+  xatag [options] --stats FILE...
   xatag  -h | --help
   xatag  -v | --version
 
@@ -227,21 +262,70 @@ File Tagging Commands:
                      given erasing any previous xatag data in the extended
                      attributes.  Equivalent to "xatag -D FILE...; xatag -a
                      TAG FILE..."
-  -x --execute     Execute a query.
+  -x --execute     Print the files under PATH(s) (by default, the current
+                     directory) with tags matching QUERY, such as
+                     'genre:indie AND NOT tag:draft OR artist:"The XX"'.
+                     Terms are written like TAGs, and 'key:' matches any value
+                     of key.  NOT binds tighter than AND, which binds tighter
+                     than OR; parentheses group, and AND may be left out.
 
 Management Commands:
+     --batch        Run the tagging commands read from standard input in one
+                      process.  Each line is a command: tab separated fields
+                      with the command's name (add, set, set-all, delete,
+                      delete-all, copy, copy-over or list), its TAGs, a '--'
+                      field, and its FILEs (or SRC and DESTs).  With -0, each
+                      field ends with a NUL instead, and each command with an
+                      empty field.  The options given apply to every command.
+                      Recoll is updated once, at the end, and each warning is
+                      printed once, at the end.
+     --export       Print the tags of every tagged file under PATH(s) (by
+                      default, the current directory) as one JSON object per
+                      line, with the keys "path", "inode" and "tags".
+     --import       Set the tags of files to those in FILE, which is in the
+                      format written by --export ('-' reads standard input).
+                      Files that already have the right tags aren't written
+                      to.  Paths are relative to the current directory.
+     --flush-index  Update the Recoll index for all of the files that are
+                      waiting in the spool.  Files with changed tags are
+                      spooled in the xatag config directory, and Recoll is
+                      only updated when the spool is large enough or a
+                      minute has passed since the last update; a background
+                      process waits for that minute if no other xatag call
+                      comes along.
      --new-config   Write xatag config directory at ~/.xatag, or at CONFIG_DIR
                       if an argument is given.
      --recoll-tags  List the tags of FILE in a format appropriate for Recoll's
                       metadatacmds field.
+     --recoll-execm
+                    Answer requests from Recoll for the tags of files, on
+                      standard input and output, until the input ends.  This
+                      speaks the protocol of Recoll's persistent "execm"
+                      handlers, so Python is started only once.
+     --stats        Print how much space the extended attributes of each FILE
+                      use, out of the limit of its file system, and then how
+                      many files are near the limit.  Tag fields longer than
+                      half a block are compressed and split into chunks, but
+                      ext4 limits all of a file's xattrs together to about
+                      one block.
   -R --regenerate   Recreate all of the files that are generated by xatag.
                       Right now, this is only the fields file in the xatag
                       recoll config directory.
+     --index-tags   Record the tags of FILE(s) in the tag index in the xatag
+                      config directory, creating the index if it doesn't
+                      exist.  Once the index exists, every change made by
+                      xatag is recorded in it as well.
   -u --use          Enter TAG(s) into the known tag list.  Adding a tag to the
                       list will prohibit the warning printed when using an
                       unknown tag.  Known tags are also used for shell
                       completion.
   -U --used-tags    Print list of known tags.
+     --watch        Watch the DIR(s), and everything beneath them, for
+                      changes to tags made by other programs (like setfattr
+                      or rsync -X) and for files that are moved or deleted.
+                      The tag index and Recoll are updated to match, and the
+                      tags of each changed file are printed.  Runs until
+                      interrupted.
 
 Argument Flags:
   -t TAG --tag=TAG     The following argument is a tag; when this flag is
@@ -257,9 +341,47 @@ General Options:
                          "not".  Can be used on -d, -l, and -c/-C.
      --config-dir=DIR  Use CONFIG-DIR as the xatag configuration, instead of
                          checking in the default path or environment variable.
+  -j N --jobs=N        Read and write the extended attributes of up to N files
+                         at once.  Output is still printed in the order the
+                         files were given.  [default: 1]
+     --indexed         Answer --execute queries from the tag index instead of
+                         reading the extended attributes of every file.
+                         Files that changed after they were indexed, or
+                         were never indexed, are still read.  The whole
+                         tree under PATH(s) is still walked and every file
+                         stat'ed, so this saves reading the attributes, not
+                         the walk.
+  -L --no-follow-symlinks
+                       Read and write the extended attributes of symlinks
+                         themselves, instead of the files they point to.
+     --files-from=PATH
+                       Apply the command to the files named in PATH, one per
+                         line, as well as to any FILE(s); '-' reads standard
+                         input.  The names are read as they are needed, so
+                         there can be any number of them, and file names are
+                         padded as with --name-width=auto.  All of the other
+                         arguments are TAG(s).
+  -0 --null            With --files-from, read names that end with NUL
+                         characters instead of lines.  With --batch, read
+                         fields that end with NUL characters, instead of lines
+                         of tab separated fields.
      --no-index        Do not attempt to update the Recoll index for altered
-                         files.
+                         files, and do not add them to the spool.
+     --profile         When done, print to stderr how long each phase of the
+                         command took and how many extended attribute system
+                         calls were made.
   -q --quiet           Avoid writing to stdout.
+  -r --recursive       Apply the command to the files beneath each directory
+                         given as a FILE or DEST, instead of to the directory
+                         itself.  Symlinks to directories are not followed.
+     --include=GLOBS   With --recursive or --execute, only use files with
+                         names matching one of the comma separated GLOBS.
+     --exclude=GLOBS   With --recursive or --execute, skip files and
+                         directories with names matching one of the comma
+                         separated GLOBS.
+     --one-file-system
+                       With --recursive or --execute, do not descend into
+                         directories on other file systems.
   -T --terse           Only print values for tag keys that have been altered.
                          Also, don't print the names of files unless tags will
                          be printed as well.
@@ -276,6 +398,17 @@ Printing Options:
                                  printing all values with the same key
                                  together.  Probably easier to grep.
                                  Compatible with --one-line.
+     --format=FORMAT           Print tags as text, for people, or in a format
+                                 for programs, ignoring the other printing
+                                 options: json (an array with an object with
+                                 "path" and "tags" for each file), ndjson
+                                 (those objects one per line), tsv (a line of
+                                 path, key and value for each tag, separated
+                                 by tabs, with backslash escapes) or null
+                                 (those fields, each ending with a NUL).
+                                 Only for the commands that print tags and
+                                 for --batch, and not json for a batch or
+                                 for --watch.  [default: text]
      --max-padding=INT         Do not pad filenames and tag keys to a length
                                  greater than MAX characters.  A value of 0 is
                                  useful to determine unique tags in a set of
@@ -285,6 +418,11 @@ Printing Options:
                                  when listing multiple files.  Minimum padding
                                  for filenames and tag values within a single
                                  file is handled automatically.
+     --name-width=WIDTH        Pad filenames to WIDTH characters, instead of
+                                 to the longest of the FILE(s), or with
+                                 'auto', to the longest printed so far.
+                                 Either way, output starts right away, which
+                                 helps when listing very many files.
      --no-print-filename       Do not print the filename, only tag keys and
                                  values.  Useful to determine unique tags in a
                                  set of files.
@@ -301,5 +439,6 @@ Printing Options:
                                  This only affects printing, not parsing tags
                                  passed as arguments.  [default:  ] (a space)
 
-When reading and writing extended attributes, symlinks are followed by default.
+When reading and writing extended attributes, symlinks are followed, unless
+the --no-follow-symlinks option is given.
 """
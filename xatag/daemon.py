@@ -0,0 +1,344 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# xatagd runs xatag commands for bin/xatag, so that the modules, the config
+# files and the tag index are loaded once instead of every time xatag is
+# run.  That matters mostly for Recoll, which runs 'xatag --recoll-tags FILE'
+# for every file that it indexes.
+#
+# The daemon listens on a Unix socket in the xatag config directory.  A
+# client sends the command line and its working directory; the daemon runs
+# the command and sends back what it writes to stdout and stderr as it is
+# written, followed by the exit status.  Commands are run one at a time.
+# Standard input and the environment of the client are not passed along, so
+# commands that need XATAG_TRACE are run by the client itself.
+#
+# Messages in both directions are frames: a one character kind, the length
+# of the payload as a four byte big-endian integer, and the payload.
+
+import errno
+import marshal
+import os
+import socket
+import struct
+import sys
+
+import xatag.config as config
+import xatag.constants as constants
+from xatag.warn import warn
+
+REQUEST = 'r'
+STOP = 'q'
+STDOUT = 'o'
+STDERR = 'e'
+EXIT = 'x'
+
+HEADER = struct.Struct('>cI')
+
+
+def socket_file(config_dir=None):
+    return os.path.join(config.guess_config_dir(config_dir),
+                        constants.DAEMON_SOCKET_FILE)
+
+
+def send_frame(sock, kind, payload=''):
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_frame(sock):
+    """Return the (kind, payload) of the next frame, or (None, None) at EOF."""
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return (None, None)
+    kind, size = HEADER.unpack(header)
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        return (None, None)
+    return (kind, payload)
+
+
+def connect(config_dir=None):
+    """Return a socket connected to xatagd, or None if it isn't running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_file(config_dir))
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+# xatagd runs one command at a time, so it shouldn't be tied up by one that
+# never ends, or by one that works through a whole tree or a list of files
+# that may be just as long; and a command it runs isn't stopped when the
+# client is interrupted.  It also doesn't pass on stdin, which some commands
+# read from.  So commands with these options (or any abbreviation of them)
+# are run by the client.
+LOCAL_OPTIONS = ['--watch', '--recoll-execm', '--batch', '--files-from',
+                 '--recursive', '--export', '--execute']
+# The short forms, -r and -x.
+LOCAL_FLAGS = 'rx'
+
+
+def _long_option(arg):
+    """Return the name of the long option arg, without any '=VALUE'."""
+    return arg.partition('=')[0]
+
+
+def runs_locally(argv):
+    """Return True if the command line argv shouldn't be run by xatagd."""
+    for arg in argv:
+        if arg.startswith('--') and len(_long_option(arg)) > 2:
+            name = _long_option(arg)
+            if any(option.startswith(name) for option in LOCAL_OPTIONS):
+                return True
+        elif arg.startswith('-') and any(c in LOCAL_FLAGS for c in arg[1:]):
+            return True
+    return '--import=-' in argv or ('--import' in argv and '-' in argv)
+
+
+def config_dir_arg(argv):
+    """Return the value of --config-dir in argv, or None."""
+    for i, arg in enumerate(argv):
+        name = _long_option(arg)
+        # '--co' could also be --copy.
+        if len(name) > 4 and '--config-dir'.startswith(name):
+            if '=' in arg:
+                return arg.partition('=')[2]
+            if i + 1 < len(argv):
+                return argv[i + 1]
+    return None
+
+
+def forward(argv, config_dir=None, stdout=None, stderr=None):
+    """Run the xatag command line argv in xatagd.
+
+    The command is sent to the xatagd of the config directory given with
+    --config-dir in argv, if there is one, and otherwise of config_dir.
+    Return the exit status of the command, or None if xatagd isn't running
+    (or is disabled by the environment, or the command has to be run
+    locally), in which case nothing was done.
+    """
+    if (os.environ.get(constants.DAEMON_DISABLE_VAR) or
+            os.environ.get(constants.TRACE_VAR)):
+        return None
+    if runs_locally(argv):
+        return None
+    config_dir = config_dir_arg(argv) or config_dir
+    sock = connect(config_dir)
+    if sock is None:
+        return None
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    try:
+        send_frame(sock, REQUEST, marshal.dumps((list(argv), os.getcwd())))
+        while True:
+            kind, payload = recv_frame(sock)
+            if kind == STDOUT:
+                stdout.write(payload)
+            elif kind == STDERR:
+                stdout.flush()
+                stderr.write(payload)
+            elif kind == EXIT:
+                return int(payload)
+            else:
+                # The command may have been partly done, so don't run it
+                # again.
+                warn("xatagd closed the connection")
+                return 1
+    except socket.error:
+        warn("xatagd closed the connection")
+        return 1
+    finally:
+        sock.close()
+
+
+def stop(config_dir=None):
+    """Ask xatagd to exit.  Return False if it isn't running."""
+    sock = connect(config_dir)
+    if sock is None:
+        return False
+    try:
+        send_frame(sock, STOP)
+        recv_frame(sock)
+    finally:
+        sock.close()
+    return True
+
+
+class SocketWriter(object):
+    """A file-like object that sends what is written as frames of kind."""
+    def __init__(self, sock, kind):
+        self.sock = sock
+        self.kind = kind
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if data:
+            send_frame(self.sock, self.kind, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def exit_status(exc, stderr):
+    """Return the exit status for the SystemExit exc, as the interpreter does.
+
+    A message passed to sys.exit() is written to stderr.
+    """
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, (int, long)):
+        return code
+    stderr.write(str(code) + "\n")
+    return 1
+
+
+class Daemon(object):
+    """Serve xatag commands on the socket in config_dir."""
+    def __init__(self, config_dir=None):
+        self.config_dir = config.guess_config_dir(config_dir)
+        self.path = socket_file(self.config_dir)
+        self.listener = None
+        self.running = False
+
+    def bind(self):
+        """Start listening on the socket, replacing a stale one.
+
+        Return False if another daemon is already listening on it.
+        """
+        if os.path.exists(self.path):
+            sock = connect(self.config_dir)
+            if sock is not None:
+                sock.close()
+                return False
+            os.remove(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.listener.listen(16)
+        return True
+
+    def warm_up(self):
+        """Load the modules and files that most commands use."""
+        import xatag.cli
+        import xatag.query
+        config.load_known_tags(self.config_dir)
+        config.load_ignored_keys(self.config_dir)
+
+    def serve_forever(self):
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.listener.accept()
+                except socket.error as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self.handle(conn)
+                except socket.error:
+                    # The client went away.
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+
+    def close(self):
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def handle(self, conn):
+        kind, payload = recv_frame(conn)
+        if kind == STOP:
+            self.running = False
+            send_frame(conn, EXIT, '0')
+        elif kind == REQUEST:
+            argv, cwd = marshal.loads(payload)
+            status = run_command(argv, cwd, SocketWriter(conn, STDOUT),
+                                 SocketWriter(conn, STDERR))
+            send_frame(conn, EXIT, str(status))
+
+
+def run_command(argv, cwd, stdout, stderr):
+    """Run the xatag command line argv in cwd, returning the exit status.
+
+    sys.stdout and sys.stderr are replaced by stdout and stderr while the
+    command runs, and sys.stdin by an empty file.
+    """
+    import traceback
+    from StringIO import StringIO
+    import xatag.cli as cli
+    import xatag.tag_index as tag_index
+    import xatag.warn
+    saved = (sys.stdout, sys.stderr, sys.stdin, os.getcwd())
+    sys.stdout, sys.stderr, sys.stdin = stdout, stderr, StringIO()
+    # warnings.warn() only prints a message once per process; make that once
+    # per command.
+    registry = xatag.warn.__dict__.get('__warningregistry__')
+    xatag.warn.__warningregistry__ = {}
+    status = 0
+    try:
+        try:
+            os.chdir(cwd)
+        except OSError:
+            sys.exit("cannot change to directory: " + cwd)
+        cli.run_cli(constants.XATAG_USAGE, argv)
+    except SystemExit as e:
+        status = exit_status(e, stderr)
+    except Exception:
+        traceback.print_exc(file=stderr)
+        status = 1
+    finally:
+        tag_index.commit_tag_indexes()
+        sys.stdout, sys.stderr, sys.stdin = saved[:3]
+        if registry is None:
+            del xatag.warn.__warningregistry__
+        else:
+            xatag.warn.__warningregistry__ = registry
+        os.chdir(saved[3])
+    return status
@@ -0,0 +1,76 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The format of 'xatag --export' and 'xatag --import' is newline delimited
+# JSON, with one object per tagged file:
+#
+#     {"inode":1234,"path":"music/a.mp3","tags":{"genre":["indie","pop"]}}
+#
+# Paths are written as they were found, so a tree exported with a relative
+# path can be imported somewhere else.  The inode is only informational.
+# Strings are written with only ASCII characters, escaping the rest, and
+# are read back as UTF-8.
+
+import json
+
+from xatag.warn import warn
+
+
+def format_record(fname, tag_dict, st):
+    """Return the line representing fname with the stat st and tag_dict."""
+    record = {'path': fname, 'inode': st.st_ino, 'tags': tag_dict}
+    return json.dumps(record, sort_keys=True, separators=(',', ':')) + "\n"
+
+
+def _to_str(s):
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    if not isinstance(s, str):
+        raise ValueError("not a string: %r" % (s,))
+    return s
+
+
+def parse_record(line):
+    """Return the (path, tag_dict) in line, or raise ValueError."""
+    record = json.loads(line)
+    if not isinstance(record, dict) or not isinstance(record.get('tags'),
+                                                      dict):
+        raise ValueError("not a tag record")
+    path = _to_str(record.get('path'))
+    tag_dict = {}
+    for key, values in record['tags'].items():
+        if not isinstance(values, list):
+            raise ValueError("tag values are not a list")
+        tag_dict[_to_str(key)] = [_to_str(v) for v in values]
+    return path, tag_dict
+
+
+def read_records(lines, name='-', invalid=None):
+    """Yield (path, tag_dict) for each record in lines.
+
+    Blank lines are skipped, and lines that can't be parsed are skipped with
+    a warning that names the line, after calling invalid (if it's given)
+    with the line number.  name is the file the lines come from.
+    """
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_record(line)
+        except ValueError as e:
+            if invalid is not None:
+                invalid(lineno)
+            warn("%s:%d: invalid tag record: %s" % (name, lineno, e))
@@ -0,0 +1,123 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The machine readable output formats of --format, for programs that would
+# otherwise have to parse the padded text that xatag prints for people:
+#
+# * json: a JSON array with an object for each file,
+#       {"path":"a.mp3","tags":{"genre":["indie","pop"]}}
+# * ndjson: the same objects, one per line.
+# * tsv: a line for each tag of each file, with the path, key and value
+#   separated by tabs.  Backslashes, tabs and newlines in them are escaped
+#   as \\, \t and \n.
+# * null: the same three fields, each followed by a NUL character, which
+#   needs no escaping.
+#
+# For the known tags (--used-tags), there is no path: json is one object of
+# keys and values, ndjson has an object with "key" and "values" for each
+# key, and tsv and null have just the key and value of each tag.
+#
+# Values are sorted, as when they are printed as text.
+
+import json
+
+import xatag.constants as constants
+
+TSV_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+def sorted_keys(tag_dict):
+    """Return the keys of tag_dict sorted, with the default key first."""
+    keys = sorted(tag_dict)
+    if constants.DEFAULT_TAG_KEY in tag_dict:
+        keys.remove(constants.DEFAULT_TAG_KEY)
+        keys.insert(0, constants.DEFAULT_TAG_KEY)
+    return keys
+
+
+def escape_tsv(field):
+    for char, escaped in TSV_ESCAPES:
+        if char in field:
+            field = field.replace(char, escaped)
+    return field
+
+
+def _to_json(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def _fields(prefix, tag_dict, end, sep, escape):
+    """Return a line (or record) for each tag, starting with prefix."""
+    return ''.join(prefix + escape(key) + sep + escape(value) + end
+                   for key in sorted_keys(tag_dict)
+                   for value in sorted(tag_dict[key]))
+
+
+def render_file(fname, tag_dict, fmt):
+    """Return the record for the tags of fname in the format fmt.
+
+    Raise UnicodeDecodeError if fmt is a JSON format and a string isn't
+    UTF-8.
+    """
+    if fmt in ('json', 'ndjson'):
+        tags = dict((k, sorted(v)) for k, v in tag_dict.items())
+        return _to_json({'path': fname, 'tags': tags}) + "\n"
+    elif fmt == 'tsv':
+        return _fields(escape_tsv(fname) + '\t', tag_dict, '\n', '\t',
+                       escape_tsv)
+    elif fmt == 'null':
+        return _fields(fname + '\0', tag_dict, '\0', '\0', str)
+    raise ValueError("unknown format: " + fmt)
+
+
+def render_known(tag_dict, fmt):
+    """Return the known tags in tag_dict in the format fmt."""
+    if fmt == 'json':
+        return _to_json(dict((k, sorted(v))
+                             for k, v in tag_dict.items())) + "\n"
+    elif fmt == 'ndjson':
+        return ''.join(_to_json({'key': key,
+                                 'values': sorted(tag_dict[key])}) + "\n"
+                       for key in sorted_keys(tag_dict))
+    elif fmt == 'tsv':
+        return _fields('', tag_dict, '\n', '\t', escape_tsv)
+    elif fmt == 'null':
+        return _fields('', tag_dict, '\0', '\0', str)
+    raise ValueError("unknown format: " + fmt)
+
+
+class JsonArrayWriter(object):
+    """Write the records written to it to out as the items of a JSON array.
+
+    Each call of write() has to be given a whole record.
+    """
+    def __init__(self, out):
+        self.out = out
+        self.started = False
+
+    def write(self, record):
+        if not record:
+            return
+        self.out.write((",\n" if self.started else "[\n") +
+                       record.rstrip("\n"))
+        self.started = True
+
+    def flush(self):
+        self.out.flush()
+
+    def close(self):
+        """End the array.  out isn't closed."""
+        self.out.write("\n]\n" if self.started else "[]\n")
@@ -28,3 +28,28 @@ def listify(arg):
         return [arg]
     else:
         return arg
+
+
+def ordered_thread_map(fun, iterable, jobs, window=None):
+    """Yield fun(item) for each item, computed by a pool of jobs threads.
+
+    Results are yielded in the same order as iterable.  At most window items
+    (by default, four per thread) are in flight at once, so iterable is
+    consumed lazily and can be arbitrarily long.
+    """
+    # Imported here since it's slow to import and rarely needed.
+    from multiprocessing.pool import ThreadPool
+    if window is None:
+        window = 4 * jobs
+    pool = ThreadPool(jobs)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(pool.apply_async(fun, (item,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
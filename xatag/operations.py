@@ -16,8 +16,6 @@
 
 import sys
 import os
-import xattr
-import subprocess
 # from recoll import recoll
 
 import xatag.tag_dict as xtd
@@ -26,6 +24,9 @@ from xatag.tag import Tag
 from xatag.warn import warn
 import xatag.config as config
 import xatag.constants as constants
+import xatag.tag_index as tag_index
+import xatag.recoll_spool as recoll_spool
+import xatag.trace as trace
 
 # Some functions below have the argument '**unused'.  That's to facilitate
 # passing the options array that is returned from docopt (after some fixing)
@@ -53,10 +54,36 @@ import xatag.constants as constants
 # program or in the xattr package.
 
 
-def add_tags(fname, tags, **unused):
-    """Add the given tags from the xatag managed xattr fields of fname."""
+# The functions that change the tags of a file return the resulting tag dict
+# of the file, and whether the file was changed.  Only the fields whose
+# values change are written, so when a file already has the tags asked for,
+# nothing is written; then its ctime stays the same, and it doesn't need to
+# be reindexed.
+
+
+def _finish(session, config_dir):
+    """Return (tag dict, modified) for a committed session.
+
+    If the file was modified, the tags are recorded in the tag index.
+    """
+    tag_dict = session.tag_dict()
+    if session.modified:
+        tag_index.record_tags(session.fname, tag_dict, config_dir=config_dir)
+    return tag_dict, session.modified
+
+
+def add_tags(fname, tags, config_dir=None, follow_symlinks=True, **unused):
+    """Add the given tags from the xatag managed xattr fields of fname.
+
+    Return the resulting tag dict of fname, and whether it was changed.
+    """
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        _add_tags(session, tags)
+    return _finish(session, config_dir)
+
+
+def _add_tags(session, tags):
     tags = xtd.tag_list_to_dict(tags)
-    attributes = xattr.xattr(fname)
     for key, value_list in tags.items():
         values_to_add = []
         for v in value_list:
@@ -66,35 +93,55 @@ def add_tags(fname, tags, **unused):
                 values_to_add.append(v)
         if len(values_to_add) != 0:
             xattr_key = attr.xatag_to_xattr_key(key)
-            if xattr_key in attributes.keys():
-                current_field = attributes[xattr_key]
-            else:
-                current_field = ''
+            current_field = session.get(xattr_key, '')
             new_field = attr.add_tag_values_to_xattr_value(current_field,
                                                            values_to_add)
-            attributes[xattr_key] = new_field
+            session[xattr_key] = new_field
+
+
+def set_tags(fname, tags, config_dir=None, follow_symlinks=True, **unused):
+    """Set any key mentioned in tags to the values in tags for that key.
+
+    Return the resulting tag dict of fname, and whether it was changed.
+    """
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        _set_tags(session, tags)
+    return _finish(session, config_dir)
 
 
-def set_tags(fname, tags, **unused):
-    """Set any key mentioned in tags to the values in tags for that key."""
+def _set_tags(session, tags):
     tags = xtd.tag_list_to_dict(tags)
-    attributes = xattr.xattr(fname)
     for k, v in tags.items():
         xattr_key = attr.xatag_to_xattr_key(k)
         xattr_value = attr.list_to_xattr_value(v)
         if xattr_value == '':
-            attributes.remove(xattr_key)
+            if xattr_key in session:
+                session.remove(xattr_key)
         else:
-            attributes[xattr_key] = xattr_value
+            session[xattr_key] = xattr_value
 
 
-def set_all_tags(fname, tags, **unused):
+def set_all_tags(fname, tags, config_dir=None, follow_symlinks=True,
+                 **unused):
     """Set and keep only the keys mentioned, removing all other keys."""
-    delete_all_tags(fname)
-    set_tags(fname, tags)
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        session.clear()
+        _set_tags(session, tags)
+    return _finish(session, config_dir)
 
 
-def delete_tags(fname, tags, complement=False, quiet=False, **unused):
+def restore_tags(fname, tag_dict, config_dir=None, follow_symlinks=True,
+                 **unused):
+    """Set the tags of fname to exactly those in tag_dict."""
+    tags = [Tag(k, v) for k, vlist in tag_dict.items() for v in vlist]
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        session.clear()
+        _set_tags(session, tags)
+    return _finish(session, config_dir)
+
+
+def delete_tags(fname, tags, complement=False, quiet=False, config_dir=None,
+                follow_symlinks=True, **unused):
     """Delete tags from fname.
 
     A tag with tag.value=='' will delete all tags for that key.
@@ -102,74 +149,78 @@ def delete_tags(fname, tags, complement=False, quiet=False, **unused):
     If complement is true, then delete all tags other than those given.
     """
     if complement:
-        return delete_other_tags(fname, tags, quiet=quiet)
+        return delete_other_tags(fname, tags, quiet=quiet,
+                                 config_dir=config_dir,
+                                 follow_symlinks=follow_symlinks)
     else:
-        return delete_these_tags(fname, tags, quiet=quiet)
+        return delete_these_tags(fname, tags, quiet=quiet,
+                                 config_dir=config_dir,
+                                 follow_symlinks=follow_symlinks)
 
 
-def delete_these_tags(fname, tags, quiet=False, **unused):
+def delete_these_tags(fname, tags, quiet=False, config_dir=None,
+                      follow_symlinks=True, **unused):
     """Delete the given tags from the xatag managed xattr fields of fname."""
     tags = xtd.tag_list_to_dict(tags)
-    attributes = xattr.xattr(fname)
-    for k, vlist in tags.items():
-        xattr_key = attr.xatag_to_xattr_key(k)
-        if xattr_key in attributes:
-            if '' in vlist:
-                attributes.remove(xattr_key)
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        for k, vlist in tags.items():
+            xattr_key = attr.xatag_to_xattr_key(k)
+            if xattr_key in session:
+                if '' in vlist:
+                    session.remove(xattr_key)
+                else:
+                    current_field = session[xattr_key]
+                    new_field = attr.remove_tag_values_from_xattr_value(
+                        current_field, vlist)
+                    # This is important when the user says 'key' but means
+                    # 'key:'
+                    if current_field == new_field and not quiet:
+                        warn(fname + ": tag key unchanged: " +
+                             (k or constants.DEFAULT_TAG_KEY))
+                    if new_field == '':
+                        if not quiet:
+                            warn(fname + ": removing empty tag key: " +
+                                 (k or constants.DEFAULT_TAG_KEY))
+                        session.remove(xattr_key)
+                    else:
+                        session[xattr_key] = new_field
+            # elif not quiet:
+            #     if k == '':
+            #         print("no simple tags not found")
+            #     else:
+            #         print("key not found: " + k)
+    return _finish(session, config_dir)
+
+
+def delete_other_tags(fname, tags, quiet=False, config_dir=None,
+                      follow_symlinks=True, out=sys.stdout, **unused):
+    """Delete tags other than the given tags from the xatag fields of fname."""
+    tags = xtd.tag_list_to_dict(tags)
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        for xattr_key in session.keys():
+            k = attr.xattr_to_xatag_key(xattr_key)
+            if k not in tags.keys():
+                session.remove(xattr_key)
             else:
-                current_field = attributes[xattr_key]
+                current_field = session[xattr_key]
+                vlist = tags[k]
                 new_field = attr.remove_tag_values_from_xattr_value(
-                    current_field, vlist)
-                # This is important when the user says 'key' but means 'key:'
-                if current_field == new_field and not quiet:
-                    warn(fname + ": tag key unchanged: " +
-                         (k or constants.DEFAULT_TAG_KEY))
+                    current_field, vlist, complement=True)
                 if new_field == '':
                     if not quiet:
-                        warn(fname + ": removing empty tag key: " +
+                        warn("removing empty tag key:" +
                              (k or constants.DEFAULT_TAG_KEY))
-                    attributes.remove(xattr_key)
+                    session.remove(xattr_key)
                 else:
-                    attributes[xattr_key] = new_field
-        # elif not quiet:
-        #     if k == '':
-        #         print("no simple tags not found")
-        #     else:
-        #         print("key not found: " + k)
-
-
-def delete_other_tags(fname, tags, quiet=False, out=sys.stdout, **unused):
-    """Delete tags other than the given tags from the xatag fields of fname."""
-    tags = xtd.tag_list_to_dict(tags)
-    attributes = xattr.xattr(fname)
-    # We have to be careful here, because we're iterating over every xattr,
-    # not just those in the xatag namespace.
-    for xattr_key in attributes.keys():
-        if not attr.is_xatag_xattr_key(xattr_key):
-            continue
-        k = attr.xattr_to_xatag_key(xattr_key)
-        if k not in tags.keys():
-            attributes.remove(xattr_key)
-        else:
-            current_field = attributes[xattr_key]
-            vlist = tags[k]
-            new_field = attr.remove_tag_values_from_xattr_value(
-                current_field, vlist, complement=True)
-            if new_field == '':
-                if not quiet:
-                    warn("removing empty tag key:" +
-                         (k or constants.DEFAULT_TAG_KEY))
-                attributes.remove(xattr_key)
-            else:
-                attributes[xattr_key] = new_field
+                    session[xattr_key] = new_field
+    return _finish(session, config_dir)
 
 
-def delete_all_tags(fname, **unused):
+def delete_all_tags(fname, config_dir=None, follow_symlinks=True, **unused):
     """Delete all xatag managed xattr fields of fname."""
-    attributes = xattr.xattr(fname)
-    for key in attributes:
-        if attr.is_xatag_xattr_key(key):
-            attributes.remove(key)
+    with attr.FileTagSession(fname, follow_symlinks) as session:
+        session.clear()
+    return _finish(session, config_dir)
 
 
 def print_file_tags(fname, tags=None, subset=False, complement=False,
@@ -178,8 +229,15 @@ def print_file_tags(fname, tags=None, subset=False, complement=False,
                     one_line=False, key_val_pairs=False,
                     for_recoll=False, no_print_filename=False,
                     min_padding=None, max_padding=None,
-                    tag_prefix=None,
-                    out=None, **unused):
+                    tag_prefix=None, tag_dict=None, follow_symlinks=True,
+                    format='text', out=None, **unused):
+    """Print the tags of fname.
+
+    If tag_dict is given, it is used as the current tags of fname instead of
+    reading the extended attributes again.  If format isn't 'text', the tags
+    are printed as a record in that format (see formats.py), and the other
+    printing options are ignored.
+    """
     # We need 'out' to be set to the current value of sys.stdout, in case
     # stdout is captured for tests or something.  So we can't say
     # "out=sys.stdout" above.
@@ -199,7 +257,8 @@ def print_file_tags(fname, tags=None, subset=False, complement=False,
             padding = min(padding, max_padding)
         prefix = fname + fsep + (" " * padding)
 
-    tag_dict = attr.read_tag_dict(fname)
+    if tag_dict is None:
+        tag_dict = attr.read_tag_dict(fname, follow_symlinks)
     if subset:
         tag_dict = subsetted_tags(tag_dict, tags, complement=complement)
     elif terse:
@@ -212,24 +271,42 @@ def print_file_tags(fname, tags=None, subset=False, complement=False,
         tag_dict = subsetted_tags(tag_dict, just_tag_keys_dict,
                                   complement=complement)
 
-    xtd.print_tag_dict(tag_dict, prefix=prefix, ksep=ksep,
-                       vsep=vsep, one_line=one_line,
-                       key_val_pairs=key_val_pairs,
-                       for_recoll=for_recoll, tag_prefix=tag_prefix,
-                       min_padding=min_padding, max_padding=max_padding,
-                       terse=terse,
-                       out=out)
+    if format != 'text':
+        import xatag.formats as formats
+        with trace.span('print'):
+            try:
+                out.write(formats.render_file(fname, tag_dict, format))
+            except UnicodeDecodeError:
+                warn("cannot print a path or tag that isn't UTF-8 as JSON: "
+                     + fname)
+        return
+
+    with trace.span('print'):
+        xtd.print_tag_dict(tag_dict, prefix=prefix, ksep=ksep,
+                           vsep=vsep, one_line=one_line,
+                           key_val_pairs=key_val_pairs,
+                           for_recoll=for_recoll, tag_prefix=tag_prefix,
+                           min_padding=min_padding, max_padding=max_padding,
+                           terse=terse,
+                           out=out)
 
 
 def print_known_tags(tags=None, complement=False,
                      ksep=':', vsep=' ',
                      one_line=False, key_val_pairs=False,
-                     out=None, **unused):
+                     format='text', out=None, **unused):
     if not out:
         out = sys.stdout
     known_tags = config.load_known_tags()
     if tags:
         known_tags = subsetted_tags(known_tags, tags, complement=complement)
+    if format != 'text':
+        import xatag.formats as formats
+        try:
+            out.write(formats.render_known(known_tags or {}, format))
+        except UnicodeDecodeError:
+            warn("cannot print a tag that isn't UTF-8 as JSON")
+        return
     if known_tags:
         xtd.print_tag_dict(known_tags, ksep=ksep, vsep=vsep, one_line=one_line,
                            key_val_pairs=key_val_pairs,
@@ -248,18 +325,26 @@ def subsetted_tags(source_tags, tags=False, complement=False, **unused):
 
 
 def copy_tags(source_tags, destination, tags=False, complement=False,
-              **unused):
+              config_dir=None, follow_symlinks=True, **unused):
     """Copy tags in dict souce_tags to each file in destinations."""
+    with attr.FileTagSession(destination, follow_symlinks) as session:
+        _copy_tags(source_tags, session, tags, complement)
+    return _finish(session, config_dir)
+
+
+def _copy_tags(source_tags, session, tags, complement):
     source_tags = subsetted_tags(source_tags, tags, complement=complement)
-    new_tags = xtd.merge_tags(source_tags, attr.read_tag_dict(destination))
-    set_tags(destination, new_tags)
+    new_tags = xtd.merge_tags(source_tags, session.tag_dict())
+    _set_tags(session, new_tags)
 
 
 def copy_tags_over(source_tags, destination, tags=False, complement=False,
-                   **unused):
+                   config_dir=None, follow_symlinks=True, **unused):
     """Copy xatag managed xattr fields, removing all other tags."""
-    delete_all_tags(destination)
-    copy_tags(source_tags, destination, tags, complement)
+    with attr.FileTagSession(destination, follow_symlinks) as session:
+        session.clear()
+        _copy_tags(source_tags, session, tags, complement)
+    return _finish(session, config_dir)
 
 
 def check_new_tags(tags, add=False, quiet=False, config_dir=None,
@@ -323,30 +408,14 @@ def check_new_tags(tags, add=False, quiet=False, config_dir=None,
         config.update_recoll_fields(known_keys + new_keys)
 
 
-def update_recoll_index(files, no_index=False, **other_args):
+def update_recoll_index(files, no_index=False, config_dir=None,
+                        **other_args):
     """Try to update the recoll index for files."""
 
-    if no_index:
-        return
-
     if 'destinations' in other_args:
-        files += other_args['destinations']
-
-    # Creating the rclmonixnow file is only necessary if the recollindex call
-    # is blocked, meaning that the the Recoll daemon is running. However,
-    # recollindex takes a perceptible amount of time, so let's just do both so
-    # we can run recollindex in the background and not wait for the exit
-    # status.
-    try:
-        rcl_dir = config.find_recoll_base_config_dir()
-        if rcl_dir:
-            open(os.path.join(rcl_dir, 'rclmonixnow'), 'w').close()
-        # cwd = os.environ.get('PWD')
-        # if cwd:
-            # files = [os.path.join(cwd, fname) for fname in files]
-        with open('/dev/null', 'w') as devnull:
-            # Use Popen() instead of call() to run in the background.
-            subprocess.Popen(['recollindex', '-i'] + files,
-                             stdout=devnull, stderr=devnull)
-    except:
-        warn("There was a problem updating the Recoll index.")
+        files = files + other_args['destinations']
+
+    with recoll_spool.RecollUpdate(no_index=no_index,
+                                   config_dir=config_dir) as update:
+        for fname in files:
+            update.add(fname)
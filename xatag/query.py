@@ -0,0 +1,325 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Tag queries look like
+#
+#     genre:indie AND NOT tag:draft OR artist:"The XX"
+#
+# Terms are written like the tags given on the command line: 'key:value',
+# 'value' for the default key, or 'key:' for any value of key.  Several
+# values can be given for a key, separated by semicolons, to match any of
+# them.  Quotes group words into a single key or value.  NOT binds tightest,
+# then AND, then OR; parentheses can be used to group, and two terms next to
+# each other without an operator are ANDed.
+#
+# A query is parsed into a tree of nodes, which can either be compiled to a
+# predicate on tag dicts (to test files one at a time while walking a
+# directory) or evaluated against the posting lists of the tag index.  Both
+# give the same answer for the same tags.
+
+import errno
+import os
+import time
+
+from xatag.attributes import read_tag_dict
+import xatag.tag_index as tag_index
+import xatag.walk as walk
+from xatag.tag import format_tag_key, format_tag_value
+from xatag.warn import warn
+import xatag.constants as constants
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def tokenize(query_string):
+    """Split query_string into '(', ')', operators, and (key, value) terms."""
+    tokens = []
+    i = 0
+    n = len(query_string)
+    while i < n:
+        c = query_string[i]
+        if c.isspace():
+            i += 1
+        elif c in '()':
+            tokens.append(c)
+            i += 1
+        else:
+            word = []
+            colon = None
+            quoted = False
+            while i < n:
+                c = query_string[i]
+                if c in '"\'':
+                    end = query_string.find(c, i + 1)
+                    if end == -1:
+                        raise QuerySyntaxError("unterminated quote: " +
+                                               query_string[i:])
+                    word.append(query_string[i + 1:end])
+                    quoted = True
+                    i = end + 1
+                elif c.isspace() or c in '()':
+                    break
+                else:
+                    if c == ':':
+                        colon = len(''.join(word))
+                    word.append(c)
+                    i += 1
+            word = ''.join(word)
+            if word in OPERATORS and not quoted:
+                tokens.append(word)
+            elif colon is None:
+                tokens.append((constants.DEFAULT_TAG_KEY, word))
+            else:
+                tokens.append((word[:colon], word[colon + 1:]))
+    return tokens
+
+
+class Term(object):
+    """Match files that have key with any of values; '' means any value."""
+    def __init__(self, key, values):
+        self.key = format_tag_key(key) or constants.DEFAULT_TAG_KEY
+        self.values = set(format_tag_value(v) for v in values)
+
+    def compile(self):
+        key = self.key
+        if '' in self.values:
+            return lambda tag_dict: bool(tag_dict.get(key))
+        values = self.values
+        return lambda tag_dict: any(v in values
+                                    for v in tag_dict.get(key, ()))
+
+    def evaluate(self, index, universe):
+        if '' in self.values:
+            paths = index.paths_with_tag(self.key)
+        else:
+            paths = set()
+            for value in self.values:
+                paths |= index.paths_with_tag(self.key, value)
+        return paths & universe
+
+    def __repr__(self):
+        return "Term(%r, %r)" % (self.key, sorted(self.values))
+
+
+class Not(object):
+    def __init__(self, child):
+        self.child = child
+
+    def compile(self):
+        child = self.child.compile()
+        return lambda tag_dict: not child(tag_dict)
+
+    def evaluate(self, index, universe):
+        return universe - self.child.evaluate(index, universe)
+
+    def __repr__(self):
+        return "Not(%r)" % (self.child,)
+
+
+class And(object):
+    def __init__(self, children):
+        self.children = children
+
+    def compile(self):
+        children = [c.compile() for c in self.children]
+        return lambda tag_dict: all(c(tag_dict) for c in children)
+
+    def evaluate(self, index, universe):
+        paths = universe
+        for child in self.children:
+            paths = child.evaluate(index, paths)
+            if not paths:
+                break
+        return paths
+
+    def __repr__(self):
+        return "And(%r)" % (self.children,)
+
+
+class Or(object):
+    def __init__(self, children):
+        self.children = children
+
+    def compile(self):
+        children = [c.compile() for c in self.children]
+        return lambda tag_dict: any(c(tag_dict) for c in children)
+
+    def evaluate(self, index, universe):
+        paths = set()
+        for child in self.children:
+            paths |= child.evaluate(index, universe - paths)
+        return paths
+
+    def __repr__(self):
+        return "Or(%r)" % (self.children,)
+
+
+def parse(tokens):
+    """Parse a list of tokens from tokenize() into a query tree."""
+    tokens = list(tokens)
+    pos = [0]
+
+    def peek():
+        if pos[0] < len(tokens):
+            return tokens[pos[0]]
+        return None
+
+    def take():
+        token = peek()
+        pos[0] += 1
+        return token
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == 'OR':
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and():
+        children = [parse_not()]
+        while peek() is not None and peek() not in ('OR', ')'):
+            if peek() == 'AND':
+                take()
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not():
+        if peek() == 'NOT':
+            take()
+            return Not(parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = take()
+        if token == '(':
+            node = parse_or()
+            if take() != ')':
+                raise QuerySyntaxError("missing ')'")
+            return node
+        if token is None:
+            raise QuerySyntaxError("unexpected end of query")
+        if token in OPERATORS or token == ')':
+            raise QuerySyntaxError("unexpected " + token)
+        key, value = token
+        return Term(key, value.split(constants.XATTR_FIELD_SEPARATOR))
+
+    if not tokens:
+        raise QuerySyntaxError("empty query")
+    tree = parse_or()
+    if peek() is not None:
+        raise QuerySyntaxError("unexpected " + str(peek()))
+    return tree
+
+
+class Query(object):
+    """A compiled tag query."""
+    def __init__(self, query_string):
+        self.query_string = query_string
+        self.tree = parse(tokenize(query_string))
+        self.matches = self.tree.compile()
+
+    def select(self, index, universe):
+        """Return the paths in the set universe that match, using index."""
+        return self.tree.evaluate(index, universe)
+
+
+class SearchStats(object):
+    """Count how many files a search looked at, and time it."""
+    def __init__(self):
+        self.scanned = 0
+        self.matched = 0
+        self.start = time.time()
+
+    def summary(self):
+        return ("%d of %d files matched in %.3f seconds" %
+                (self.matched, self.scanned, time.time() - self.start))
+
+
+def _read_tags(fname, follow_symlinks):
+    """Return the tag dict of fname, or None after warning if it can't."""
+    try:
+        return read_tag_dict(fname, follow_symlinks)
+    except (IOError, KeyError) as e:
+        if getattr(e, 'errno', None) == errno.ENOENT:
+            warn("path does not exist: " + fname)
+        else:
+            warn("could not read extended attributes: " + fname)
+        return None
+
+
+def search_files(query, paths, stats, include=(), exclude=(),
+                 one_file_system=False, follow_symlinks=True):
+    """Yield the files under paths whose tags match query."""
+    for fname in walk.walk_paths(paths, recursive=True, include=include,
+                                 exclude=exclude,
+                                 one_file_system=one_file_system):
+        tag_dict = _read_tags(fname, follow_symlinks)
+        if tag_dict is None:
+            continue
+        stats.scanned += 1
+        if query.matches(tag_dict):
+            stats.matched += 1
+            yield fname
+
+
+def search_index(query, paths, stats, index, include=(), exclude=(),
+                 one_file_system=False, follow_symlinks=True):
+    """Return the files under paths whose tags match query, using index.
+
+    The same files are walked as by search_files, and the result is the
+    same, in the same order, but only the files that aren't current in the
+    index (see TagIndex.lookup) have their extended attributes read; the
+    rest are only stat'ed, and answered from the posting lists.  So this
+    still walks the whole tree; what it saves is reading the attributes.
+    """
+    stored = index.file_stats()
+    walked = []
+    universe = set()
+    for fname in walk.walk_paths(paths, recursive=True, include=include,
+                                 exclude=exclude,
+                                 one_file_system=one_file_system):
+        path = tag_index.index_path(fname)
+        try:
+            st = os.stat(path)
+        except OSError:
+            warn("path does not exist: " + fname)
+            continue
+        if stored.get(path) == (st.st_dev, st.st_ino,
+                                st.st_mtime, st.st_ctime):
+            universe.add(path)
+            walked.append((fname, path))
+        else:
+            walked.append((fname, None))
+    selected = query.select(index, universe)
+    matches = []
+    for fname, path in walked:
+        if path is None:
+            tag_dict = _read_tags(fname, follow_symlinks)
+            if tag_dict is None:
+                continue
+            matched = query.matches(tag_dict)
+        else:
+            matched = path in selected
+        stats.scanned += 1
+        if matched:
+            matches.append(fname)
+    stats.matched = len(matches)
+    return matches
@@ -0,0 +1,118 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# 'xatag --recoll-execm' is a persistent Recoll handler: it is started once,
+# and then answers a request for each file on stdin and stdout, using the
+# protocol of Recoll's "execm" filters (see rclexecm.py in Recoll).  That
+# saves starting Python for every file that is indexed.
+#
+# A message, in either direction, is a list of fields followed by an empty
+# line.  Each field is a line with a name, a colon, and the length of its
+# data, followed by that many bytes of data:
+#
+#     Filename: 19
+#     /home/me/notes.txt
+#
+# Recoll sends the name of the file in the Filename field.  The answer has
+# the same text that 'xatag --recoll-tags FILE' prints as the Document, and
+# each of its 'xa:key=values' lines as a field of its own, and then Eofnext
+# to say that the file has no more documents in it.  If the extended
+# attributes can't be read, the answer is Fileerror instead.
+
+from StringIO import StringIO
+
+from xatag.attributes import read_tag_dict
+import xatag.tag_dict as xtd
+from xatag.warn import warn
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def read_message(stream):
+    """Return the fields of the next message as a dict, or None at EOF.
+
+    Field names are lowercased; older versions of Recoll capitalize them.
+    """
+    fields = {}
+    while True:
+        line = stream.readline()
+        if not line:
+            if fields:
+                raise ProtocolError("end of input in the middle of a message")
+            return None
+        line = line.rstrip('\n')
+        if not line:
+            return fields
+        # Names can have colons in them ('xa:genre: 5'), so split the line
+        # as Recoll does, on white space.
+        tokens = line.split()
+        if (len(tokens) != 2 or not tokens[0].endswith(':') or
+                not tokens[1].isdigit()):
+            raise ProtocolError("bad field: " + line)
+        size = int(tokens[1])
+        data = stream.read(size)
+        if len(data) != size:
+            raise ProtocolError("end of input in the middle of a message")
+        fields[tokens[0][:-1].lower()] = data
+
+
+def write_message(stream, fields):
+    """Write the (name, data) pairs in fields as one message."""
+    parts = []
+    for name, data in fields:
+        parts.append("%s: %d\n" % (name, len(data)))
+        parts.append(data)
+    parts.append("\n")
+    stream.write(''.join(parts))
+    stream.flush()
+
+
+def recoll_tags(fname, follow_symlinks=True):
+    """Return what 'xatag --recoll-tags fname' prints."""
+    out = StringIO()
+    xtd.print_tag_dict(read_tag_dict(fname, follow_symlinks),
+                       for_recoll=True, out=out)
+    return out.getvalue()
+
+
+def answer(fields, follow_symlinks=True):
+    """Return the fields of the answer to the request fields."""
+    fname = fields.get('filename', '')
+    try:
+        document = recoll_tags(fname, follow_symlinks)
+    except (IOError, OSError, KeyError):
+        warn("could not read extended attributes: " + fname)
+        return [('Fileerror', '')]
+    reply = []
+    if document:
+        reply.append(('Document', document))
+    reply.append(('Mimetype', 'text/plain'))
+    for line in document.splitlines():
+        name, _, values = line.partition('=')
+        reply.append((name, values))
+    reply.append(('Eofnext', ''))
+    return reply
+
+
+def serve(inp, out, follow_symlinks=True):
+    """Answer the requests on inp until it ends."""
+    while True:
+        fields = read_message(inp)
+        if fields is None:
+            return
+        write_message(out, answer(fields, follow_symlinks))
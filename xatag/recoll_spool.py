@@ -0,0 +1,266 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Files whose tags changed have to be reindexed by Recoll.  Instead of
+# starting recollindex every time xatag is run, the changed paths are
+# appended to a spool file in the xatag config directory.  The spool is
+# flushed, with one recollindex call for all of the (deduplicated) paths in
+# it, when it gets big enough or when enough time has passed since the last
+# flush.  So a script that calls xatag in a loop starts recollindex only
+# now and then.
+#
+# When a call leaves paths in the spool because the last flush was too
+# recent, it starts a background process that waits until the flush is due
+# and then does it, unless one is already waiting.  So every change reaches
+# the index within about a minute, even if it was the last xatag call for a
+# while.  'xatag --flush-index' flushes whatever is left right away.
+
+import fcntl
+import os
+import sys
+import time
+
+import xatag.config as config
+import xatag.constants as constants
+import xatag.trace as trace
+from xatag.warn import warn
+
+def spool_file(config_dir):
+    return os.path.join(config_dir, constants.RECOLL_SPOOL_FILE)
+
+
+def stamp_file(config_dir):
+    return spool_file(config_dir) + '.flushed'
+
+
+def flusher_file(config_dir):
+    return spool_file(config_dir) + '.flusher'
+
+
+def spool_paths(paths, config_dir):
+    """Append paths to the spool in config_dir."""
+    data = ''.join(os.path.abspath(p) + '\0' for p in paths)
+    with open(spool_file(config_dir), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(data)
+
+
+def take_spooled_paths(config_dir):
+    """Empty the spool in config_dir, returning the unique paths in it."""
+    try:
+        f = open(spool_file(config_dir), 'r+')
+    except IOError:
+        return []
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        data = f.read()
+        f.seek(0)
+        f.truncate()
+    seen = set()
+    paths = []
+    for path in data.split('\0'):
+        if path and path not in seen:
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def spool_size(config_dir):
+    try:
+        return os.path.getsize(spool_file(config_dir))
+    except OSError:
+        return 0
+
+
+def seconds_until_due(config_dir):
+    """Return how long until enough time has passed since the last flush."""
+    try:
+        last_flush = os.path.getmtime(stamp_file(config_dir))
+    except OSError:
+        return 0
+    return max(0, last_flush + constants.RECOLL_SPOOL_MAX_AGE - time.time())
+
+
+def spool_is_due(config_dir):
+    """Return True if the spool is big or old enough to be flushed."""
+    size = spool_size(config_dir)
+    if size == 0:
+        return False
+    if size >= constants.RECOLL_SPOOL_MAX_SIZE:
+        return True
+    return seconds_until_due(config_dir) == 0
+
+
+def flush_spool(config_dir):
+    """Run recollindex on the spooled paths, and return how many there were."""
+    paths = take_spooled_paths(config_dir)
+    with open(stamp_file(config_dir), 'w'):
+        pass
+    if paths:
+        run_recollindex(paths)
+    return len(paths)
+
+
+def flush_is_scheduled(config_dir):
+    """Return True if a process is waiting to flush the spool."""
+    try:
+        f = open(flusher_file(config_dir), 'a')
+    except IOError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            return True
+    return False
+
+
+def schedule_flush(config_dir):
+    """Start a background process to run deferred_flush(config_dir)."""
+    import subprocess
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_dir] + [p for p in [env.get('PYTHONPATH')] if p])
+    try:
+        with open('/dev/null', 'r+') as devnull:
+            subprocess.Popen([sys.executable, '-c',
+                              'import sys, xatag.recoll_spool as s; '
+                              's.deferred_flush(sys.argv[1])', config_dir],
+                             stdin=devnull, stdout=devnull, stderr=devnull,
+                             env=env, close_fds=True, preexec_fn=os.setsid)
+    except OSError:
+        warn("cannot start a process to update the Recoll index later; "
+             "run 'xatag --flush-index'")
+
+
+def deferred_flush(config_dir):
+    """Wait until the spool is due, and flush it, until it stays empty.
+
+    Return at once if another process is already doing this.
+    """
+    with open(flusher_file(config_dir), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            return
+        while spool_size(config_dir):
+            time.sleep(seconds_until_due(config_dir))
+            flush_spool(config_dir)
+
+
+def run_recollindex(paths):
+    """Start one recollindex in the background to reindex paths."""
+    # Creating the rclmonixnow file is only necessary if the recollindex call
+    # is blocked, meaning that the the Recoll daemon is running. However,
+    # recollindex takes a perceptible amount of time, so let's just do both so
+    # we can run recollindex in the background and not wait for the exit
+    # status.
+    #
+    # The paths are given on stdin, one per line, rather than as arguments,
+    # so that a single recollindex (and a single writer of the Xapian
+    # database) handles all of them, however many there are.
+    import subprocess
+    import tempfile
+    lines = []
+    for path in paths:
+        if '\n' in path:
+            warn("cannot reindex a file name with a newline: " + path)
+        else:
+            lines.append(path + '\n')
+    if not lines:
+        return
+    try:
+        with trace.span('recollindex'):
+            rcl_dir = config.find_recoll_base_config_dir()
+            if rcl_dir:
+                open(os.path.join(rcl_dir, 'rclmonixnow'), 'w').close()
+            with tempfile.TemporaryFile() as names:
+                names.write(''.join(lines))
+                names.seek(0)
+                with open('/dev/null', 'w') as devnull:
+                    # Use Popen() instead of call() to run in the background.
+                    subprocess.Popen(['recollindex', '-i'], stdin=names,
+                                     stdout=devnull, stderr=devnull)
+    except:
+        warn("There was a problem updating the Recoll index.")
+
+
+class RecollUpdate(object):
+    """Collect the paths that need reindexing during one xatag command.
+
+    Paths are spooled in batches as they are added, and when the update is
+    closed the spool is flushed if it is due.  If there is no config
+    directory to keep the spool in, recollindex is run on each batch.
+
+    If hold is true, each path is kept (once) until the update is closed,
+    and the spool is then flushed whether or not it is due.  That's for
+    'xatag --batch', which runs many commands that may change the same files.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, no_index=False, config_dir=None, hold=False,
+                 **unused):
+        self.no_index = no_index
+        self.config_dir = config.guess_config_dir(config_dir)
+        if not os.path.isdir(self.config_dir):
+            self.config_dir = None
+        self.hold = hold
+        self.held = set()
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, fname):
+        if self.no_index:
+            return
+        if self.hold:
+            if fname not in self.held:
+                self.held.add(fname)
+                self.pending.append(fname)
+            return
+        self.pending.append(fname)
+        if len(self.pending) >= self.BATCH_SIZE:
+            self._send()
+
+    def _send(self):
+        if self.config_dir:
+            try:
+                spool_paths(self.pending, self.config_dir)
+            except IOError:
+                warn("cannot write to the Recoll spool: " +
+                     spool_file(self.config_dir))
+                run_recollindex(self.pending)
+        else:
+            run_recollindex(self.pending)
+        self.pending = []
+
+    def close(self):
+        if self.no_index:
+            return
+        if self.pending:
+            self._send()
+        if not self.config_dir:
+            return
+        if self.hold or spool_is_due(self.config_dir):
+            flush_spool(self.config_dir)
+        elif (spool_size(self.config_dir) and
+                not flush_is_scheduled(self.config_dir)):
+            schedule_flush(self.config_dir)
@@ -17,13 +17,21 @@
 import xatag.constants as constants
 
 
-class Tag:
+# Scans and exports make a Tag for every value of every file, so Tags are
+# kept small: they have slots instead of a __dict__, and the formatted keys
+# and values are interned, so that each distinct string is kept only once
+# however many Tags have it.  Tags are immutable, so they can be shared and
+# used as dict keys.
+
+class Tag(object):
     """Simple container for tag key/value pairs."""
+    __slots__ = ('key', 'value')
+
     def __init__(self, key, value=''):
         if key == '':
             key = constants.DEFAULT_TAG_KEY
-        self.key = format_tag_key(key)
-        self.value = format_tag_value(value)
+        _set_key(self, format_tag_key(key))
+        _set_value(self, format_tag_value(value))
 
     @classmethod
     def from_string(cls, tag_str):
@@ -56,16 +64,52 @@ class Tag:
 
     def __eq__(self, other):
         if type(other) is type(self):
-            return self.__dict__ == other.__dict__
+            return self.key == other.key and self.value == other.value
         return False
 
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
         return hash((self.key, self.value))
 
+    def __setattr__(self, name, value):
+        raise AttributeError("Tags can't be changed")
+
+    def __delattr__(self, name):
+        raise AttributeError("Tags can't be changed")
+
+    def __reduce__(self):
+        return (self.__class__, (self.key, self.value))
+
+
+_set_key = Tag.key.__set__
+_set_value = Tag.value.__set__
+
+# The formatted versions of the keys and values seen so far.  It's cleared
+# when it gets this big, so that a scan of many distinct values doesn't
+# keep them all.
+FORMAT_CACHE_SIZE = 100000
+_formatted = {}
+
+
+def _format(string):
+    """Return string with white space collapsed, interned if it's a str."""
+    if type(string) is not str:
+        # Only str can be interned, and u'a' would find 'a' in the cache.
+        return " ".join(string.strip().split())
+    formatted = _formatted.get(string)
+    if formatted is None:
+        formatted = intern(" ".join(string.strip().split()))
+        if len(_formatted) >= FORMAT_CACHE_SIZE:
+            _formatted.clear()
+        _formatted[string] = formatted
+    return formatted
+
 
 def format_tag_key(string):
     """Format tag key string when reading or writing to extended attributes."""
-    return " ".join(string.strip().split())
+    return _format(string)
 
 
 # quote when printing, not when reading or writing
@@ -76,7 +120,7 @@ def format_tag_value(string, quote=False):
     with whitespace.
 
     """
-    string = " ".join(string.strip().split())
+    string = _format(string)
     if quote:
         string = "'" + string + "'" if ' ' in string else string
     return string
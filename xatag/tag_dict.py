@@ -22,6 +22,41 @@ from xatag.tag import format_tag_value
 import xatag.constants as constants
 import xatag.localrecoll as lrcl
 
+class TagSet(object):
+    """An ordered set of tag values.
+
+    Values are kept in the order they were first added, and membership tests
+    take constant time, so building a TagSet from n values is O(n).
+    """
+    __slots__ = ('_values', '_members')
+
+    def __init__(self, values=()):
+        self._values = []
+        self._members = set()
+        self.update(values)
+
+    def add(self, value):
+        if value not in self._members:
+            self._members.add(value)
+            self._values.append(value)
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        return value in self._members
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def to_list(self):
+        return list(self._values)
+
+
 def tag_list_to_dict(tags):
     """Convert a list of Tags to a dict, where values are lists of strings."""
     try:
@@ -44,15 +79,34 @@ def print_tag_dict(tag_dict, prefix='', ksep=':', vsep=' ',
     """Print the tags for a file in a nice way.
 
     If for_recoll is True, then most of the options will be overwritten;
-    tag_prefix can still be altered, though.
+    tag_prefix can still be altered, though.  The output is written with
+    one call to out.write(); see render_tag_dict().
     """
-
     # We need 'out' to be set to the current value of sys.stdout, in case
     # stdout is captured for tests or something.  So we can't say
     # "out=sys.stdout" above.
     if not out:
         out = sys.stdout
-
+    text = render_tag_dict(tag_dict, prefix=prefix, ksep=ksep, vsep=vsep,
+                           one_line=one_line, key_val_pairs=key_val_pairs,
+                           tag_prefix=tag_prefix, for_recoll=for_recoll,
+                           max_padding=max_padding, min_padding=min_padding,
+                           terse=terse)
+    if text:
+        out.write(text)
+
+
+def render_tag_dict(tag_dict, prefix='', ksep=':', vsep=' ',
+                    one_line=False, key_val_pairs=False,
+                    tag_prefix=None, for_recoll=False,
+                    max_padding=None,
+                    min_padding=None,
+                    terse=False):
+    """Return what print_tag_dict() prints, as one string.
+
+    Listing many files is mostly spent writing, so the pieces are joined
+    once instead of being written one by one.
+    """
     if for_recoll:
         ksep = "="
         vsep = '; '
@@ -64,40 +118,37 @@ def print_tag_dict(tag_dict, prefix='', ksep=':', vsep=' ',
     if tag_prefix is None:
         tag_prefix = ''
 
+    parts = []
+    write = parts.append
+    do_quote_vals = (vsep == ' ')
+
     def write_key(key_name, dict_key, padding, last_tag=False):
-        """Print a single tag formatted properly."""
+        """Render a single tag formatted properly."""
         if max_padding==0:
             padding = 0
         else:
             padding = max(1, padding - len(key_name) + 1)
-        sorted_vals = sorted(tag_dict[dict_key])
-        do_quote_vals = (vsep == ' ')
         formatted_vals = [format_tag_value(x, do_quote_vals)
-                          for x in sorted_vals]
+                          for x in sorted(tag_dict[dict_key])]
         if key_val_pairs:
             if one_line:
                 for val in formatted_vals[0:-1]:
-                    out.write(key_name + ksep + val + vsep)
-                val = formatted_vals[-1]
-                out.write(key_name + ksep + val)
+                    write(key_name + ksep + val + vsep)
+                write(key_name + ksep + formatted_vals[-1])
                 if not last_tag:
-                    out.write(vsep)
+                    write(vsep)
             else:
+                start = prefix + key_name + ksep + (" " * padding)
                 for val in formatted_vals:
-                    out.write(prefix + key_name + ksep
-                              + (" " * padding) + val + "\n")
+                    write(start + val + "\n")
         else:
             if one_line:
-                out.write(key_name + ksep)
-                out.write('"' + vsep.join(formatted_vals) + '" ')
+                write(key_name + ksep)
+                write('"' + vsep.join(formatted_vals) + '" ')
             else:
-                out.write(prefix + key_name + ksep + (" " * padding))
-                # if for_recoll:
-                #     out.write('"')
-                out.write(vsep.join(formatted_vals))
-                # if for_recoll:
-                #     out.write('"')
-                out.write("\n")
+                write(prefix + key_name + ksep + (" " * padding))
+                write(vsep.join(formatted_vals))
+                write("\n")
 
     padding = 0
     tag_lengths = [len(k) for k in tag_dict.keys()]
@@ -109,7 +160,7 @@ def print_tag_dict(tag_dict, prefix='', ksep=':', vsep=' ',
         padding = max(padding, min_padding)
 
     if one_line and tag_dict and prefix:
-        out.write(prefix)
+        write(prefix)
     keys = sorted(tag_dict.keys())
     default = constants.DEFAULT_TAG_KEY
     if default in keys:
@@ -124,23 +175,30 @@ def print_tag_dict(tag_dict, prefix='', ksep=':', vsep=' ',
         write_key(keyname, k, padding, last_tag=last_tag)
 
     if one_line and tag_dict and prefix:
-        out.write("\n")
+        write("\n")
     # Show that the file doesn't have the requested tags.
     if (not tag_dict) and prefix and not terse:
-        out.write(prefix + "\n")
+        write(prefix + "\n")
+    return ''.join(parts)
 
 
 def merge_tags(tags1, tags2):
-    """Merge the two tag dicts."""
+    """Merge the two tag dicts.
+
+    For keys in both dicts, the values from tags2 come first, followed by the
+    values from tags1 that aren't in tags2.
+    """
     combined = {}
     for k in tags1.keys():
-        if k in tags2.keys():
-            combined[k] = tags2[k] + [v for v in tags1[k]
-                                      if v not in set(tags2[k])]
+        if k in tags2:
+            values = TagSet(tags2[k])
+            values.update(tags1[k])
+            combined[k] = values.to_list()
         else:
             combined[k] = tags1[k]
-    for key in [k for k in tags2.keys() if k not in tags1.keys()]:
-        combined[key] = tags2[key]
+    for key in tags2.keys():
+        if key not in tags1:
+            combined[key] = tags2[key]
     return combined
 
 
@@ -156,12 +214,12 @@ def subtract_tags(minuend, subtrahend, empty_means_all=True):
     """
     difference = {}
     for k, vlist in minuend.items():
-        if k in subtrahend.keys():
-            if '' in subtrahend[k] and empty_means_all:
+        if k in subtrahend:
+            removed = set(subtrahend[k])
+            if '' in removed and empty_means_all:
                 pass
             else:
-                new_vlist = [v for v in vlist
-                             if v not in subtrahend[k]]
+                new_vlist = [v for v in vlist if v not in removed]
                 if len(new_vlist) > 0:
                     difference[k] = new_vlist
         else:
@@ -182,7 +240,8 @@ def select_tags(original, selection):
             if '' in vlist:
                 subset[k] = original[k]
             else:
-                new_vlist = [v for v in vlist if v in original[k]]
+                present = set(original[k])
+                new_vlist = [v for v in vlist if v in present]
                 if len(new_vlist) > 0:
                     subset[k] = new_vlist
     return subset
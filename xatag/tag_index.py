@@ -0,0 +1,275 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The tag index is an optional SQLite database in the config directory that
+# mirrors the tags written in the extended attributes of files.  The xattrs
+# are always the real data; the index only exists so that queries don't have
+# to read every file.  It is used only if the database file exists, which is
+# the case after 'xatag --index-tags FILE...' has been run once.  From then
+# on, every write done through operations.py updates it.
+#
+# Each file is stored with its device, inode, mtime and ctime.  Changing an
+# extended attribute always changes the ctime, so if the stat of the file
+# still matches what is stored, then the stored tags are current.
+
+import atexit
+import os
+import threading
+
+import xatag.config as config
+import xatag.trace as trace
+from xatag.warn import warn
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id     INTEGER PRIMARY KEY,
+    path   TEXT UNIQUE NOT NULL,
+    device INTEGER,
+    inode  INTEGER,
+    mtime  REAL,
+    ctime  REAL
+);
+CREATE INDEX IF NOT EXISTS files_inode ON files (device, inode);
+CREATE TABLE IF NOT EXISTS postings (
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    key     TEXT NOT NULL,
+    value   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_tag ON postings (key, value);
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id);
+"""
+
+# sqlite3 is imported only when an index is actually opened, since most runs
+# of xatag won't need it.
+
+# Commit after this many updates, instead of after each one.
+COMMIT_INTERVAL = 1000
+
+
+def index_path(fname):
+    """Return the path that fname is stored under in the index."""
+    return os.path.realpath(fname)
+
+
+class TagIndex(object):
+    """A SQLite database of the tags of files, keyed by path."""
+    def __init__(self, fname):
+        import sqlite3
+        self.fname = fname
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(fname, check_same_thread=False)
+        # Keep tags as the same byte strings that the xattrs hold.
+        self.conn.text_factory = str
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.uncommitted = 0
+
+    def update(self, fname, tag_dict, st=None):
+        """Store tag_dict as the tags of fname."""
+        path = index_path(fname)
+        if st is None:
+            st = os.stat(path)
+        with self.lock:
+            cur = self.conn.cursor()
+            self._delete(cur, path)
+            cur.execute("INSERT INTO files (path, device, inode, mtime, ctime)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (path, st.st_dev, st.st_ino, st.st_mtime, st.st_ctime))
+            file_id = cur.lastrowid
+            cur.executemany("INSERT INTO postings (file_id, key, value)"
+                            " VALUES (?, ?, ?)",
+                            [(file_id, k, v) for k, vlist in tag_dict.items()
+                             for v in vlist])
+            self._maybe_commit()
+
+    def remove(self, fname):
+        """Forget about fname."""
+        with self.lock:
+            self._delete(self.conn.cursor(), index_path(fname))
+            self._maybe_commit()
+
+    def remove_tree(self, dirname):
+        """Forget about every file beneath the directory dirname."""
+        prefix = index_path(dirname).rstrip(os.sep) + os.sep
+        # Match the prefix literally, rather than with LIKE.
+        where = "substr(path, 1, ?) = ?"
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("DELETE FROM postings WHERE file_id IN"
+                        " (SELECT id FROM files WHERE " + where + ")",
+                        (len(prefix), prefix))
+            cur.execute("DELETE FROM files WHERE " + where,
+                        (len(prefix), prefix))
+            self._maybe_commit()
+
+    def _delete(self, cur, path):
+        cur.execute("DELETE FROM postings WHERE file_id IN"
+                    " (SELECT id FROM files WHERE path = ?)", (path,))
+        cur.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _maybe_commit(self):
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def lookup(self, fname, st=None):
+        """Return the stored tag dict of fname, or None if it is not current.
+
+        The stored tags are current if fname has the same device, inode,
+        mtime and ctime as when its tags were stored.
+        """
+        path = index_path(fname)
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, device, inode, mtime, ctime FROM files"
+                " WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return None
+            if tuple(row[1:]) != (st.st_dev, st.st_ino,
+                                  st.st_mtime, st.st_ctime):
+                return None
+            return self._tag_dict(row[0])
+
+    def stored_tags(self, fname):
+        """Return the tag dict stored for fname, current or not, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT id FROM files WHERE path = ?",
+                                    (index_path(fname),)).fetchone()
+            if row is None:
+                return None
+            return self._tag_dict(row[0])
+
+    def _tag_dict(self, file_id):
+        tag_dict = {}
+        for k, v in self.conn.execute(
+                "SELECT key, value FROM postings WHERE file_id = ?",
+                (file_id,)):
+            tag_dict.setdefault(k, []).append(v)
+        return tag_dict
+
+    def paths(self):
+        """Return the set of all paths in the index."""
+        with self.lock:
+            return set(row[0] for row in
+                       self.conn.execute("SELECT path FROM files"))
+
+    def file_stats(self):
+        """Return a dict of the stored (dev, inode, mtime, ctime) by path."""
+        with self.lock:
+            return dict((row[0], tuple(row[1:])) for row in
+                        self.conn.execute("SELECT path, device, inode, mtime,"
+                                          " ctime FROM files"))
+
+    def postings(self):
+        """Return a list of (path, key, value) for every tag in the index."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT path, key, value FROM files JOIN postings"
+                " ON files.id = postings.file_id").fetchall()
+
+    def paths_with_tag(self, key, value=''):
+        """Return the set of paths with the tag key:value.
+
+        If value is '', return the paths with any value for key.
+        """
+        if value == '':
+            sql = ("SELECT DISTINCT path FROM files JOIN postings"
+                   " ON files.id = postings.file_id WHERE key = ?")
+            args = (key,)
+        else:
+            sql = ("SELECT path FROM files JOIN postings"
+                   " ON files.id = postings.file_id"
+                   " WHERE key = ? AND value = ?")
+            args = (key, value)
+        with self.lock:
+            return set(row[0] for row in self.conn.execute(sql, args))
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+
+def open_tag_index(config_dir=None, create=False):
+    """Return the TagIndex for config_dir, or None if there isn't one.
+
+    Unless create is True, the index is only opened if the database file
+    already exists.  Indexes stay open until the program exits.
+    """
+    fname = config.guess_tag_index_file(config_dir)
+    with _open_lock:
+        if fname in _open_indexes:
+            return _open_indexes[fname]
+        if not create and not os.path.isfile(fname):
+            return None
+        if not os.path.isdir(os.path.dirname(fname)):
+            warn("xatag config dir cannot be found: " +
+                 os.path.dirname(fname))
+            return None
+        import sqlite3
+        try:
+            index = TagIndex(fname)
+        except sqlite3.Error:
+            warn("xatag tag index cannot be opened: " + fname)
+            return None
+        _open_indexes[fname] = index
+        return index
+
+
+def commit_tag_indexes():
+    """Commit every open TagIndex."""
+    with _open_lock:
+        for index in _open_indexes.values():
+            index.commit()
+
+
+def close_tag_indexes():
+    """Commit and close every open TagIndex."""
+    with _open_lock:
+        for index in _open_indexes.values():
+            index.close()
+        _open_indexes.clear()
+
+
+atexit.register(close_tag_indexes)
+
+
+def record_tags(fname, tag_dict, config_dir=None):
+    """Store the tags of fname in the tag index, if there is one."""
+    with trace.span('tag_index'):
+        index = open_tag_index(config_dir)
+        if index is not None:
+            import sqlite3
+            try:
+                index.update(fname, tag_dict)
+            except (OSError, sqlite3.Error):
+                warn("could not update the tag index: " + fname)
@@ -0,0 +1,421 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# A read-only FUSE filesystem for browsing tagged files by their tags.
+#
+# A path in the filesystem is a query, built one directory at a time:
+#
+#     /genre/indie/+/pop/!/tag/draft/$
+#
+# 'genre/indie' selects the files with the tag genre:indie.  '+' followed by
+# another value of the same key widens the previous term (genre:indie OR
+# genre:pop), '!' negates the term that follows it, and terms next to each
+# other are ANDed.  'ALL' in place of a value matches any value of the key.
+# The files that match are listed, as symlinks to the real files, in the
+# '$' directory.  Other directories only list keys and values that some of
+# the matching files have, so every path that can be browsed to is
+# non-empty.  The names of the special directories come from fuse_conf.yaml;
+# the first name in each list is the one that is shown, and the others are
+# accepted as aliases.
+#
+# Keys and values are used as directory names with '%' and '/' written as
+# '%25' and '%2F' (and '.' or '..' as '%2E' or '%2E%2E'), so any tag can be
+# browsed to.  A key or value that is spelled like one of the special
+# directories has its first character written that way too, so that a
+# value 'ALL' is listed as '%41LL'.
+#
+# The tags are never read from the files themselves.  The filesystem shows
+# the files in the tag index (see tag_index.py), which is loaded into memory
+# as an inverted index from each tag to the set of files that have it.
+# When the database changes, it is reloaded and a generation counter is
+# incremented; directory nodes, with their sets of matching files and
+# their listings, are cached by path until the generation changes.
+
+import errno
+import os
+import stat
+import time
+import urllib
+
+import xatag.config as config
+import xatag.constants as constants
+from xatag.query import Term
+import xatag.tag_index as tag_index
+
+# Check whether the tag index changed at most this often, in seconds.
+REFRESH_INTERVAL = 1.0
+# Forget all cached nodes when there are more than this many.
+MAX_CACHED_NODES = 10000
+
+
+def encode_name(name, reserved=()):
+    """Return the directory name for the key or value name.
+
+    reserved is the names of the special directories.
+    """
+    name = name.replace('%', '%25').replace('/', '%2F')
+    if name in ('.', '..'):
+        name = name.replace('.', '%2E')
+    elif name in reserved:
+        name = '%%%02X' % ord(name[0]) + name[1:]
+    return name
+
+
+def decode_name(name):
+    """Return the key or value that the directory name stands for."""
+    return urllib.unquote(name)
+
+
+class InvertedIndex(object):
+    """The files with each tag, as sets of integer file ids."""
+    def __init__(self):
+        self.files = []
+        self.ids = {}
+        self.tags = {}
+        self.any_value = {}
+
+    @classmethod
+    def from_postings(cls, postings):
+        """Make an index from (path, key, value) tuples."""
+        index = cls()
+        for path, key, value in postings:
+            index.add(path, key, value)
+        return index
+
+    def add(self, path, key, value):
+        file_id = self.ids.get(path)
+        if file_id is None:
+            file_id = self.ids[path] = len(self.files)
+            self.files.append(path)
+        self.tags.setdefault(key, {}).setdefault(value, set()).add(file_id)
+        self.any_value.pop(key, None)
+
+    def all_ids(self):
+        return set(xrange(len(self.files)))
+
+    def keys(self):
+        return self.tags.keys()
+
+    def values(self, key):
+        return self.tags.get(key, {}).keys()
+
+    def paths_with_tag(self, key, value=''):
+        """Return the ids of the files with key:value, or any value if ''.
+
+        The set returned must not be modified.
+        """
+        values = self.tags.get(key)
+        if not values:
+            return set()
+        if value != '':
+            return values.get(value, set())
+        ids = self.any_value.get(key)
+        if ids is None:
+            ids = self.any_value[key] = set().union(*values.values())
+        return ids
+
+
+class IndexSource(object):
+    """Load the InvertedIndex from the tag index in config_dir."""
+    def __init__(self, config_dir=None):
+        self.fname = config.guess_tag_index_file(config_dir)
+        self.config_dir = config_dir
+
+    def signature(self):
+        """Return something that changes whenever the database changes."""
+        sig = []
+        for fname in [self.fname, self.fname + '-wal']:
+            try:
+                st = os.stat(fname)
+                sig.append((st.st_ino, st.st_size, st.st_mtime))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def load(self):
+        index = tag_index.open_tag_index(self.config_dir)
+        if index is None:
+            return InvertedIndex()
+        return InvertedIndex.from_postings(index.postings())
+
+
+# Node kinds.  A TERM node comes after a complete term (or is the root); a
+# NOT node after '!'; a VALUE node after a key; an OR node after '+'; and
+# FILES is the directory of matching files.
+TERM, NOT, VALUE, OR, FILES = 'term', 'not', 'value', 'or', 'files'
+
+
+class Node(object):
+    """A directory in the tree.
+
+    matches is the set of files that the listing is based on.  For TERM and
+    FILES nodes that is the result of the query so far; base is the result
+    before the last clause, which '+' rebuilds.  clause is the last term as
+    (key, values, negated), where values is a frozenset.
+    """
+    def __init__(self, kind, matches, base=None, clause=None, key=None,
+                 negated=False):
+        self.kind = kind
+        self.matches = matches
+        self.base = base
+        self.clause = clause
+        self.key = key
+        self.negated = negated
+        self.entries = None
+        self.links = None
+
+
+class TagTree(object):
+    """Resolve and list the paths of the filesystem."""
+    def __init__(self, source, conf=None, ignored_keys=()):
+        conf = conf or constants.DEFAULT_FUSE_CONF
+        self.source = source
+        self.terminate_dirs = [str(d) for d in conf['terminate_dirs']]
+        self.or_dirs = [str(d) for d in conf['boolean_or_dirs']]
+        self.not_dirs = [str(d) for d in conf['boolean_not_dirs']]
+        self.all_dirs = [str(d) for d in conf['all_values_dirs']]
+        self.reserved = set(self.terminate_dirs + self.or_dirs +
+                            self.not_dirs + self.all_dirs)
+        self.ignored_keys = set(ignored_keys)
+        self.index = None
+        self.signature = None
+        self.generation = 0
+        self.last_check = None
+        self.mtime = time.time()
+        self.nodes = {}
+
+    def refresh(self, now=None):
+        """Reload the index if it changed, checking at most so often."""
+        now = time.time() if now is None else now
+        if (self.last_check is not None and
+                now - self.last_check < REFRESH_INTERVAL):
+            return
+        self.last_check = now
+        signature = self.source.signature()
+        if self.index is None or signature != self.signature:
+            self.index = self.source.load()
+            self.signature = signature
+            self.generation += 1
+            self.mtime = now
+
+    def resolve(self, path):
+        """Return the Node for the directory path, or a symlink's target.
+
+        Return None if path doesn't exist.
+        """
+        path = '/' + path.strip('/')
+        cached = self.nodes.get(path)
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        if path == '/':
+            universe = self.index.all_ids()
+            node = Node(TERM, universe, base=universe)
+        else:
+            parent_path, name = path.rsplit('/', 1)
+            parent = self.resolve(parent_path)
+            if not isinstance(parent, Node):
+                return None
+            node = self.child(parent, name)
+        if node is not None:
+            if len(self.nodes) >= MAX_CACHED_NODES:
+                self.nodes.clear()
+            self.nodes[path] = (self.generation, node)
+        return node
+
+    def child(self, parent, name):
+        """Return the Node (or symlink target) called name in parent."""
+        kind = parent.kind
+        if kind == FILES:
+            self.list_dir(parent)
+            return parent.links.get(name)
+        if kind == TERM:
+            if name in self.terminate_dirs:
+                return Node(FILES, parent.matches)
+            if name in self.not_dirs:
+                return Node(NOT, parent.matches, negated=True)
+            if name in self.or_dirs:
+                if not parent.clause or '' in parent.clause[1]:
+                    return None
+                key, values, negated = parent.clause
+                return Node(OR, parent.base, base=parent.base,
+                            clause=parent.clause, key=key, negated=negated)
+        if kind == VALUE and name in self.all_dirs:
+            return self.term_node(parent.matches,
+                                  (parent.key, frozenset(['']),
+                                   parent.negated))
+        if name not in self.list_dir(parent):
+            return None
+        if kind in (TERM, NOT):
+            return Node(VALUE, parent.matches, key=decode_name(name),
+                        negated=parent.negated)
+        if kind == VALUE:
+            return self.term_node(parent.matches,
+                                  (parent.key, frozenset([decode_name(name)]),
+                                   parent.negated))
+        # kind == OR: widen the clause of the TERM node that '+' was in.
+        key, values, negated = parent.clause
+        return self.term_node(parent.base,
+                              (key, values | set([decode_name(name)]),
+                               negated))
+
+    def term_node(self, base, clause):
+        key, values, negated = clause
+        selected = Term(key, values).evaluate(self.index, base)
+        if negated:
+            selected = base - selected
+        return Node(TERM, selected, base=base, clause=clause)
+
+    def list_dir(self, node):
+        """Return the sorted names in the directory node."""
+        if node.entries is not None:
+            return node.entries
+        index = self.index
+        matches = node.matches
+        if node.kind in (TERM, NOT):
+            entries = self.present_keys(matches)
+            if node.kind == TERM:
+                entries.append(self.not_dirs[0])
+                if node.clause and '' not in node.clause[1]:
+                    entries.append(self.or_dirs[0])
+                entries.append(self.terminate_dirs[0])
+        elif node.kind in (VALUE, OR):
+            skip = node.clause[1] if node.kind == OR else ()
+            entries = sorted(encode_name(v, self.reserved)
+                             for v in index.values(node.key)
+                             if v not in skip and
+                             not index.paths_with_tag(node.key, v)
+                             .isdisjoint(matches))
+            if node.kind == VALUE:
+                entries.append(self.all_dirs[0])
+        else:
+            node.links = self.file_links(matches)
+            entries = sorted(node.links)
+        node.entries = entries
+        return entries
+
+    def present_keys(self, matches):
+        """Return the sorted keys, not ignored, that some of matches have.
+
+        The keys are encoded as directory names.
+        """
+        index = self.index
+        everything = len(matches) == len(index.files)
+        return sorted(encode_name(k, self.reserved) for k in index.keys()
+                      if k not in self.ignored_keys and
+                      (everything or
+                       not index.paths_with_tag(k).isdisjoint(matches)))
+
+    def file_links(self, matches):
+        """Return a dict of link names to paths, for the files in matches."""
+        links = {}
+        for path in sorted(self.index.files[i] for i in matches):
+            name = os.path.basename(path)
+            n = 1
+            while name in links:
+                n += 1
+                name = "%s (%d)" % (os.path.basename(path), n)
+            links[name] = path
+        return links
+
+
+class TagFS(object):
+    """The FUSE operations, as called by fusepy, for a TagTree."""
+    def __init__(self, tree):
+        self.tree = tree
+        self.uid = os.getuid()
+        self.gid = os.getgid()
+
+    def __call__(self, op, *args):
+        if not hasattr(self, op):
+            raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+        return getattr(self, op)(*args)
+
+    def _resolve(self, path):
+        self.tree.refresh()
+        node = self.tree.resolve(path)
+        if node is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT))
+        return node
+
+    def init(self, path):
+        # Called in the process that serves the filesystem, after FUSE has
+        # forked into the background, which the SQLite connection that
+        # loading opens mustn't be carried across.
+        self.tree.refresh()
+
+    def destroy(self, path):
+        pass
+
+    def access(self, path, amode):
+        self._resolve(path)
+        if amode & os.W_OK:
+            raise OSError(errno.EROFS, os.strerror(errno.EROFS))
+        return 0
+
+    def getattr(self, path, fh=None):
+        node = self._resolve(path)
+        t = self.tree.mtime
+        attrs = dict(st_uid=self.uid, st_gid=self.gid,
+                     st_atime=t, st_mtime=t, st_ctime=t)
+        if isinstance(node, Node):
+            attrs.update(st_mode=stat.S_IFDIR | 0o555, st_nlink=2,
+                         st_size=0)
+        else:
+            attrs.update(st_mode=stat.S_IFLNK | 0o777, st_nlink=1,
+                         st_size=len(node))
+        return attrs
+
+    def readdir(self, path, fh):
+        node = self._resolve(path)
+        if not isinstance(node, Node):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR))
+        return ['.', '..'] + self.tree.list_dir(node)
+
+    def readlink(self, path):
+        node = self._resolve(path)
+        if isinstance(node, Node):
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+        return node
+
+    def opendir(self, path):
+        self._resolve(path)
+        return 0
+
+    def releasedir(self, path, fh):
+        return 0
+
+    def statfs(self, path):
+        return {}
+
+    def getxattr(self, path, name, position=0):
+        raise OSError(errno.ENODATA, os.strerror(errno.ENODATA))
+
+    def listxattr(self, path):
+        return []
+
+
+def mount(mountpoint, config_dir=None, foreground=False):
+    """Mount the tag filesystem for config_dir at mountpoint.
+
+    This needs fusepy (the 'fuse' module).
+    """
+    from fuse import FUSE
+    conf = config.load_fuse_conf(config_dir)
+    ignored_keys = config.load_ignored_keys(config_dir) or ()
+    tree = TagTree(IndexSource(config_dir), conf, ignored_keys)
+    # The caches in TagTree aren't shared safely between threads.
+    FUSE(TagFS(tree), mountpoint, foreground=foreground, nothreads=True,
+         ro=True, fsname='xatag')
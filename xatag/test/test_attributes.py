@@ -1,5 +1,6 @@
 #pylint: disable-all
 import pytest
+import xattr
 
 from xatag.tag import Tag
 from xatag.attributes import *
@@ -95,3 +96,106 @@ def test_remove_tag_values_from_xattr_value():
     assert (remove_tag_values_from_xattr_value('one;two', [''], True)
             == 'one;two')
     assert remove_tag_values_from_xattr_value('', ['notfound'], True) == ''
+
+
+class RecordingBackend(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = []
+
+    def update(self, f, values, removed=(), follow_symlinks=True):
+        self.calls.extend(('set', key) for key in sorted(values))
+        self.calls.extend(('remove', key) for key in removed)
+        self.backend.update(f, values, removed, follow_symlinks)
+
+    def close(self, f):
+        self.backend.close(f)
+
+
+def test_file_tag_session(file_with_tags):
+    with FileTagSession(file_with_tags) as session:
+        assert 'user.other.tag' not in session
+        assert set(session.keys()) == set(XATAG_TAGS.keys())
+        assert session.tag_dict() == read_tag_dict(file_with_tags)
+        session.backend = RecordingBackend(session.backend)
+        session['user.org.xatag.tags.genre'] = 'indie;pop'
+        session['user.org.xatag.tags.artist'] = 'Portishead'
+        session.remove('user.org.xatag.tags.tags')
+        assert session.changed()
+        recorder = session.backend
+    assert recorder.calls == [('set', 'user.org.xatag.tags.artist'),
+                              ('remove', 'user.org.xatag.tags.tags')]
+    assert not session.changed()
+    assert session.tag_dict() == read_tag_dict(file_with_tags)
+    x = xattr.xattr(file_with_tags)
+    assert x['user.org.xatag.tags.artist'] == 'Portishead'
+    assert x['user.other.tag'] == 'something'
+
+
+def test_file_tag_session_reordered(file_with_tags):
+    with FileTagSession(file_with_tags) as session:
+        session.backend = RecordingBackend(session.backend)
+        session['user.org.xatag.tags.genre'] = 'pop;indie'
+        assert not session.changed()
+        session['user.org.xatag.tags.artist'] = 'The XX'
+        assert not session.changed()
+        recorder = session.backend
+    assert recorder.calls == []
+
+
+def test_same_xattr_value():
+    assert same_xattr_value('a;b', 'b;a')
+    assert same_xattr_value(None, None)
+    assert not same_xattr_value('a', None)
+    assert not same_xattr_value('a;b', 'a')
+
+
+def test_file_tag_session_exception(file_with_tags):
+    with pytest.raises(ValueError):
+        with FileTagSession(file_with_tags) as session:
+            session.clear()
+            raise ValueError
+    assert set(read_tag_keys(file_with_tags)) == set(['tags', 'genre',
+                                                      'artist'])
+
+
+def test_chunked_fields():
+    from xatag.backends import MemoryBackend, set_backend
+    backend = MemoryBackend()
+    previous = set_backend(backend)
+    try:
+        values = ['value%05d' % i for i in range(2000)]
+        key = 'user.org.xatag.tags.big'
+        with FileTagSession('/f') as session:
+            session[key] = list_to_xattr_value(values)
+        raw = backend.files['/f']
+        assert raw[key].startswith('\0z:')
+        count = int(raw[key][3:raw[key].index('\0', 1)])
+        assert count > 1
+        assert all(len(v) <= 2048 + 16 for v in raw.values())
+        assert sorted(raw) == sorted([key] + [chunk_xattr_key(key, i)
+                                              for i in range(1, count)])
+        assert chunk_xattr_key(key, 2) == 'user.org.xatag.chunks.2.big'
+        assert read_tag_dict('/f') == {'big': values}
+        assert read_tag_keys('/f') == ['big']
+        usage = xattr_usage('/f')
+        assert usage['chunked'] == 1 and usage['keys'] == 1
+
+        with FileTagSession('/f') as session:
+            session[key] = 'short'
+        assert backend.files['/f'] == {key: 'short'}
+        with FileTagSession('/f') as session:
+            session[key] = list_to_xattr_value(values)
+        with FileTagSession('/f') as session:
+            session.remove(key)
+        assert backend.files['/f'] == {}
+    finally:
+        set_backend(previous)
+
+
+def test_split_chunks():
+    assert split_chunks('user.org.xatag.tags.a', 'x;y', 4) == \
+        [('user.org.xatag.tags.a', 'x;y')]
+    # Values that don't compress are split as they are.
+    assert split_chunks('org.xatag.tags.a', 'abcdefgh', 4) == \
+        [('org.xatag.tags.a', '\0:2\0abcd'), ('org.xatag.chunks.1.a', 'efgh')]
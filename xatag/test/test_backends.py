@@ -0,0 +1,100 @@
+#pylint: disable-all
+import pytest
+import os
+
+import xatag.backends as backends
+from xatag.backends import *
+import xatag.operations as op
+from xatag.attributes import read_tag_dict
+from xatag.tag import Tag
+import xatag.constants as constants
+
+AVAILABLE = [XattrBackend, MemoryBackend]
+
+
+@pytest.fixture(params=AVAILABLE, ids=[cls.name for cls in AVAILABLE])
+def backend(request):
+    return request.param()
+
+
+@pytest.fixture
+def memory(request):
+    backend = MemoryBackend()
+    previous = set_backend(backend)
+    request.addfinalizer(lambda: set_backend(previous))
+    return backend
+
+
+def test_backend(backend, tmpdir):
+    f = tmpdir.join('f')
+    f.write('')
+    path = str(f)
+    assert backend.list(path) == []
+    backend.set(path, 'user.a', 'one')
+    backend.update(path, {'user.b': 'two', 'user.c': 'three'})
+    assert sorted(backend.list(path)) == ['user.a', 'user.b', 'user.c']
+    assert backend.get(path, 'user.a') == 'one'
+    assert backend.get_many(path, ['user.b', 'user.c']) == {
+        'user.b': 'two', 'user.c': 'three'}
+    backend.update(path, {'user.a': 'uno'}, removed=['user.b'])
+    backend.remove(path, 'user.c')
+    assert backend.list(path) == ['user.a']
+    assert backend.get(path, 'user.a') == 'uno'
+    with pytest.raises(KeyError):
+        backend.get(path, 'user.b')
+    with pytest.raises(KeyError):
+        backend.remove(path, 'user.b')
+
+
+def test_open(backend, tmpdir):
+    if not isinstance(backend, FdBackend):
+        pytest.skip("backend doesn't use file descriptors")
+    f = tmpdir.join('f')
+    f.write('')
+    link = tmpdir.join('link')
+    link.mksymlinkto(f)
+    with backend.opened(str(link)) as handle:
+        backend.set(handle, 'user.a', 'one')
+        # Once it's open, the file is found however it's renamed.
+        f.rename(tmpdir.join('g'))
+        assert backend.get(handle, 'user.a') == 'one'
+        backend.update(handle, {'user.b': 'two'})
+    assert sorted(backend.list(str(tmpdir.join('g')))) == ['user.a',
+                                                           'user.b']
+    with backend.opened(str(link), follow_symlinks=False) as handle:
+        assert backend.list(handle, follow_symlinks=False) == []
+
+
+def test_make_backend(monkeypatch, capsys):
+    assert isinstance(make_backend('memory'), MemoryBackend)
+    default = make_backend()
+    assert default.name == 'xattr'
+    assert make_backend('nonsense').name == default.name
+    out, err = capsys.readouterr()
+    assert err == "xattr backend is not available: nonsense\n"
+    monkeypatch.setattr(backends, '_backend', None)
+    monkeypatch.setenv(constants.BACKEND_VAR, 'memory')
+    assert get_backend().name == 'memory'
+
+
+def test_memory_operations(memory):
+    op.add_tags('/no/such/file', [Tag('genre', 'pop'), Tag('', 'one')])
+    assert memory.files == {'/no/such/file': {
+        'user.org.xatag.tags.genre': 'pop',
+        'user.org.xatag.tags.tag': 'one'}}
+    assert read_tag_dict('/no/such/file') == {'genre': ['pop'],
+                                              'tag': ['one']}
+    tag_dict, changed = op.set_all_tags('/no/such/file', [Tag('a', 'b')])
+    assert changed
+    assert memory.files['/no/such/file'] == {'user.org.xatag.tags.a': 'b'}
+
+
+def test_memory_many_files(memory):
+    paths = ['/tree/%d/file%d' % (i % 100, i) for i in range(5000)]
+    for i, path in enumerate(paths):
+        op.add_tags(path, [Tag('n', str(i % 7)), Tag('', 'all')])
+    for path in paths[::2]:
+        op.delete_tags(path, [Tag('', 'all')])
+    tagged = [p for p in paths if 'all' in read_tag_dict(p).get('tag', [])]
+    assert tagged == paths[1::2]
+    assert read_tag_dict(paths[14]) == {'n': ['0']}
@@ -0,0 +1,37 @@
+#pylint: disable-all
+import pytest
+from StringIO import StringIO
+
+from xatag.batch import *
+
+
+def test_split_records():
+    lines = "add\tgenre:pop\t--\ta b.txt\n\nlist\t--\tc\n"
+    assert list(split_records(StringIO(lines))) == [
+        (1, ['add', 'genre:pop', '--', 'a b.txt']),
+        (3, ['list', '--', 'c'])]
+    data = "add\0genre:pop\0--\0a\nb\0\0list\0--\0c\0"
+    assert list(split_records(StringIO(data), null=True)) == [
+        (1, ['add', 'genre:pop', '--', 'a\nb']),
+        (2, ['list', '--', 'c'])]
+
+
+def test_split_records_chunks(monkeypatch):
+    import xatag.batch as batch
+    monkeypatch.setattr(batch, 'READ_SIZE', 3)
+    data = "add\0tag\0--\0file\0\0delete-all\0--\0f2"
+    assert list(split_records(StringIO(data), null=True)) == [
+        (1, ['add', 'tag', '--', 'file']),
+        (2, ['delete-all', '--', 'f2'])]
+
+
+def test_parse_record():
+    assert parse_record(['set', 'a:b', 'c', '--', 'f1', 'f2']) == \
+        ('set', ['a:b', 'c'], ['f1', 'f2'])
+    assert parse_record(['copy', '--', 'f1', 'f2']) == \
+        ('copy', [], ['f1', 'f2'])
+    for fields in [['tag', '--', 'f1'], ['add', 'tag', 'f1'],
+                   ['add', 'tag', '--'], ['add', '--', 'f1'],
+                   ['copy', '--', 'f1']]:
+        with pytest.raises(ValueError):
+            parse_record(fields)
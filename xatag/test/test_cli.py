@@ -481,3 +481,317 @@ def test_cmd_new_config(tmpdir):
     run_cli(USAGE, ['--new-config'])
     ktfile = str(tmpdir.join('.xatag2', constants.KNOWN_TAGS_FILE))
     assert os.path.isfile(ktfile)
+
+
+def test_cmd_add_jobs(tmpfile, tmpfile2, capsys):
+    run_cli(USAGE, ['-a', 'tag5', tmpfile, tmpfile2])
+    serial = get_stdout(capsys)
+    run_cli(USAGE, ['-d', 'tag5', '-q', tmpfile, tmpfile2])
+    capsys.readouterr()
+    run_cli(USAGE, ['-a', '-j', '4', 'tag5', tmpfile, tmpfile2])
+    parallel = get_stdout(capsys)
+    assert serial == parallel
+
+
+def test_apply_to_files_jobs(tmpdir, capsys):
+    files = [str(tmpdir.join('f%d' % i)) for i in range(20)]
+    for fname in files[::2]:
+        open(fname, 'w').close()
+
+    def per_file(fname, out=None, **unused):
+        out.write(fname + "\n")
+
+    apply_to_files(per_file, {'jobs': 3}, files=files)
+    stdout, stderr = capsys.readouterr()
+    assert stdout.splitlines() == files[::2]
+    assert stderr.splitlines() == ["path does not exist: " + fname
+                                   for fname in files[1::2]]
+
+
+def test_apply_to_files_record(tmpfile, tmpfile2, monkeypatch):
+    import xatag.recoll_spool as recoll_spool
+    for jobs in ['1', '2']:
+        recorded = []
+        monkeypatch.setattr(recoll_spool.RecollUpdate, 'add',
+                            lambda self, fname: recorded.append(fname))
+        run_cli(USAGE, ['-a', '-q', '-j', jobs, 'genre:pop', tmpfile,
+                        tmpfile2])
+        # tmpfile already had genre:pop
+        assert recorded == [tmpfile2]
+        recorded[:] = []
+        run_cli(USAGE, ['-a', '-q', '-j', jobs, 'genre:pop', tmpfile,
+                        tmpfile2])
+        assert recorded == []
+        run_cli(USAGE, ['-d', '-q', '-j', jobs, 'genre:pop', tmpfile2])
+
+
+def test_cmd_index_tags(tmpfile, tmpfile2, tmp_config1):
+    run_cli(USAGE, ['--index-tags', tmpfile])
+    index = tag_index.open_tag_index()
+    assert index.lookup(tmpfile) == {DEFAULT_TAG_KEY: ['tag1', 'tag2',
+                                                       'two words'],
+                                     'genre': ['indie', 'pop'],
+                                     'artist': ['The XX']}
+    assert index.lookup(tmpfile2) is None
+    run_cli(USAGE, ['-a', '-q', 'tag4', tmpfile2])
+    assert index.lookup(tmpfile2) == {DEFAULT_TAG_KEY: ['tag2', 'tag3',
+                                                        'tag4'],
+                                      'genre': ['classical']}
+
+
+def test_cmd_execute(tmpfile, tmpfile2, capsys):
+    tmpdir = os.path.dirname(tmpfile)
+    run_cli(USAGE, ['-x', 'genre:indie OR genre:classical', tmpdir])
+    stdout, stderr = capsys.readouterr()
+    assert stdout.splitlines() == [tmpfile, tmpfile2]
+    assert stderr.startswith('2 of 2 files matched')
+    run_cli(USAGE, ['-x', 'tag2 AND NOT artist:"The XX"', tmpfile, tmpfile2])
+    stdout, stderr = capsys.readouterr()
+    assert stdout.splitlines() == [tmpfile2]
+    with pytest.raises(SystemExit):
+        run_cli(USAGE, ['-x', '(tag2', tmpdir])
+
+
+def test_cmd_add_recursive(tmpdir, capsys):
+    for name in ['a.txt', 'b.bak', 'sub/c.txt']:
+        path = tmpdir.join(name)
+        path.dirpath().ensure(dir=True)
+        path.write('')
+    run_cli(USAGE, ['-a', '-r', '--exclude=*.bak', '--no-index', 'new',
+                    str(tmpdir)])
+    stdout = get_stdout(capsys)
+    assert stdout == "a.txt: tag: new\nc.txt: tag: new\n"
+
+
+def test_fast_parse_cli():
+    for argv in [['f1'], ['tag', 'f1', 'f2'], ['-l', 'f1', 'f2'],
+                 ['--recoll-tags', 'f1']]:
+        assert fast_parse_cli(argv) == parse_cli(USAGE, argv)
+    for argv in [[], ['-l'], ['-a', 'tag', 'f1'], ['-l', '-k', 'f1'],
+                 ['--recoll-tags', 'f1', 'f2'], ['f1', '--', 'f2'],
+                 ['--version']]:
+        assert fast_parse_cli(argv) is None
+
+
+def test_fast_startup_imports(tmpfile):
+    # The fast path shouldn't import modules that only some commands need.
+    import subprocess
+    import sys
+    root = os.path.dirname(os.path.dirname(constants.__file__))
+    script = ("import sys; sys.argv = ['xatag', '--recoll-tags', %r]; "
+              "import xatag.cli as cli; import xatag.constants as c; "
+              "cli.run_cli(c.XATAG_USAGE); "
+              "sys.stderr.write(' '.join(sys.modules))" % tmpfile)
+    env = dict(os.environ, PYTHONPATH=root)
+    proc = subprocess.Popen([sys.executable, '-c', script], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    assert stdout.startswith('xa:tag=tag1; tag2; two words')
+    modules = stderr.split()
+    for heavy in ['docopt', 'sqlite3', 'subprocess', 'multiprocessing',
+                  'xatag.query']:
+        assert heavy not in modules
+
+
+def test_cmd_export_import(tmpfile, tmpfile2, tmpdir, capsys):
+    import json
+    run_cli(USAGE, ['--export', str(tmpdir)])
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record['path'] == tmpfile
+    assert record['inode'] == os.stat(tmpfile).st_ino
+    assert record['tags'] == {'tag': ['tag1', 'tag2', 'two words'],
+                              'genre': ['indie', 'pop'],
+                              'artist': ['The XX']}
+
+    dump = tmpdir.join('dump.ndjson')
+    edited = dict(record, tags={'genre': ['jazz']})
+    dump.write(lines[1] + '\n' + json.dumps(edited) + '\n' +
+               'not json\n' +
+               json.dumps(dict(record, path=tmpfile + 'x')) + '\n')
+    with pytest.raises(SystemExit) as e:
+        run_cli(USAGE, ['--import', '--no-index', '-j', '2', str(dump)])
+    assert e.value.code == 1
+    out, err = capsys.readouterr()
+    assert err.splitlines() == [
+        str(dump) + ":3: invalid tag record: No JSON object could be decoded",
+        "path does not exist: " + tmpfile + "x",
+        "1 files changed, 1 unchanged, 1 failed, 1 invalid records"]
+    x = xattr.xattr(tmpfile)
+    assert sorted(x.list()) == ['user.org.xatag.tags.genre', 'user.other.tag']
+    assert x['user.org.xatag.tags.genre'] == 'jazz'
+
+    dump.write('not json\n[1]\n')
+    with pytest.raises(SystemExit) as e:
+        run_cli(USAGE, ['--import', '--no-index', str(dump)])
+    assert e.value.code == 1
+    out, err = capsys.readouterr()
+    assert err.splitlines()[-1] == ("0 files changed, 0 unchanged, 0 failed, "
+                                    "2 invalid records")
+
+
+def test_no_follow_symlinks(tmpfile, tmpdir, capsys):
+    link = str(tmpdir.join('link'))
+    os.symlink(tmpfile, link)
+    run_cli(USAGE, ['-l', '--no-index', link])
+    out, err = capsys.readouterr()
+    assert 'genre:  indie pop' in out
+    run_cli(USAGE, ['-l', '-L', '--no-index', link])
+    out, err = capsys.readouterr()
+    assert out.strip() == link + ':'
+    # Linux doesn't allow user xattrs on symlinks.
+    key = 'user.org.xatag.tags.' + DEFAULT_TAG_KEY
+    run_cli(USAGE, ['-a', '-w', '-L', '--no-index', 'tag9', link])
+    out, err = capsys.readouterr()
+    assert err == "could not write extended attributes: " + link + "\n"
+    assert 'tag9' not in xattr.xattr(tmpfile)[key]
+    run_cli(USAGE, ['-a', '-w', '--no-index', 'tag9', link])
+    assert 'tag9' in xattr.xattr(tmpfile)[key]
+
+
+def test_profile(tmpfile, capsys, monkeypatch, tmpdir):
+    run_cli(USAGE, ['--profile', '-l', tmpfile])
+    out, err = capsys.readouterr()
+    assert 'genre:' in out
+    phases = [line.split()[0] for line in err.splitlines()[1:-3]]
+    assert sorted(phases) == ['command', 'parse', 'print', 'tag_index',
+                              'xattr']
+    assert err.splitlines()[-1].startswith("system calls: open 1, ")
+
+    fname = str(tmpdir.join('trace.json'))
+    monkeypatch.setenv(constants.TRACE_VAR, fname)
+    run_cli(USAGE, ['-l', tmpfile])
+    out, err = capsys.readouterr()
+    assert err == ''
+    assert os.path.getsize(fname) > 0
+
+
+def test_cmd_batch(tmpfile, tmpfile2, capsys, monkeypatch):
+    from StringIO import StringIO
+    import xatag.recoll_spool as recoll_spool
+    added = []
+    monkeypatch.setattr(recoll_spool.RecollUpdate, 'add',
+                        lambda self, fname: added.append(fname))
+    records = ["add\tgenre:rock\t--\t%s\t%s" % (tmpfile, tmpfile2),
+               "delete\tartist:\t--\t" + tmpfile,
+               "frobnicate\t--\t" + tmpfile,
+               "add\tnew\t--\tmissing.txt",
+               "copy\tgenre:\t--\t%s\t%s" % (tmpfile2, tmpfile)]
+    monkeypatch.setattr(sys, 'stdin', StringIO('\n'.join(records)))
+    with pytest.raises(SystemExit) as e:
+        run_cli(USAGE, ['--batch', '--no-index', '-q', '-w'])
+    assert e.value.code == 1
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err.splitlines() == ["-:3: invalid batch record: unknown "
+                                "command: frobnicate",
+                                "path does not exist: missing.txt"]
+    assert added == [tmpfile, tmpfile2, tmpfile, tmpfile]
+    assert read_tag_dict(tmpfile) == {DEFAULT_TAG_KEY: ['tag1', 'tag2',
+                                                        'two words'],
+                                      'genre': ['classical', 'indie', 'pop',
+                                                'rock']}
+
+    data = "list\0--\0%s\0\0list\0genre:\0--\0%s\0" % (tmpfile2, tmpfile2)
+    monkeypatch.setattr(sys, 'stdin', StringIO(data))
+    run_cli(USAGE, ['--batch', '-0', '-k'])
+    out, err = capsys.readouterr()
+    assert out.count("genre:") == 4
+
+
+def test_cmd_stats(tmpfile, tmpfile2, capsys):
+    run_cli(USAGE, ['--stats', tmpfile, tmpfile2])
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert lines[0].startswith(tmpfile + ": ")
+    assert "in 4 xattrs, largest 19, 3 tag keys, 0 chunked" in lines[0]
+    assert re.match(r"2 files, 0 near the limit \(over 75%\), fullest \d+%\n$",
+                    err)
+
+
+def test_name_width(tmpdir, capsys):
+    names = [str(tmpdir.join(name)) for name in ['a', 'bbbb', 'cc']]
+    for name in names:
+        open(name, 'w').close()
+    run_cli(USAGE, ['-a', '-q', '--no-index', '-w', 'x'] + names)
+    capsys.readouterr()
+    run_cli(USAGE, ['-l', '--name-width=auto'] + names)
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [names[0] + ': tag: x',
+                                names[1] + ': tag: x',
+                                names[2] + ':   tag: x']
+    run_cli(USAGE, ['-l', '--name-width', str(len(names[0]) + 6)] + names)
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [names[0] + ':       tag: x',
+                                names[1] + ':    tag: x',
+                                names[2] + ':      tag: x']
+    with pytest.raises(SystemExit):
+        run_cli(USAGE, ['-l', '--name-width=wide'] + names)
+
+
+def test_name_width_jobs(tmpdir, capsys):
+    # Each file is padded to the longest name before it, however many
+    # threads there are.
+    names = [str(tmpdir.join('f' * (i % 13 + 1) + str(i))) for i in range(60)]
+    for name in names:
+        open(name, 'w').close()
+    outputs = []
+    for jobs in ['1', '4']:
+        run_cli(USAGE, ['-l', '--name-width=auto', '-j', jobs] + names)
+        out, err = capsys.readouterr()
+        outputs.append(out)
+    assert outputs[0] == outputs[1]
+    assert outputs[0].splitlines()[1] == names[1] + ": "
+
+
+def test_format(tmpfile, tmpfile2, capsys):
+    import json
+    for jobs in ['1', '2']:
+        run_cli(USAGE, ['-l', '--format=json', '-j', jobs, tmpfile,
+                        tmpfile2])
+        out, err = capsys.readouterr()
+        records = json.loads(out)
+        assert [r['path'] for r in records] == [tmpfile, tmpfile2]
+        assert records[0]['tags']['genre'] == ['indie', 'pop']
+    for command in ['-l', '--recoll-tags']:
+        run_cli(USAGE, [command, tmpfile2, '--format', 'tsv'])
+        out, err = capsys.readouterr()
+        assert out == (tmpfile2 + "\ttag\ttag2\n" +
+                       tmpfile2 + "\ttag\ttag3\n" +
+                       tmpfile2 + "\tgenre\tclassical\n")
+    run_cli(USAGE, ['--recoll-tags', tmpfile2, '--format=json'])
+    out, err = capsys.readouterr()
+    assert [r['path'] for r in json.loads(out)] == [tmpfile2]
+    for argv, message in [
+            (['-l', '--format=xml', tmpfile], "unknown --format: xml"),
+            (['--stats', '--format=json', tmpfile],
+             "--format can't be used with --stats"),
+            (['--batch', '--format=json'],
+             "--format=json can't be used with --batch; use ndjson")]:
+        with pytest.raises(SystemExit) as e:
+            run_cli(USAGE, argv)
+        assert e.value.code == message
+
+
+def test_files_from(tmpfile, tmpfile2, tmpdir, capsys, monkeypatch):
+    from StringIO import StringIO
+    names = tmpfile + "\0" + str(tmpdir.join('missing')) + "\0" + tmpfile2
+    monkeypatch.setattr(sys, 'stdin', StringIO(names))
+    run_cli(USAGE, ['-a', '--no-index', '-w', '--files-from=-', '-0',
+                    'genre:rock', 'new'])
+    out, err = capsys.readouterr()
+    assert err == "path does not exist: " + str(tmpdir.join('missing')) + "\n"
+    for fname in [tmpfile, tmpfile2]:
+        tags = read_tag_dict(fname)
+        assert 'rock' in tags['genre'] and 'new' in tags[DEFAULT_TAG_KEY]
+
+    listing = tmpdir.join('list')
+    listing.write(tmpfile + "\n" + tmpfile2 + "\n")
+    run_cli(USAGE, ['--files-from', str(listing), '-l', 'genre:'])
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [tmpfile + ": genre: indie pop rock",
+                                tmpfile2 + ": genre: classical rock"]
+    with pytest.raises(SystemExit):
+        run_cli(USAGE, ['--files-from', str(tmpdir.join('nothing'))])
@@ -145,3 +145,31 @@ def test_update_recoll_fields(confdir, capsys):
 
     with open(find_recoll_fields_file(), 'r') as f:
         assert f.read() == updated_file
+
+
+def test_load_known_tags_cache(confdir, monkeypatch):
+    kt = load_known_tags()
+    assert load_known_tags() is kt
+    assert confdir.join('known_tags' + CACHE_SUFFIX).check()
+
+    # A fresh process would load the parsed tags from the cache file.
+    import xatag.config as config
+    monkeypatch.setattr(config, '_parsed_files', {})
+    def fail(lines):
+        raise AssertionError("known_tags was parsed again")
+    monkeypatch.setattr(config, 'parse_known_tags', fail)
+    assert load_known_tags() == kt
+    monkeypatch.undo()
+
+    add_known_tags({'key2': ['newval']})
+    assert load_known_tags()['key2'] == ['newval']
+
+    confdir.join('known_tags' + CACHE_SUFFIX).write('garbage')
+    monkeypatch.setattr(config, '_parsed_files', {})
+    assert load_known_tags()['key2'] == ['newval']
+
+
+def test_load_ignored_keys(confdir):
+    with confdir.join('ignored_keys').open('w') as f:
+        f.write("# comment\n\nwhatever\n  other  \n")
+    assert load_ignored_keys() == set(['whatever', 'other'])
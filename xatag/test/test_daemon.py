@@ -0,0 +1,110 @@
+#pylint: disable-all
+import pytest
+import os
+import threading
+import xattr
+from StringIO import StringIO
+
+import xatag.daemon as daemon
+import xatag.constants as constants
+
+
+@pytest.fixture
+def confdir(tmpdir, monkeypatch):
+    confdir = tmpdir.join('conf')
+    confdir.mkdir()
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(confdir))
+    return str(confdir)
+
+
+@pytest.fixture
+def server(confdir, request):
+    server = daemon.Daemon(confdir)
+    assert server.bind()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    def fin():
+        daemon.stop(confdir)
+        thread.join(5)
+    request.addfinalizer(fin)
+    return server
+
+
+@pytest.fixture
+def tmpfile(tmpdir):
+    f = tmpdir.join('test.txt')
+    f.write('')
+    x = xattr.xattr(str(f))
+    x['user.org.xatag.tags.tag'] = 'tag1;tag2'
+    return str(f)
+
+
+def run(argv):
+    out, err = StringIO(), StringIO()
+    status = daemon.forward(argv, stdout=out, stderr=err)
+    return status, out.getvalue(), err.getvalue()
+
+
+def test_forward_without_daemon(confdir):
+    assert daemon.forward(['-l', 'x']) is None
+    assert not daemon.stop()
+
+
+def test_forward(server, tmpfile):
+    status, out, err = run(['--recoll-tags', tmpfile])
+    assert status == 0
+    assert out == 'xa:tag=tag1; tag2\n'
+    status, out, err = run(['-a', '--no-index', 'tag3', tmpfile])
+    assert status == 0
+    assert 'tag1 tag2 tag3' in out
+    assert xattr.xattr(tmpfile)['user.org.xatag.tags.tag'] == 'tag1;tag2;tag3'
+
+
+def test_forward_relative_path(server, tmpfile, tmpdir):
+    with tmpdir.as_cwd():
+        status, out, err = run(['--recoll-tags', 'test.txt'])
+    assert out == 'xa:tag=tag1; tag2\n'
+
+
+def test_forward_errors(server, tmpfile):
+    status, out, err = run(['-l', '--format=xml', tmpfile])
+    assert status == 1
+    assert err == "unknown --format: xml\n"
+    # Warnings are shown for every command, not once per daemon.
+    for i in range(2):
+        status, out, err = run(['-l', tmpfile + 'x'])
+        assert status == 0
+        assert err == "path does not exist: " + tmpfile + "x\n"
+
+
+def test_disabled(server, tmpfile, monkeypatch):
+    monkeypatch.setenv(constants.DAEMON_DISABLE_VAR, '1')
+    assert daemon.forward(['-l', tmpfile]) is None
+
+
+def test_not_forwarded(server, tmpfile):
+    # These read stdin, or may run for a long time.
+    for argv in [['--batch'], ['--files-from=-', '-l'],
+                 ['--files-from', 'list'], ['--recoll-execm'],
+                 ['--import', '-', '--no-index'], ['--import=-'],
+                 ['-r', '-l', '.'], ['-al', '--recurs', 'x', '.'],
+                 ['-lr', '.'], ['--export'], ['--exp=.'], ['-x', 'tag1'],
+                 ['--execute', 'tag1'], ['--watch', '.']]:
+        assert daemon.forward(argv) is None
+
+
+def test_config_dir(server, tmpfile, tmpdir):
+    other = tmpdir.join('other')
+    other.mkdir()
+    # No xatagd is running for the other config dir.
+    for argv in [['--config-dir', str(other), '-l', tmpfile],
+                 ['-l', '--config-dir=' + str(other), tmpfile],
+                 ['--conf', str(other), '-l', tmpfile]]:
+        assert daemon.forward(argv) is None
+    status, out, err = run(['--config-dir', server.config_dir, '-l', tmpfile])
+    assert status == 0
+
+
+def test_bind_twice(server, confdir):
+    assert not daemon.Daemon(confdir).bind()
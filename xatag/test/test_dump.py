@@ -0,0 +1,34 @@
+#pylint: disable-all
+import pytest
+import os
+
+from xatag.dump import *
+
+
+def test_format_record(tmpdir):
+    f = tmpdir.join('caf\xc3\xa9')
+    f.write('')
+    st = os.stat(str(f))
+    line = format_record(str(f), {'tag': ['na\xc3\xafve']}, st)
+    assert line.endswith('\n')
+    assert '\\u00e9' in line
+    assert parse_record(line) == (str(f), {'tag': ['na\xc3\xafve']})
+
+
+def test_parse_record():
+    assert parse_record('{"path": "a", "tags": {}}') == ('a', {})
+    for bad in ['[1]', '{"path": "a"}', '{"path": 1, "tags": {}}',
+                '{"path": "a", "tags": {"k": "v"}}', '{']:
+        with pytest.raises(ValueError):
+            parse_record(bad)
+
+
+def test_read_records(capsys):
+    lines = ['{"path": "a", "tags": {"k": ["v"]}}\n', '\n', 'oops\n',
+             '{"path": "b", "tags": {}}\n']
+    invalid = []
+    assert list(read_records(lines, 'dump', invalid.append)) == [
+        ('a', {'k': ['v']}), ('b', {})]
+    assert invalid == [3]
+    out, err = capsys.readouterr()
+    assert err.startswith("dump:3: invalid tag record")
@@ -0,0 +1,54 @@
+#pylint: disable-all
+import pytest
+import json
+from StringIO import StringIO
+
+from xatag.formats import *
+from xatag.constants import DEFAULT_TAG_KEY
+
+TAGS = {'genre': ['pop', 'indie'], DEFAULT_TAG_KEY: ['a\tb']}
+
+
+def test_render_file():
+    line = render_file('dir/f', TAGS, 'ndjson')
+    assert line.endswith('\n')
+    assert json.loads(line) == {'path': 'dir/f',
+                                'tags': {'genre': ['indie', 'pop'],
+                                         DEFAULT_TAG_KEY: ['a\tb']}}
+    assert render_file('dir/f', TAGS, 'json') == line
+    assert render_file('a\\b\nc', TAGS, 'tsv') == (
+        "a\\\\b\\nc\ttag\ta\\tb\n"
+        "a\\\\b\\nc\tgenre\tindie\n"
+        "a\\\\b\\nc\tgenre\tpop\n")
+    assert render_file('a\nb', TAGS, 'null') == (
+        "a\nb\0tag\0a\tb\0a\nb\0genre\0indie\0a\nb\0genre\0pop\0")
+    assert render_file('f', {}, 'tsv') == ''
+    with pytest.raises(UnicodeDecodeError):
+        render_file('\xff', TAGS, 'ndjson')
+
+
+def test_render_known():
+    assert json.loads(render_known(TAGS, 'json')) == {
+        'genre': ['indie', 'pop'], DEFAULT_TAG_KEY: ['a\tb']}
+    assert [json.loads(line) for line in
+            render_known(TAGS, 'ndjson').splitlines()] == [
+        {'key': DEFAULT_TAG_KEY, 'values': ['a\tb']},
+        {'key': 'genre', 'values': ['indie', 'pop']}]
+    assert render_known(TAGS, 'tsv') == \
+        "tag\ta\\tb\ngenre\tindie\ngenre\tpop\n"
+    assert render_known(TAGS, 'null') == \
+        "tag\0a\tb\0genre\0indie\0genre\0pop\0"
+
+
+def test_json_array_writer():
+    out = StringIO()
+    writer = JsonArrayWriter(out)
+    writer.close()
+    assert json.loads(out.getvalue()) == []
+    out = StringIO()
+    writer = JsonArrayWriter(out)
+    writer.write('{"a":1}\n')
+    writer.write('')
+    writer.write('{"b":2}\n')
+    writer.close()
+    assert out.getvalue() == '[\n{"a":1},\n{"b":2}\n]\n'
@@ -1,5 +1,7 @@
 #pylint: disable-all
 import pytest
+import os
+import time
 import xattr
 
 import xatag.attributes as attr
@@ -96,6 +98,31 @@ def test_set_all_tags(file_with_tags):
     assert 'user.org.xatag.tags.artist' not in x.keys()
 
 
+def test_unchanged(file_with_tags, file_with_tags2):
+    ctime = os.stat(file_with_tags).st_ctime
+    time.sleep(0.01)
+    source_tags = attr.read_tag_dict(file_with_tags)
+    for op, args in [(add_tags, [[Tag('genre', 'pop')]]),
+                     (set_tags, [[Tag('genre', 'pop'), Tag('genre', 'indie')]]),
+                     (set_all_tags, [[Tag(k, v) for k, vlist
+                                      in source_tags.items()
+                                      for v in vlist]]),
+                     (delete_tags, [[Tag('genre', 'jazz')]]),
+                     (copy_tags_over, [source_tags]),
+                     (restore_tags, [source_tags])]:
+        if op is copy_tags_over:
+            tag_dict, changed = op(args[0], file_with_tags)
+        else:
+            tag_dict, changed = op(file_with_tags, *args)
+        assert not changed, op.__name__
+        assert tag_dict == source_tags
+    assert os.stat(file_with_tags).st_ctime == ctime
+    tag_dict, changed = delete_all_tags(file_with_tags2)
+    assert changed
+    tag_dict, changed = delete_all_tags(file_with_tags2)
+    assert not changed
+
+
 def test_delete_these_tags(file_with_tags):
     x = xattr.xattr(file_with_tags)
 
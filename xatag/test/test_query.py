@@ -0,0 +1,118 @@
+#pylint: disable-all
+import pytest
+import os
+import xattr
+
+from xatag.query import *
+import xatag.tag_index as tag_index
+import xatag.constants as constants
+from xatag.constants import DEFAULT_TAG_KEY
+
+FILE_TAGS = {
+    'a.txt': {'genre': 'indie;pop', DEFAULT_TAG_KEY: 'draft'},
+    'b.txt': {'genre': 'indie', 'artist': 'The XX'},
+    'c.txt': {'genre': 'classical', 'artist': 'The XX'},
+    'sub/d.txt': {DEFAULT_TAG_KEY: 'draft;two words'},
+    'sub/e.txt': {},
+    }
+
+
+@pytest.fixture
+def tree(tmpdir):
+    tmpdir.join('sub').mkdir()
+    for name, tags in FILE_TAGS.items():
+        path = str(tmpdir.join(name))
+        open(path, 'w').close()
+        x = xattr.xattr(path)
+        for k, v in tags.items():
+            x['user.org.xatag.tags.' + k] = v
+    return tmpdir
+
+
+def test_tokenize():
+    assert tokenize('genre:indie AND NOT draft') == [
+        ('genre', 'indie'), 'AND', 'NOT', (DEFAULT_TAG_KEY, 'draft')]
+    assert tokenize('(artist:"The XX" OR key:)') == [
+        '(', ('artist', 'The XX'), 'OR', ('key', ''), ')']
+    assert tokenize('"AND" multi:part:"a:b"') == [
+        (DEFAULT_TAG_KEY, 'AND'), ('multi:part', 'a:b')]
+    with pytest.raises(QuerySyntaxError):
+        tokenize('artist:"The XX')
+
+
+def test_parse():
+    tree = parse(tokenize('a AND NOT b OR c'))
+    assert repr(tree) == repr(Or([And([Term('', ['a']),
+                                       Not(Term('', ['b']))]),
+                                  Term('', ['c'])]))
+    tree = parse(tokenize('a (b OR c)'))
+    assert repr(tree) == repr(And([Term('', ['a']),
+                                   Or([Term('', ['b']), Term('', ['c'])])]))
+    for bad in ['', 'a AND', '(a', 'a )', 'OR a', 'NOT']:
+        with pytest.raises(QuerySyntaxError):
+            parse(tokenize(bad))
+
+
+def test_matches():
+    tags = {'genre': ['indie', 'pop'], DEFAULT_TAG_KEY: ['draft']}
+    assert Query('genre:pop').matches(tags)
+    assert Query('genre:').matches(tags)
+    assert Query('genre:rock;pop').matches(tags)
+    assert not Query('genre:indie AND NOT draft').matches(tags)
+    assert Query('genre:indie AND NOT draft OR genre:pop').matches(tags)
+    assert not Query('artist:').matches(tags)
+    assert Query('NOT artist:').matches(tags)
+
+
+QUERIES = [
+    'genre:indie',
+    'genre:indie AND NOT tag:draft OR artist:"The XX"',
+    'NOT genre:',
+    'draft (genre:pop OR "two words")',
+    'artist: AND NOT (genre:classical OR genre:pop)',
+    ]
+
+
+def test_search_files_and_index_agree(tree, monkeypatch):
+    confdir = tree.join('conf')
+    confdir.mkdir()
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(confdir))
+    index = tag_index.open_tag_index(create=True)
+    paths = [str(tree.join(name)) for name in sorted(FILE_TAGS)]
+    for path in paths:
+        index.update(path, read_tag_dict(path))
+    for query_string in QUERIES:
+        query = Query(query_string)
+        stats = SearchStats()
+        from_files = list(search_files(query, paths, stats))
+        assert stats.scanned == len(paths)
+        stats = SearchStats()
+        from_index = search_index(query, paths, stats, index)
+        assert stats.scanned == len(paths)
+        assert from_files == from_index
+    query = Query('genre:indie')
+    assert (list(search_files(query, [str(tree)], SearchStats())) ==
+            [str(tree.join('a.txt')), str(tree.join('b.txt'))])
+    assert search_index(query, [str(tree.join('sub'))], SearchStats(),
+                        index) == []
+
+
+def test_search_index_stale(tree, monkeypatch):
+    confdir = tree.join('conf')
+    confdir.mkdir()
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(confdir))
+    index = tag_index.open_tag_index(create=True)
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        index.update(str(tree.join(name)), read_tag_dict(str(tree.join(name))))
+    # b.txt changed after it was indexed, and c.txt was deleted; the sub
+    # directory was never indexed.
+    xattr.xattr(str(tree.join('b.txt')))['user.org.xatag.tags.genre'] = 'pop'
+    tree.join('c.txt').remove()
+    monkeypatch.chdir(tree)
+    paths = ['./a.txt', './b.txt', './c.txt', './sub']
+    for query_string in QUERIES + ['genre:pop', 'NOT genre:indie']:
+        query = Query(query_string)
+        assert (search_index(query, paths, SearchStats(), index) ==
+                list(search_files(query, paths, SearchStats())))
+    assert search_index(Query('NOT genre:indie'), paths, SearchStats(),
+                        index) == ['./b.txt', './sub/d.txt', './sub/e.txt']
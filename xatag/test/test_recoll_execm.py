@@ -0,0 +1,64 @@
+#pylint: disable-all
+import pytest
+from StringIO import StringIO
+
+import xatag.recoll_execm as execm
+from xatag.backends import MemoryBackend, set_backend
+import xatag.operations as op
+from xatag.tag import Tag
+
+
+@pytest.fixture
+def memory(request):
+    previous = set_backend(MemoryBackend())
+    request.addfinalizer(lambda: set_backend(previous))
+
+
+def test_message_round_trip():
+    out = StringIO()
+    execm.write_message(out, [('Filename', '/a b/c.txt'),
+                              ('xa:genre', 'indie; pop'), ('Eofnext', '')])
+    assert out.getvalue() == ("Filename: 10\n/a b/c.txt"
+                              "xa:genre: 10\nindie; pop"
+                              "Eofnext: 0\n\n")
+    inp = StringIO(out.getvalue())
+    assert execm.read_message(inp) == {'filename': '/a b/c.txt',
+                                       'xa:genre': 'indie; pop',
+                                       'eofnext': ''}
+    assert execm.read_message(inp) is None
+
+
+def test_read_message_errors():
+    for text in ["Filename 3\nabc\n", "Filename: 10\nabc",
+                 "Filename: 3\nabc"]:
+        with pytest.raises(execm.ProtocolError):
+            execm.read_message(StringIO(text))
+
+
+def test_answer(memory):
+    op.add_tags('/f1', [Tag('genre', 'indie'), Tag('genre', 'pop'),
+                        Tag('', 'x')])
+    reply = execm.answer({'filename': '/f1'})
+    assert reply[0] == ('Document', 'xa:tag=x\nxa:genre=indie; pop\n')
+    assert reply[1:] == [('Mimetype', 'text/plain'), ('xa:tag', 'x'),
+                         ('xa:genre', 'indie; pop'), ('Eofnext', '')]
+    assert execm.answer({'filename': '/f2'}) == [('Mimetype', 'text/plain'),
+                                                 ('Eofnext', '')]
+
+
+def test_answer_error(tmpdir, capsys):
+    reply = execm.answer({'filename': str(tmpdir.join('missing'))})
+    assert reply == [('Fileerror', '')]
+    out, err = capsys.readouterr()
+    assert 'could not read extended attributes' in err
+
+
+def test_serve(memory):
+    op.add_tags('/f1', [Tag('', 'x')])
+    inp = StringIO("Filename: 3\n/f1\nFilename: 3\n/f2\n")
+    out = StringIO()
+    execm.serve(inp, out)
+    replies = StringIO(out.getvalue())
+    assert execm.read_message(replies)['xa:tag'] == 'x'
+    assert 'xa:tag' not in execm.read_message(replies)
+    assert execm.read_message(replies) is None
@@ -0,0 +1,117 @@
+#pylint: disable-all
+import pytest
+import os
+
+import xatag.recoll_spool as recoll_spool
+from xatag.recoll_spool import *
+import xatag.constants as constants
+from xatag.cli import run_cli
+from xatag.constants import XATAG_USAGE as USAGE
+
+
+@pytest.fixture
+def confdir(tmpdir, monkeypatch):
+    confdir = tmpdir.join('conf')
+    confdir.mkdir()
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(confdir))
+    return str(confdir)
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(recoll_spool, 'run_recollindex',
+                        lambda paths: calls.append(list(paths)))
+    monkeypatch.setattr(recoll_spool, 'schedule_flush',
+                        lambda config_dir: None)
+    return calls
+
+
+def test_spool_paths(confdir):
+    spool_paths(['/a', '/b'], confdir)
+    spool_paths(['/b', '/c'], confdir)
+    assert take_spooled_paths(confdir) == ['/a', '/b', '/c']
+    assert take_spooled_paths(confdir) == []
+
+
+def test_spool_is_due(confdir, monkeypatch):
+    assert not spool_is_due(confdir)
+    spool_paths(['/a'], confdir)
+    # never flushed before
+    assert spool_is_due(confdir)
+    flush_spool(confdir)
+    spool_paths(['/a'], confdir)
+    assert not spool_is_due(confdir)
+    monkeypatch.setattr(constants, 'RECOLL_SPOOL_MAX_SIZE', 2)
+    assert spool_is_due(confdir)
+
+
+def test_recoll_update(confdir, indexed):
+    with RecollUpdate() as update:
+        update.add('/a')
+        update.add('/b')
+    assert indexed == [['/a', '/b']]
+    # The spool was just flushed, so these have to wait.
+    with RecollUpdate() as update:
+        update.add('/b')
+        update.add('/c')
+    assert indexed == [['/a', '/b']]
+    with RecollUpdate() as update:
+        update.add('/c')
+        update.add('/d')
+    run_cli(USAGE, ['--flush-index'])
+    assert indexed == [['/a', '/b'], ['/b', '/c', '/d']]
+
+
+def test_deferred_flush(confdir, indexed, monkeypatch):
+    # The second call is made too soon after the first to flush, so it
+    # leaves that to a background process (run here right away).
+    monkeypatch.setattr(recoll_spool, 'schedule_flush', deferred_flush)
+    sleeps = []
+    monkeypatch.setattr(recoll_spool.time, 'sleep', sleeps.append)
+    with RecollUpdate() as update:
+        update.add('/a')
+    with RecollUpdate() as update:
+        update.add('/b')
+    assert indexed == [['/a'], ['/b']]
+    assert 0 < sleeps[0] <= constants.RECOLL_SPOOL_MAX_AGE
+
+
+def test_flush_is_scheduled(confdir, indexed):
+    import fcntl
+    spool_paths(['/a'], confdir)
+    assert not flush_is_scheduled(confdir)
+    with open(flusher_file(confdir), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert flush_is_scheduled(confdir)
+        # Another process is waiting to flush, so this one leaves it.
+        deferred_flush(confdir)
+        assert indexed == []
+    deferred_flush(confdir)
+    assert indexed == [['/a']]
+
+
+def test_recoll_update_no_index(confdir, indexed):
+    with RecollUpdate(no_index=True) as update:
+        update.add('/a')
+    assert indexed == []
+    assert take_spooled_paths(confdir) == []
+
+
+def test_recoll_update_without_config(tmpdir, indexed, monkeypatch):
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(tmpdir.join('nothing')))
+    with RecollUpdate() as update:
+        update.add('/a')
+    assert indexed == [['/a']]
+
+
+def test_run_recollindex(monkeypatch):
+    import subprocess
+    calls = []
+    monkeypatch.setattr(subprocess, 'Popen',
+                        lambda args, stdin, **kwargs:
+                        calls.append((args, stdin.read())))
+    monkeypatch.setattr(recoll_spool.config, 'find_recoll_base_config_dir',
+                        lambda: None)
+    run_recollindex(['/a', '/b c', '/d\ne'])
+    assert calls == [(['recollindex', '-i'], '/a\n/b c\n')]
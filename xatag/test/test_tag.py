@@ -1,4 +1,5 @@
 #pylint: disable-all
+import pytest
 from xatag.tag import *
 from xatag.constants import DEFAULT_TAG_KEY
 
@@ -54,3 +55,23 @@ class TestTag():
     def test___hash__(self):
         t1 = Tag('somekey', 'someval')
         assert hash(t1) == hash(('somekey', 'someval'))
+
+    def test_immutable(self):
+        import copy
+        import pickle
+        t = Tag('genre', 'classical')
+        with pytest.raises(AttributeError):
+            t.value = 'rock'
+        with pytest.raises(AttributeError):
+            t.other = 'x'
+        assert not hasattr(t, '__dict__')
+        assert copy.copy(t) == t
+        assert pickle.loads(pickle.dumps(t)) == t
+
+    def test_interned(self):
+        t1 = Tag(' genre ', 'indie  pop')
+        t2 = Tag('genre', ' '.join(['indie', 'pop']))
+        assert t1.value == 'indie pop'
+        assert t1.key is t2.key
+        assert t1.value is t2.value
+        assert Tag(u'genre', u'caf\xe9').value == u'caf\xe9'
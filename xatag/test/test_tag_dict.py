@@ -61,6 +61,22 @@ def test_print_file_tags(file_with_tags):
     pass
 
 
+def test_render_tag_dict():
+    tag_dict = {'genre': ['pop', 'indie'], DEFAULT_TAG_KEY: ['two words'],
+                'artist': ['x']}
+    rendered = render_tag_dict(tag_dict, prefix='f: ')
+    assert rendered == ("f: tag:    'two words'\n"
+                        "f: artist: x\n"
+                        "f: genre:  indie pop\n")
+    out = StringIO()
+    print_tag_dict(tag_dict, prefix='f: ', out=out)
+    assert out.getvalue() == rendered
+    assert render_tag_dict({}, prefix='f: ') == "f: \n"
+    assert render_tag_dict({}, prefix='f: ', terse=True) == ""
+    assert render_tag_dict({'k': ['b', 'a']}, prefix='f: ', one_line=True,
+                           key_val_pairs=True) == "f: k:a k:b\n"
+
+
 def test_merge_tags(tag_dict1, tag_dict2):
     m = merge_tags(tag_dict1, tag_dict2)
     assert set(m[DEFAULT_TAG_KEY]) == set(['some', 'other', 'simple', 'tags'])
@@ -84,3 +100,29 @@ def test_select_tags(tag_dict1, tag_dict_with_empty_vals):
     assert set(s['scope']) == set(tag_dict1['scope'])
     assert 'first' not in s.keys()
     assert 'second' not in s.keys()
+
+
+def test_tag_set():
+    ts = TagSet(['b', 'a', 'b'])
+    ts.add('c')
+    ts.update(['a', 'd'])
+    assert ts.to_list() == ['b', 'a', 'c', 'd']
+    assert list(ts) == ['b', 'a', 'c', 'd']
+    assert len(ts) == 4
+    assert 'c' in ts
+    assert 'e' not in ts
+
+
+def test_merge_tags_order(tag_dict1, tag_dict2):
+    m = merge_tags(tag_dict1, tag_dict2)
+    assert m[DEFAULT_TAG_KEY] == ['some', 'other', 'tags', 'simple']
+    assert m['scope'] == ['hacking', 'programming', 'home', 'work']
+
+
+def test_large_tag_dicts():
+    n = 20000
+    big1 = {'key': ['v%d' % i for i in range(n)]}
+    big2 = {'key': ['v%d' % i for i in range(n // 2, n + n // 2)]}
+    assert len(merge_tags(big1, big2)['key']) == n + n // 2
+    assert subtract_tags(big1, big2)['key'] == big1['key'][:n // 2]
+    assert select_tags(big1, big2)['key'] == big2['key'][:n // 2]
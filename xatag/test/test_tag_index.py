@@ -0,0 +1,75 @@
+#pylint: disable-all
+import pytest
+import os
+import xattr
+
+from xatag.tag_index import *
+from xatag.tag import Tag
+import xatag.operations as op
+import xatag.constants as constants
+from xatag.constants import DEFAULT_TAG_KEY
+
+
+@pytest.fixture
+def files(tmpdir):
+    paths = []
+    for name, tags in [('a.txt', {'genre': 'indie;pop', 'tag': 'one'}),
+                       ('b.txt', {'genre': 'classical'}),
+                       ('c.txt', {})]:
+        path = str(tmpdir.join(name))
+        open(path, 'w').close()
+        x = xattr.xattr(path)
+        for k, v in tags.items():
+            x['user.org.xatag.tags.' + k] = v
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def index(tmpdir, monkeypatch):
+    confdir = tmpdir.join('conf')
+    confdir.mkdir()
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(confdir))
+    return open_tag_index(create=True)
+
+
+def test_update_and_lookup(index, files):
+    index.update(files[0], {'genre': ['indie', 'pop'], 'tag': ['one']})
+    assert index.lookup(files[0]) == {'genre': ['indie', 'pop'],
+                                      'tag': ['one']}
+    assert index.lookup(files[1]) is None
+    index.update(files[0], {'genre': ['indie']})
+    assert index.lookup(files[0]) == {'genre': ['indie']}
+    index.remove(files[0])
+    assert index.lookup(files[0]) is None
+
+
+def test_lookup_stale(index, files):
+    index.update(files[0], {'genre': ['indie', 'pop']})
+    st = os.stat(files[0])
+    os.utime(files[0], (st.st_atime, st.st_mtime + 10))
+    assert index.lookup(files[0]) is None
+
+
+def test_paths_with_tag(index, files):
+    index.update(files[0], {'genre': ['indie', 'pop']})
+    index.update(files[1], {'genre': ['classical']})
+    assert index.paths_with_tag('genre', 'pop') == set([files[0]])
+    assert index.paths_with_tag('genre') == set(files[0:2])
+    assert index.paths_with_tag('artist') == set()
+    assert index.paths() == set(files[0:2])
+
+
+def test_operations_update_index(index, files):
+    tag_dict, changed = op.add_tags(files[2], [Tag('', 'new')])
+    assert changed
+    assert index.lookup(files[2]) == tag_dict == {DEFAULT_TAG_KEY: ['new']}
+    op.delete_all_tags(files[2])
+    assert index.lookup(files[2]) == {}
+
+
+def test_no_index(tmpdir, files, monkeypatch):
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(tmpdir.join('nothing')))
+    assert open_tag_index() is None
+    op.add_tags(files[2], [Tag('', 'new')])
+    assert not os.path.exists(str(tmpdir.join('nothing')))
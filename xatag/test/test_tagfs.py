@@ -0,0 +1,167 @@
+#pylint: disable-all
+import pytest
+import errno
+import os
+
+from xatag.tagfs import *
+import xatag.tag_index as tag_index
+import xatag.constants as constants
+
+
+class FakeSource(object):
+    def __init__(self, postings):
+        self.postings = postings
+        self.version = 0
+
+    def signature(self):
+        return self.version
+
+    def load(self):
+        return InvertedIndex.from_postings(self.postings)
+
+
+POSTINGS = [
+    ('/a/one', 'genre', 'indie'), ('/a/one', 'tag', 'draft'),
+    ('/a/two', 'genre', 'pop'),
+    ('/b/one', 'genre', 'pop'), ('/b/one', 'artist', 'The XX'),
+    ('/b/four', 'genre', 'classical'), ('/b/four', 'tag', 'draft'),
+    ('/b/four', 'secret', 'x'),
+    ]
+
+
+@pytest.fixture
+def tree():
+    tree = TagTree(FakeSource(list(POSTINGS)), ignored_keys=['secret'])
+    tree.refresh()
+    return tree
+
+
+def ls(tree, path):
+    node = tree.resolve(path)
+    assert isinstance(node, Node)
+    return tree.list_dir(node)
+
+
+def test_inverted_index():
+    index = InvertedIndex.from_postings(POSTINGS)
+    assert index.files == ['/a/one', '/a/two', '/b/one', '/b/four']
+    assert index.paths_with_tag('genre', 'pop') == set([1, 2])
+    assert index.paths_with_tag('genre') == set([0, 1, 2, 3])
+    assert index.paths_with_tag('nope') == set()
+
+
+def test_root(tree):
+    assert ls(tree, '/') == ['artist', 'genre', 'tag', '!', '$']
+    assert ls(tree, '/genre') == ['classical', 'indie', 'pop', 'ALL']
+    assert ls(tree, '/$') == ['four', 'one', 'one (2)', 'two']
+    assert tree.resolve('/$/one (2)') == '/b/one'
+
+
+def test_terms(tree):
+    assert ls(tree, '/genre/pop') == ['artist', 'genre', '!', '+', '$']
+    assert ls(tree, '/genre/pop/$') == ['one', 'two']
+    assert ls(tree, '/genre/pop/artist/The XX/$') == ['one']
+    assert ls(tree, '/tag/ALL/$') == ['four', 'one']
+    assert ls(tree, '/tag/ALL') == ['genre', 'tag', '!', '$']
+    assert tree.resolve('/genre/metal') is None
+    assert tree.resolve('/secret') is None
+    assert tree.resolve('/genre/pop/tag') is None
+
+
+def test_or_and_not(tree):
+    assert ls(tree, '/genre/indie/+') == ['classical', 'pop']
+    assert ls(tree, '/genre/indie/+/pop/$') == ['one', 'one (2)', 'two']
+    assert ls(tree, '/genre/indie/+/pop/!') == ['artist', 'genre', 'tag']
+    assert ls(tree, '/genre/indie/+/pop/!/tag/draft/$') == ['one', 'two']
+    assert ls(tree, '/!/tag/draft/+') == []
+    assert ls(tree, '/!/genre/pop/+/indie/$') == ['four']
+    # Aliases work, but aren't listed.
+    assert ls(tree, '/genre/indie/.or/pop/.NOT/tag/draft/.x') == ['one', 'two']
+    assert tree.resolve('/+') is None
+    assert tree.resolve('/tag/ALL/+') is None
+
+
+def test_generation(tree):
+    assert ls(tree, '/genre/pop/$') == ['one', 'two']
+    tree.source.postings.append(('/c/five', 'genre', 'pop'))
+    tree.refresh()
+    # Not checked again so soon, so the cached listing is used.
+    assert ls(tree, '/genre/pop/$') == ['one', 'two']
+    tree.source.version += 1
+    tree.refresh(time.time() + REFRESH_INTERVAL)
+    assert tree.generation == 2
+    assert ls(tree, '/genre/pop/$') == ['five', 'one', 'two']
+
+
+def test_slashes(tree):
+    tree.source.postings.extend([('/c/five', 'genre', 'rock/pop'),
+                                 ('/c/five', 'a/b', '..'),
+                                 ('/c/six', 'genre', '100%')])
+    tree.source.version += 1
+    tree.refresh(time.time() + REFRESH_INTERVAL)
+    assert ls(tree, '/') == ['a%2Fb', 'artist', 'genre', 'tag', '!', '$']
+    assert ls(tree, '/genre') == ['100%25', 'classical', 'indie', 'pop',
+                                  'rock%2Fpop', 'ALL']
+    assert ls(tree, '/genre/rock%2Fpop/$') == ['five']
+    assert ls(tree, '/genre/pop/+/100%25/$') == ['one', 'six', 'two']
+    assert ls(tree, '/a%2Fb') == ['%2E%2E', 'ALL']
+    assert ls(tree, '/a%2Fb/%2E%2E/$') == ['five']
+    assert tree.resolve('/genre/rock') is None
+
+
+def test_special_names():
+    conf = dict(constants.DEFAULT_FUSE_CONF, all_values_dirs=['ALL', '.all'])
+    postings = POSTINGS + [('/c/five', 'genre', 'ALL'),
+                           ('/c/five', '$', '+')]
+    tree = TagTree(FakeSource(postings), conf)
+    tree.refresh()
+    # Every alias works, not just the one that is listed.
+    assert ls(tree, '/tag/.all/$') == ['four', 'one']
+    # Tags spelled like the special directories are listed escaped, and
+    # select just themselves.
+    assert ls(tree, '/genre') == ['%41LL', 'classical', 'indie', 'pop',
+                                  'ALL']
+    assert ls(tree, '/genre/%41LL/$') == ['five']
+    assert ls(tree, '/genre/ALL/$') == ['five', 'four', 'one', 'one (2)',
+                                        'two']
+    assert ls(tree, '/%24') == ['%2B', 'ALL']
+    assert ls(tree, '/%24/%2B/$') == ['five']
+
+
+def test_init_loads_index():
+    tree = TagTree(FakeSource(list(POSTINGS)))
+    assert tree.index is None
+    TagFS(tree)('init', '/')
+    assert tree.index.files
+
+
+def test_tagfs(tree):
+    fs = TagFS(tree)
+    assert fs('getattr', '/genre')['st_mode'] & stat.S_IFDIR
+    attrs = fs('getattr', '/genre/pop/$/two')
+    assert stat.S_ISLNK(attrs['st_mode'])
+    assert attrs['st_size'] == len('/a/two')
+    assert fs('readlink', '/genre/pop/$/two') == '/a/two'
+    assert fs('readdir', '/genre/pop/$', 0) == ['.', '..', 'one', 'two']
+    with pytest.raises(OSError) as e:
+        fs('getattr', '/nope')
+    assert e.value.errno == errno.ENOENT
+    with pytest.raises(OSError) as e:
+        fs('mkdir', '/genre/new', 0o755)
+    assert e.value.errno == errno.ENOSYS
+
+
+def test_index_source(tmpdir, monkeypatch):
+    monkeypatch.setenv(constants.CONFIG_DIR_VAR, str(tmpdir))
+    f = tmpdir.join('f')
+    f.write('')
+    source = IndexSource(str(tmpdir))
+    before = source.signature()
+    index = tag_index.open_tag_index(str(tmpdir), create=True)
+    index.update(str(f), {'genre': ['pop']})
+    index.commit()
+    assert source.signature() != before
+    inverted = source.load()
+    assert inverted.files == [os.path.realpath(str(f))]
+    assert inverted.paths_with_tag('genre', 'pop') == set([0])
+    tag_index.close_tag_indexes()
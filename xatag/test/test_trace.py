@@ -0,0 +1,61 @@
+#pylint: disable-all
+import pytest
+import json
+
+import xatag.trace as trace
+from xatag.backends import MemoryBackend, get_backend, set_backend
+import xatag.operations as op
+from xatag.tag import Tag
+
+
+@pytest.fixture
+def memory(request):
+    previous = set_backend(MemoryBackend())
+    request.addfinalizer(lambda: set_backend(previous))
+
+
+def test_span_disabled():
+    assert not trace.enabled()
+    assert trace.span('anything') is trace.NULL_SPAN
+    with trace.span('anything'):
+        trace.count('nothing')
+
+
+def test_trace(memory, tmpdir):
+    trace.start(events=True)
+    try:
+        assert trace.enabled()
+        assert isinstance(get_backend(), trace.CountingBackend)
+        with trace.span('outer'):
+            op.add_tags('/f1', [Tag('genre', 'pop')])
+            op.add_tags('/f2', [Tag('genre', 'pop'), Tag('', 'x')])
+            op.delete_tags('/f2', [Tag('', 'x')], quiet=True)
+    finally:
+        tracer = trace.stop()
+    assert isinstance(get_backend(), MemoryBackend)
+    assert tracer.totals['outer'][0] == 1
+    assert tracer.totals['xattr'][0] == 12
+    assert tracer.counts == {'open': 3, 'listxattr': 3, 'getxattr': 2,
+                             'setxattr': 3, 'removexattr': 1}
+
+    fname = str(tmpdir.join('trace.json'))
+    trace.write_chrome_trace(tracer, fname)
+    with open(fname) as f:
+        events = json.load(f)['traceEvents']
+    assert [e['name'] for e in events if e['ph'] == 'X'].count('xattr') == 12
+    assert events[-1]['args']['setxattr'] == 3
+
+
+def test_report(memory, capsys):
+    trace.start()
+    with trace.span('print'):
+        op.add_tags('/f1', [Tag('genre', 'pop')])
+    trace.report(trace.stop())
+    out, err = capsys.readouterr()
+    lines = err.splitlines()
+    assert lines[0].split() == ['phase', 'count', 'total', 'ms', '%', 'of',
+                                'run']
+    phases = [l.split()[0] for l in lines[1:-3]]
+    assert 'print' in phases and 'xattr' in phases
+    assert lines[-1] == ("system calls: open 1, listxattr 1, getxattr 0, "
+                         "setxattr 1, removexattr 0")
@@ -0,0 +1,72 @@
+#pylint: disable-all
+import pytest
+import os
+
+import xatag.walk as walk
+from xatag.walk import *
+
+
+@pytest.fixture
+def tree(tmpdir):
+    for name in ['a.txt', 'b.bak', 'sub/c.txt', 'sub/deep/d.txt',
+                 'skip/e.txt']:
+        path = tmpdir.join(name)
+        path.dirpath().ensure(dir=True)
+        path.write('')
+    os.symlink(str(tmpdir.join('sub')), str(tmpdir.join('link')))
+    return tmpdir
+
+
+def relative(tmpdir, paths):
+    return [os.path.relpath(p, str(tmpdir)) for p in paths]
+
+
+def test_walk_tree(tree):
+    assert relative(tree, walk_tree(str(tree))) == [
+        'a.txt', 'b.bak', 'skip/e.txt', 'sub/c.txt', 'sub/deep/d.txt']
+    assert relative(tree, walk_tree(str(tree), include=['*.txt'],
+                                    exclude=['skip'])) == [
+        'a.txt', 'sub/c.txt', 'sub/deep/d.txt']
+    assert relative(tree, walk_tree(str(tree), one_file_system=True)) == [
+        'a.txt', 'b.bak', 'skip/e.txt', 'sub/c.txt', 'sub/deep/d.txt']
+
+
+def test_walk_tree_without_scandir(tree, monkeypatch):
+    monkeypatch.setattr(walk, 'scandir', None)
+    assert relative(tree, walk_tree(str(tree), exclude=['*.bak'])) == [
+        'a.txt', 'skip/e.txt', 'sub/c.txt', 'sub/deep/d.txt']
+
+
+def test_walk_paths(tree):
+    paths = [str(tree.join('sub')), str(tree.join('a.txt')), 'missing']
+    assert list(walk_paths(paths)) == paths
+    assert relative(tree, walk_paths(paths, recursive=True))[:-1] == [
+        'sub/c.txt', 'sub/deep/d.txt', 'a.txt']
+    assert list(walk_paths(paths, recursive=True))[-1] == 'missing'
+
+
+def test_split_globs():
+    assert split_globs(None) == []
+    assert split_globs('*.txt,,*.bak') == ['*.txt', '*.bak']
+
+
+def test_read_paths():
+    from StringIO import StringIO
+    assert list(read_paths(StringIO("a\n\nb c\n d"))) == ['a', 'b c', ' d']
+    names = "a\nb\0\0c\0d"
+    assert list(read_paths(StringIO(names), null=True)) == ['a\nb', 'c', 'd']
+    assert list(read_paths(StringIO(names), null=True, size=2)) == \
+        ['a\nb', 'c', 'd']
+
+
+def test_read_paths_from_pipe():
+    r, w = os.pipe()
+    with os.fdopen(r) as stream:
+        paths = read_paths(stream, null=True)
+        os.write(w, "a\0b\0c")
+        # The names that have arrived are yielded without waiting for more.
+        assert [next(paths), next(paths)] == ['a', 'b']
+        os.write(w, "d\0")
+        assert next(paths) == 'cd'
+        os.close(w)
+        assert list(paths) == []
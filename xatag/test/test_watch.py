@@ -0,0 +1,110 @@
+#pylint: disable-all
+import pytest
+import os
+import xattr
+
+import xatag.watch as watch
+from xatag.watch import *
+import xatag.tag_index as tag_index
+import xatag.constants as constants
+
+KEY = 'user.org.xatag.tags.tag'
+
+
+@pytest.fixture
+def tree(tmpdir):
+    top = tmpdir.join('top')
+    top.mkdir()
+    top.join('a.txt').write('')
+    top.mkdir('sub').join('b.txt').write('')
+    return top
+
+
+@pytest.fixture
+def watcher(tree, request, monkeypatch):
+    monkeypatch.setattr(watch, 'DELAY', 0.05)
+    watcher = Watcher([str(tree)])
+    request.addfinalizer(watcher.close)
+    return watcher
+
+
+@pytest.fixture
+def index(tmpdir, request):
+    confdir = tmpdir.join('conf')
+    confdir.mkdir()
+    index = tag_index.open_tag_index(str(confdir), create=True)
+    request.addfinalizer(tag_index.close_tag_indexes)
+    return index
+
+
+def test_attrib(tree, watcher):
+    a = str(tree.join('a.txt'))
+    b = str(tree.join('sub', 'b.txt'))
+    xattr.xattr(b)[KEY] = 'one'
+    xattr.xattr(a)[KEY] = 'two'
+    xattr.xattr(b)[KEY] = 'three'
+    assert watcher.wait(1) == [(a, CHANGED), (b, CHANGED)]
+    assert watcher.wait(0.01) == []
+
+
+def test_moves(tree, watcher):
+    a = str(tree.join('a.txt'))
+    sub = str(tree.join('sub'))
+    os.rename(a, a + '2')
+    os.rename(sub, sub + '2')
+    os.unlink(str(tree.join('sub2', 'b.txt')))
+    tree.join('sub2', 'new').write('')
+    # The directory is read when the move is noticed, after b.txt is gone.
+    assert watcher.wait(1) == [
+        (a, REMOVED), (a + '2', CHANGED), (sub, REMOVED_DIR),
+        (str(tree.join('sub2', 'new')), CHANGED)]
+    tree.join('sub2', 'newer').write('')
+    assert watcher.wait(1) == [(str(tree.join('sub2', 'newer')), CHANGED)]
+
+
+def test_exclude(tree, monkeypatch):
+    monkeypatch.setattr(watch, 'DELAY', 0.05)
+    watcher = Watcher([str(tree)], exclude=['sub'], include=['*.txt'])
+    try:
+        xattr.xattr(str(tree.join('sub', 'b.txt')))[KEY] = 'one'
+        tree.join('c.dat').write('')
+        tree.join('c.txt').write('')
+        assert watcher.wait(1) == [(str(tree.join('c.txt')), CHANGED)]
+    finally:
+        watcher.close()
+
+
+def test_sync_changes(tree, index):
+    a = str(tree.join('a.txt'))
+    b = str(tree.join('sub', 'b.txt'))
+    xattr.xattr(a)[KEY] = 'one'
+    recorded = []
+    sync_changes([(a, CHANGED), (b, CHANGED)], index=index,
+                 record=recorded.append)
+    # b has no tags, so nothing changed
+    assert recorded == [a]
+    assert index.stored_tags(a) == {'tag': ['one']}
+    # unchanged tags aren't recorded again
+    sync_changes([(a, CHANGED)], index=index, record=recorded.append)
+    assert recorded == [a]
+    os.rename(a, b)
+    sync_changes([(a, REMOVED), (b, CHANGED)], index=index,
+                 record=recorded.append)
+    assert recorded == [a, b]
+    assert index.stored_tags(a) is None
+    assert index.stored_tags(b) == {'tag': ['one']}
+    sync_changes([(str(tree.join('sub')), REMOVED_DIR)], index=index)
+    assert index.stored_tags(b) is None
+
+
+def test_sync_changes_without_index(tree):
+    a = str(tree.join('a.txt'))
+    reported = []
+    sync_changes([(a, CHANGED), (a + 'x', CHANGED)],
+                 report=lambda f, t: reported.append((f, t)))
+    assert reported == [(a, {})]
+
+
+def test_same_tags():
+    assert same_tags({'a': ['1', '2']}, {'a': ['2', '1']})
+    assert not same_tags({'a': ['1']}, {'a': ['1'], 'b': ['2']})
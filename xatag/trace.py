@@ -0,0 +1,217 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Timing of the phases of an xatag command, for 'xatag --profile' and the
+# XATAG_TRACE environment variable.
+#
+# The code marks its phases with spans:
+#
+#     with trace.span('print'):
+#         ...
+#
+# Nothing is recorded unless tracing was started with start().  Until then,
+# span() returns one shared object whose __enter__ and __exit__ do nothing,
+# so a span costs a function call and a test.  While tracing, the total time
+# and number of each kind of span are kept, and, if asked for, every span
+# as an event for a Chrome trace file (which Perfetto and chrome://tracing
+# can show).  The xattr backend is also wrapped so that the extended
+# attribute system calls are counted, and their time is a span.
+
+import os
+import sys
+import threading
+import time
+
+from xatag.backends import Backend, get_backend, set_backend
+
+_tracer = None
+
+
+class Tracer(object):
+    """The spans and counts recorded while tracing."""
+    def __init__(self, events=False):
+        self.start = time.time()
+        self.end = None
+        self.totals = {}
+        self.counts = {}
+        self.events = [] if events else None
+        self.lock = threading.Lock()
+
+    def add(self, name, begin, end):
+        with self.lock:
+            total = self.totals.get(name)
+            if total is None:
+                self.totals[name] = [1, end - begin]
+            else:
+                total[0] += 1
+                total[1] += end - begin
+            if self.events is not None:
+                self.events.append((name, begin, end,
+                                    threading.current_thread().ident))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+
+class Span(object):
+    """Time the code in a with statement."""
+    __slots__ = ('tracer', 'name', 'begin')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.add(self.name, self.begin, time.time())
+
+
+class NullSpan(object):
+    """A span for when nothing is being traced."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name):
+    """Return a context manager that records the time spent in it as name."""
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name)
+
+
+def count(name, n=1):
+    """Add n to the count called name."""
+    if _tracer is not None:
+        _tracer.count(name, n)
+
+
+def enabled():
+    return _tracer is not None
+
+
+def start(events=False):
+    """Start tracing.  If events is True, keep each span for a trace file."""
+    global _tracer
+    _tracer = Tracer(events)
+    backend = get_backend()
+    if not isinstance(backend, CountingBackend):
+        set_backend(CountingBackend(backend))
+
+
+def stop():
+    """Stop tracing, and return the Tracer."""
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    backend = get_backend()
+    if isinstance(backend, CountingBackend):
+        set_backend(backend.backend)
+    if tracer is not None:
+        tracer.end = time.time()
+    return tracer
+
+
+class CountingBackend(Backend):
+    """Count the system calls made through another xattr backend."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+
+    def open(self, path, follow_symlinks=True):
+        with span('xattr'):
+            count('open')
+            return self.backend.open(path, follow_symlinks)
+
+    def close(self, f):
+        self.backend.close(f)
+
+    def list(self, f, follow_symlinks=True):
+        with span('xattr'):
+            count('listxattr')
+            return self.backend.list(f, follow_symlinks)
+
+    def get(self, f, name, follow_symlinks=True):
+        with span('xattr'):
+            count('getxattr')
+            return self.backend.get(f, name, follow_symlinks)
+
+    def set(self, f, name, value, follow_symlinks=True):
+        with span('xattr'):
+            count('setxattr')
+            return self.backend.set(f, name, value, follow_symlinks)
+
+    def remove(self, f, name, follow_symlinks=True):
+        with span('xattr'):
+            count('removexattr')
+            return self.backend.remove(f, name, follow_symlinks)
+
+    def get_many(self, f, names, follow_symlinks=True):
+        with span('xattr'):
+            count('getxattr', len(names))
+            return self.backend.get_many(f, names, follow_symlinks)
+
+    def update(self, f, values, removed=(), follow_symlinks=True):
+        with span('xattr'):
+            count('setxattr', len(values))
+            count('removexattr', len(removed))
+            return self.backend.update(f, values, removed, follow_symlinks)
+
+
+SYSCALLS = ['open', 'listxattr', 'getxattr', 'setxattr', 'removexattr']
+
+
+def report(tracer, out=None):
+    """Print a table of the time in each phase, and the system call counts."""
+    out = out or sys.stderr
+    wall = (tracer.end or time.time()) - tracer.start
+    out.write("%-14s %8s %11s %8s\n" % ('phase', 'count', 'total ms',
+                                         '% of run'))
+    for name, (n, seconds) in sorted(tracer.totals.items(),
+                                     key=lambda item: -item[1][1]):
+        out.write("%-14s %8d %11.3f %7.1f%%\n" %
+                  (name, n, 1000 * seconds, 100 * seconds / (wall or 1)))
+    out.write("%-14s %8s %11.3f\n" % ('run', '', 1000 * wall))
+    out.write("(phases include the time of the phases within them)\n")
+    out.write("system calls: " +
+              ', '.join("%s %d" % (name, tracer.counts.get(name, 0))
+                        for name in SYSCALLS) + "\n")
+
+
+def write_chrome_trace(tracer, fname):
+    """Write the spans of tracer to fname in the Chrome trace event format."""
+    import json
+    pid = os.getpid()
+    events = [{'name': name, 'cat': 'xatag', 'ph': 'X', 'pid': pid,
+               'tid': tid, 'ts': 1e6 * (begin - tracer.start),
+               'dur': 1e6 * (end - begin)}
+              for name, begin, end, tid in tracer.events or []]
+    events.append({'name': 'system calls', 'ph': 'C', 'pid': pid,
+                   'ts': 1e6 * ((tracer.end or time.time()) - tracer.start),
+                   'args': dict(tracer.counts)})
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,168 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Directory walking for --recursive and --execute.  Paths are generated
+# lazily, one directory at a time, so that a tree of any size can be streamed
+# through the per-file operations in bounded memory.  scandir() is used when
+# it's available (it is in the standard library from Python 3.5 on, and in
+# the 'scandir' package before that), since it avoids a stat() call for most
+# entries.  It's looked up the first time a directory is listed, because the
+# 'scandir' package is slow to import.
+
+import fnmatch
+import os
+
+from xatag.warn import warn
+
+NOT_LOADED = object()
+scandir = NOT_LOADED
+
+
+def load_scandir():
+    global scandir
+    try:
+        from os import scandir
+    except ImportError:
+        try:
+            from scandir import scandir
+        except ImportError:
+            scandir = None
+
+
+def split_globs(globs):
+    """Split a comma separated string of globs into a list."""
+    if not globs:
+        return []
+    return [g for g in globs.split(',') if g]
+
+
+def matches_any(name, globs):
+    return any(fnmatch.fnmatch(name, g) for g in globs)
+
+
+def _list_dir(path):
+    """Return sorted (name, is_dir, is_file) tuples for the entries in path.
+
+    is_dir is False for symlinks to directories, so that they are not
+    descended into; is_file follows symlinks.
+    """
+    if scandir is NOT_LOADED:
+        load_scandir()
+    entries = []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                is_dir = is_file = False
+            entries.append((entry.name, is_dir, is_file))
+    else:
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            is_dir = os.path.isdir(full) and not os.path.islink(full)
+            entries.append((name, is_dir, not is_dir and os.path.isfile(full)))
+    entries.sort()
+    return entries
+
+
+def walk_tree(root, include=(), exclude=(), one_file_system=False):
+    """Yield the files beneath the directory root, depth first.
+
+    Files are yielded only if their name matches one of the include globs
+    (if any are given) and none of the exclude globs.  Directories matching
+    an exclude glob are not descended into.  If one_file_system is True,
+    directories on a different device than root are skipped.
+    """
+    root_dev = os.stat(root).st_dev if one_file_system else None
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            entries = _list_dir(dirpath)
+        except OSError:
+            warn("cannot read directory: " + dirpath)
+            continue
+        subdirs = []
+        for name, is_dir, is_file in entries:
+            if exclude and matches_any(name, exclude):
+                continue
+            path = os.path.join(dirpath, name)
+            if is_dir:
+                if (root_dev is not None and
+                        os.lstat(path).st_dev != root_dev):
+                    continue
+                subdirs.append(path)
+            elif is_file:
+                if not include or matches_any(name, include):
+                    yield path
+        # Push in reverse so that the directories are visited in order.
+        stack.extend(reversed(subdirs))
+
+
+def read_paths(stream, null=False, size=64 * 1024):
+    """Yield the paths in stream, one per line, or ending with NULs if null.
+
+    The stream is read as the paths are needed, and each path is yielded as
+    soon as it has been read, so that a pipe from find can be of any length
+    and is processed as find goes.  Empty names are skipped.
+    """
+    separator = '\0' if null else '\n'
+    rest = ''
+    for data in _read_available(stream, size):
+        paths = (rest + data).split(separator)
+        rest = paths.pop()
+        for path in paths:
+            if path:
+                yield path
+    if rest:
+        yield rest
+
+
+def _read_available(stream, size):
+    """Yield what can be read from stream, up to size bytes at a time.
+
+    A file's read() waits until it has size bytes, so files with a
+    descriptor are read with os.read(), which returns whatever has arrived.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, IOError, ValueError):
+        fd = None
+    while True:
+        if fd is None:
+            data = stream.read(size)
+        else:
+            data = os.read(fd, size)
+        if not data:
+            return
+        yield data
+
+
+def walk_paths(paths, recursive=False, include=(), exclude=(),
+               one_file_system=False):
+    """Yield each of paths, replacing directories by the files beneath them.
+
+    Unless recursive is True, paths are passed through unchanged.  Paths
+    that are not directories are always passed through, even if they don't
+    exist, so that the caller can report them.
+    """
+    for path in paths:
+        if recursive and os.path.isdir(path):
+            for fname in walk_tree(path, include, exclude, one_file_system):
+                yield fname
+        else:
+            yield path
@@ -14,7 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import threading
 import warnings
+from contextlib import contextmanager
 
 
 def xatag_formatwarning(msg, *a):
@@ -25,6 +27,29 @@ def xatag_formatwarning(msg, *a):
 warnings.formatwarning = xatag_formatwarning
 
 
+_collector = threading.local()
+
+
+@contextmanager
+def collect_warnings():
+    """Collect the messages passed to warn() in this thread into a list.
+
+    This is used when files are processed in worker threads, so that the
+    warnings for each file can be printed together by the main thread.
+    """
+    collected = []
+    previous = getattr(_collector, 'messages', None)
+    _collector.messages = collected
+    try:
+        yield collected
+    finally:
+        _collector.messages = previous
+
+
 def warn(message):
     """Print a warning to stderr."""
-    warnings.warn(message)
+    collected = getattr(_collector, 'messages', None)
+    if collected is not None:
+        collected.append(message)
+    else:
+        warnings.warn(message)
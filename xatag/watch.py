@@ -0,0 +1,317 @@
+# Copyright (c) 2013 Don March <don@ohspite.net>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# 'xatag --watch' notices tags that are changed by other programs, and files
+# that are moved or deleted, using inotify (Linux only).  Every directory
+# beneath the watched ones gets an inotify watch for changed attributes and
+# for entries that are created, deleted or moved.  Events come in bursts (a
+# copy with 'rsync -X' changes many files, and setting each xattr is an
+# event), so they are collected until things are quiet for a moment, and
+# each path is handled once per batch.  Only the xatag xattrs of the files
+# in a batch are read.
+#
+# The inotify system calls are made through ctypes, since the standard
+# library doesn't wrap them.
+
+import collections
+import errno
+import os
+import select
+import stat
+import struct
+import time
+
+from xatag.attributes import read_tag_dict
+import xatag.walk as walk
+from xatag.warn import warn
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+EVENT = struct.Struct('iIII')
+
+# After the first event of a batch, wait for more until there have been none
+# for DELAY seconds, but not for longer than MAX_DELAY in all.
+DELAY = 0.2
+MAX_DELAY = 2.0
+
+# What happened to a path in a batch.
+CHANGED, REMOVED, REMOVED_DIR = 'changed', 'removed', 'removed dir'
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                            use_errno=True)
+    return _libc
+
+
+def _error():
+    import ctypes
+    e = ctypes.get_errno()
+    return OSError(e, os.strerror(e))
+
+
+class Inotify(object):
+    """An inotify instance."""
+    def __init__(self):
+        self.fd = libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise _error()
+
+    def add_watch(self, path, mask):
+        wd = libc().inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise _error()
+        return wd
+
+    def rm_watch(self, wd):
+        libc().inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """Return a list of (wd, mask, cookie, name) for the waiting events.
+
+        Wait up to timeout seconds (forever if None) for there to be any.
+        """
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, size = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos + size].rstrip('\0')
+            pos += size
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+    """Watch directory trees for changes that could affect tags.
+
+    Files whose names don't match include (if given) are ignored, as are
+    files and directories matching exclude.  If one_file_system is True,
+    directories on other devices than the roots aren't watched.
+    """
+    def __init__(self, roots, include=(), exclude=(), one_file_system=False):
+        self.inotify = Inotify()
+        self.include = include
+        self.exclude = exclude
+        self.one_file_system = one_file_system
+        self.dirs = {}
+        self.wds = {}
+        self.roots = [os.path.abspath(r) for r in roots]
+        for root in self.roots:
+            self.add_tree(root, os.stat(root).st_dev)
+
+    def close(self):
+        self.inotify.close()
+
+    def wanted(self, name):
+        if self.exclude and walk.matches_any(name, self.exclude):
+            return False
+        return not self.include or walk.matches_any(name, self.include)
+
+    def add_tree(self, root, device=None):
+        """Watch root and the directories beneath it.
+
+        Return the files beneath root.
+        """
+        files = []
+        stack = [root]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                wd = self.inotify.add_watch(dirpath, WATCH_MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    warn("too many inotify watches; raise the limit in "
+                         "/proc/sys/fs/inotify/max_user_watches")
+                elif e.errno != errno.ENOENT:
+                    warn("cannot watch directory: " + dirpath)
+                continue
+            self.dirs[wd] = dirpath
+            self.wds[dirpath] = wd
+            try:
+                entries = walk._list_dir(dirpath)
+            except OSError:
+                warn("cannot read directory: " + dirpath)
+                continue
+            for name, is_dir, is_file in reversed(entries):
+                path = os.path.join(dirpath, name)
+                if is_dir:
+                    if self.exclude and walk.matches_any(name, self.exclude):
+                        continue
+                    if (self.one_file_system and device is not None and
+                            os.lstat(path).st_dev != device):
+                        continue
+                    stack.append(path)
+                elif is_file and self.wanted(name):
+                    files.append(path)
+        files.reverse()
+        return files
+
+    def forget_tree(self, root):
+        """Stop watching root and the directories beneath it."""
+        prefix = root.rstrip(os.sep) + os.sep
+        for dirpath in [d for d in self.wds
+                        if d == root or d.startswith(prefix)]:
+            wd = self.wds.pop(dirpath)
+            self.dirs.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def wait(self, timeout=None):
+        """Wait for a batch of changes.
+
+        Wait up to timeout seconds (forever if None) for the first event.
+        Return a list of (path, what) in the order that each path last
+        changed, where what is CHANGED, REMOVED, or REMOVED_DIR.  A file
+        that is moved is REMOVED at its old path and CHANGED at its new one.
+        """
+        changes = collections.OrderedDict()
+        events = self.inotify.read(timeout)
+        start = time.time()
+        while events:
+            for event in events:
+                self.handle_event(event, changes)
+            remaining = start + MAX_DELAY - time.time()
+            if remaining <= 0:
+                break
+            events = self.inotify.read(min(DELAY, remaining))
+        return changes.items()
+
+    def handle_event(self, event, changes):
+        wd, mask, cookie, name = event
+
+        def mark(path, what):
+            changes.pop(path, None)
+            changes[path] = what
+
+        if mask & IN_Q_OVERFLOW:
+            warn("too many changes at once; rereading all watched files")
+            for root in self.roots:
+                for fname in walk.walk_tree(root, self.include, self.exclude,
+                                            self.one_file_system):
+                    mark(fname, CHANGED)
+            return
+        if mask & IN_IGNORED:
+            dirpath = self.dirs.pop(wd, None)
+            if self.wds.get(dirpath) == wd:
+                del self.wds[dirpath]
+            return
+        dirpath = self.dirs.get(wd)
+        if dirpath is None or not name:
+            return
+        path = os.path.join(dirpath, name)
+        if mask & IN_ISDIR:
+            if self.exclude and walk.matches_any(name, self.exclude):
+                return
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.forget_tree(path)
+                mark(path, REMOVED_DIR)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                device = None
+                if self.one_file_system:
+                    device = os.lstat(dirpath).st_dev
+                for fname in self.add_tree(path, device):
+                    mark(fname, CHANGED)
+        elif self.wanted(name):
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                mark(path, REMOVED)
+            if mask & (IN_CREATE | IN_MOVED_TO | IN_ATTRIB):
+                mark(path, CHANGED)
+
+
+def same_tags(tag_dict1, tag_dict2):
+    """Return True if the tag dicts have the same tags, in any order."""
+    def tag_set(tag_dict):
+        return set((k, v) for k, vlist in tag_dict.items() for v in vlist)
+    return tag_set(tag_dict1) == tag_set(tag_dict2)
+
+
+def sync_changes(changes, index=None, record=None, report=None,
+                 follow_symlinks=True):
+    """Bring the tag index and Recoll up to date with a batch from wait().
+
+    For each changed file, the xatag xattrs are read.  If there is a tag
+    index, it is updated, and the file counts as changed only if its tags
+    are different from what was stored; without an index, every changed
+    file counts.  record (like RecollUpdate.add) is called with each changed
+    file, and report with each changed file and its tag dict.
+    """
+    for path, what in changes:
+        if what == REMOVED_DIR:
+            if index is not None:
+                index.remove_tree(path)
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if what == REMOVED or st is None or not stat.S_ISREG(st.st_mode):
+            if index is not None:
+                index.remove(path)
+            continue
+        try:
+            tag_dict = read_tag_dict(path, follow_symlinks)
+        except (IOError, KeyError):
+            warn("could not read extended attributes: " + path)
+            continue
+        if index is not None:
+            old = index.stored_tags(path)
+            if tag_dict:
+                index.update(path, tag_dict, st)
+            else:
+                index.remove(path)
+            if same_tags(old or {}, tag_dict):
+                continue
+        if record:
+            record(path)
+        if report:
+            report(path, tag_dict)